@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChangeCursor, Goods, StockAlert
+
+# Low-stock alerting. Which products are low right now is answered by the goods_low_stock_idx
+# partial index (see low_stock()); evaluate() keeps StockAlert rows for the moments a product
+# crosses its reorder point, looking only at the products written since its previous run.
+
+alert_logger = logging.getLogger('supply_chain_app.stock_alerts')
+
+# ChangeCursor row tracking how far evaluate() has read the goods table
+CURSOR_NAME = 'stock_alerts'
+
+# Products evaluated per transaction
+ALERT_BATCH_SIZE = 1000
+
+# Writes younger than this are left for the next run. updated_at is stamped before a transaction
+# commits, so a slow transaction can still commit a timestamp the cursor has already passed.
+ALERT_SETTLE = timedelta(seconds=5)
+
+# Where a new cursor starts: before any product, so the first run sees them all
+CURSOR_START = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Rows shown in the dashboard's low-stock panel
+LOW_STOCK_PANEL_SIZE = 10
+
+
+# The user's products at or below their reorder point, lowest stock first. The filter is the
+# condition of goods_low_stock_idx, so only that (small) index is read.
+def low_stock(user):
+    return Goods.objects.filter(user=user, quantity__lte=F('reorder_point')).order_by('quantity', 'id')
+
+
+class AlertRun:
+    # Outcome of one evaluate() call
+    def __init__(self):
+        self.checked = 0
+        self.opened = 0
+        self.resolved = 0
+
+
+# Products written after the cursor and no later than `until`, in (updated_at, id) order; a range
+# scan of goods_updated_id_idx. Hidden products are included so their alerts stay accurate.
+def _changed(cursor, until, batch_size):
+    return list(
+        Goods.all_objects.filter(updated_at__gte=cursor.position, updated_at__lte=until)
+        .exclude(updated_at=cursor.position, id__lte=cursor.last_id)
+        .order_by('updated_at', 'id')
+        .values_list('id', 'user_id', 'quantity', 'reorder_point', 'updated_at')[:batch_size]
+    )
+
+
+# Open alerts for the changed products that are low and have none, resolve the open alerts of
+# those that are not, and move the cursor past them; all in one transaction
+def _evaluate_batch(cursor, rows, run):
+    now = timezone.now()
+    ids = [pk for pk, *_ in rows]
+    with transaction.atomic():
+        open_ids = set(
+            StockAlert.objects.filter(goods_id__in=ids, resolved_at__isnull=True).values_list('goods_id', flat=True)
+        )
+        low = {
+            pk: (user_id, quantity, reorder_point)
+            for pk, user_id, quantity, reorder_point, _ in rows
+            if reorder_point is not None and quantity <= reorder_point
+        }
+        new = [
+            StockAlert(goods_id=pk, user_id=user_id, quantity=quantity, reorder_point=reorder_point, opened_at=now)
+            for pk, (user_id, quantity, reorder_point) in low.items()
+            if pk not in open_ids
+        ]
+        # A concurrent run may have opened some of them already
+        StockAlert.objects.bulk_create(new, ignore_conflicts=True)
+        run.resolved += StockAlert.objects.filter(
+            goods_id__in=open_ids - low.keys(), resolved_at__isnull=True,
+        ).update(resolved_at=now)
+        last_id, *_, position = rows[-1]
+        ChangeCursor.objects.filter(pk=cursor.pk).update(position=position, last_id=last_id, updated_at=now)
+    cursor.position, cursor.last_id = position, last_id
+    run.checked += len(rows)
+    run.opened += len(new)
+    for alert in new:
+        alert_logger.warning(
+            "Product %s of user %s is low: %s in stock, reorder point %s",
+            alert.goods_id, alert.user_id, alert.quantity, alert.reorder_point,
+        )
+
+
+# Bring the alerts up to date with every product written since the last run, batch_size products
+# per transaction. Products nobody touched are never read, so a run costs what changed rather than
+# the size of the catalogue. Returns an AlertRun.
+def evaluate(batch_size=ALERT_BATCH_SIZE, until=None):
+    until = until or timezone.now() - ALERT_SETTLE
+    cursor, _ = ChangeCursor.objects.get_or_create(name=CURSOR_NAME, defaults={'position': CURSOR_START})
+    run = AlertRun()
+    while True:
+        rows = _changed(cursor, until, batch_size)
+        if rows:
+            _evaluate_batch(cursor, rows, run)
+        if len(rows) < batch_size:
+            return run
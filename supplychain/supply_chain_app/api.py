@@ -0,0 +1,582 @@
+import base64
+import binascii
+import json
+from datetime import datetime, time
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import aauthenticate, authenticate
+from django.db import IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+
+from . import barcodes, choices, conditional, decoding, deletion, fragments, ledger, rollups, stock
+from .receiving import SCAN_BATCH_LIMIT, ScanBatch
+from .barcodes import lookup_cache
+from .forms import CategoryForm, CustomerForm, GoodsApiForm
+from .models import Category, Customer, Goods, StockMovement
+
+# Default and largest number of records returned per list page
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Largest number of records accepted by one batch call (create + update + delete)
+BATCH_LIMIT = 1000
+
+# Images accepted by one decode call (decoding.DECODE_MAX_IMAGE_SIZE limits each one)
+DECODE_MAX_IMAGES = 32
+
+
+class Resource:
+    # One model exposed through the API.
+    # fields maps public names to ORM lookups (a "__" lookup is fetched through a JOIN);
+    # relations maps writable foreign keys to the model whose user-owned ids they accept.
+    def __init__(self, model, form_class, fields, relations=None):
+        self.model = model
+        self.form_class = form_class
+        self.fields = fields
+        self.relations = relations or {}
+
+    def queryset(self, user):
+        return self.model.objects.filter(user=user)
+
+    # Public field names requested through ?fields=a,b (all of them by default)
+    def select(self, requested):
+        if not requested:
+            return list(self.fields)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(400, {'fields': f"Unknown field(s): {', '.join(unknown)}"})
+        if 'id' not in names:
+            names.insert(0, 'id')
+        return names
+
+    # Fetch records as dicts with only the selected columns, in one query
+    def serialize(self, queryset, names):
+        lookups = [self.fields[name] for name in names]
+        return [
+            {name: row[lookup] for name, lookup in zip(names, lookups)}
+            for row in queryset.values(*lookups)
+        ]
+
+
+class ApiError(Exception):
+    def __init__(self, status, errors):
+        super().__init__(errors)
+        self.status = status
+        self.errors = errors
+
+
+RESOURCES = {
+    'goods': Resource(
+        Goods, GoodsApiForm,
+        fields={
+            'id': 'id',
+            'name': 'name',
+            'quantity': 'quantity',
+            'price': 'price',
+            'description': 'description',
+            'barcode': 'barcode',
+            'date_added': 'date_added',
+            'category': 'category_id',
+            'category_name': 'category__name',
+            'customer': 'customer_id',
+            'customer_name': 'customer__name',
+            'version': 'version',
+            'reorder_point': 'reorder_point',
+            'reorder_qty': 'reorder_qty',
+        },
+        relations={'category': Category, 'customer': Customer},
+    ),
+    'categories': Resource(Category, CategoryForm, fields={'id': 'id', 'name': 'name'}),
+    'customers': Resource(
+        Customer, CustomerForm,
+        fields={
+            'id': 'id',
+            'name': 'name',
+            'email': 'email',
+            'phone': 'phone',
+            'address': 'address',
+            'date_added': 'date_added',
+        },
+    ),
+}
+
+
+# Session users (browser, with CSRF) or HTTP Basic credentials (scanners, ERP) may call the API.
+# Works for async views too, authenticating through the async ORM.
+def api_auth(view):
+    if iscoroutinefunction(view):
+        return _async_api_auth(view)
+
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        session_user = request.user.is_authenticated
+        user = request.user if session_user else _basic_auth_user(request)
+        if user is None:
+            return _authentication_required()
+        if session_user and _csrf_rejected(request):
+            return JsonResponse({'errors': 'CSRF check failed'}, status=403)
+
+        request.user = user
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'errors': exc.errors}, status=exc.status)
+    return wrapper
+
+
+def _async_api_auth(view):
+    @csrf_exempt
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        session_user = user.is_authenticated
+        if not session_user:
+            user = await _abasic_auth_user(request)
+        if user is None:
+            return _authentication_required()
+        if session_user and _csrf_rejected(request):
+            return JsonResponse({'errors': 'CSRF check failed'}, status=403)
+
+        request.user = user
+        try:
+            return await view(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'errors': exc.errors}, status=exc.status)
+    return wrapper
+
+
+def _authentication_required():
+    response = JsonResponse({'errors': 'Authentication required'}, status=401)
+    response['WWW-Authenticate'] = 'Basic realm="api"'
+    return response
+
+
+# Cookie-authenticated writes still need the CSRF token
+def _csrf_rejected(request):
+    if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return False
+    return CsrfViewMiddleware(lambda req: None).process_view(request, None, (), {}) is not None
+
+
+# Resource endpoints: the <resource> part of the URL is resolved to its Resource
+def api_view(view):
+    @api_auth
+    def wrapper(request, resource, *args, **kwargs):
+        if resource not in RESOURCES:
+            raise ApiError(404, 'Unknown resource')
+        return view(request, RESOURCES[resource], *args, **kwargs)
+    return wrapper
+
+
+# (username, password) from an HTTP Basic Authorization header, or None
+def _basic_credentials(request):
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not header.startswith('Basic '):
+        return None
+    try:
+        username, _, password = base64.b64decode(header[6:]).decode().partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return username, password
+
+
+def _basic_auth_user(request):
+    credentials = _basic_credentials(request)
+    if credentials is None:
+        return None
+    return authenticate(request, username=credentials[0], password=credentials[1])
+
+
+async def _abasic_auth_user(request):
+    credentials = _basic_credentials(request)
+    if credentials is None:
+        return None
+    return await aauthenticate(request, username=credentials[0], password=credentials[1])
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'null')
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError(400, 'Request body must be JSON')
+
+
+# A record id from a JSON body: an integer, and not true/false (which Python would take as 1 and 0)
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, {'limit': 'Must be a number'})
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+
+class Writer:
+    # Validates and applies create/update/delete records for one user and resource.
+    # Foreign keys are checked against id sets loaded once, so records cost no per-row lookups.
+    def __init__(self, resource, user):
+        self.resource = resource
+        self.user = user
+        self.related_ids = {
+            name: set(model.objects.filter(user=user).values_list('id', flat=True))
+            for name, model in resource.relations.items()
+        }
+
+    # Validate one record; returns (instance, errors). instance is unsaved with user set.
+    def build(self, data, instance=None):
+        if not isinstance(data, dict):
+            return None, {'__all__': 'Each record must be an object'}
+        if instance is not None:
+            # Partial update: unspecified fields keep their current values
+            current = model_to_dict(instance, fields=self.resource.form_class._meta.fields)
+            data = {**current, **data}
+        form = self.resource.form_class(data, instance=instance)
+        errors = {} if form.is_valid() else {field: list(messages) for field, messages in form.errors.items()}
+
+        related = {}
+        for name in self.resource.relations:
+            if name not in data:
+                continue
+            value = data[name]
+            if value in (None, ''):
+                related[name] = None
+            elif _is_id(value) and value in self.related_ids[name]:
+                related[name] = value
+            else:
+                errors[name] = [f"Unknown {name} id {value!r}"]
+        if errors:
+            return None, errors
+
+        obj = form.save(commit=False)
+        obj.user = self.user
+        for name, value in related.items():
+            setattr(obj, f'{name}_id', value)
+        return obj, {}
+
+    def create(self, records):
+        objs, errors = [], []
+        for index, data in enumerate(records):
+            obj, record_errors = self.build(data)
+            if record_errors:
+                errors.append({'index': index, 'errors': record_errors})
+            objs.append(obj)
+        return objs, errors
+
+    def update(self, records):
+        ids = [data.get('id') for data in records if isinstance(data, dict)]
+        existing = self.resource.queryset(self.user).in_bulk([pk for pk in ids if _is_id(pk)])
+        objs, errors = [], []
+        for index, data in enumerate(records):
+            pk = data.get('id') if isinstance(data, dict) else None
+            if not _is_id(pk):
+                errors.append({'index': index, 'errors': {'id': 'Must be an integer'}})
+                continue
+            instance = existing.get(pk)
+            if instance is None:
+                errors.append({'index': index, 'errors': {'id': 'Not found'}})
+                continue
+            obj, record_errors = self.build({k: v for k, v in data.items() if k != 'id'}, instance)
+            if record_errors:
+                errors.append({'index': index, 'errors': record_errors})
+            objs.append(obj)
+        return objs, errors
+
+
+# GET: one page of records (?after=<id>&limit=&fields=). POST: create one record.
+@api_view
+@conditional.api
+def collection(request, resource):
+    if request.method == 'POST':
+        writer = Writer(resource, request.user)
+        obj, errors = writer.build(_json_body(request))
+        if errors:
+            raise ApiError(400, errors)
+        try:
+            obj.save()
+        except IntegrityError:
+            raise ApiError(409, 'Conflicts with an existing record (duplicate barcode?)')
+        names = list(resource.fields)
+        return JsonResponse(resource.serialize(resource.queryset(request.user).filter(pk=obj.pk), names)[0], status=201)
+
+    if request.method != 'GET':
+        return JsonResponse({'errors': 'Method not allowed'}, status=405)
+
+    names = resource.select(request.GET.get('fields'))
+    limit = _limit(request)
+    queryset = resource.queryset(request.user).order_by('id')
+    after = request.GET.get('after')
+    if after:
+        try:
+            queryset = queryset.filter(id__gt=int(after))
+        except ValueError:
+            raise ApiError(400, {'after': 'Must be a record id'})
+
+    # Keyset pagination: one extra row tells whether there is a next page
+    results = resource.serialize(queryset[:limit + 1], names)
+    has_next = len(results) > limit
+    results = results[:limit]
+    return JsonResponse({
+        'results': results,
+        'next': results[-1]['id'] if has_next else None,
+    })
+
+
+# GET / PATCH / DELETE a single record
+@api_view
+@conditional.api
+def item(request, resource, pk):
+    queryset = resource.queryset(request.user)
+    instance = queryset.filter(pk=pk).first()
+    if instance is None:
+        raise ApiError(404, 'Not found')
+
+    if request.method == 'GET':
+        names = resource.select(request.GET.get('fields'))
+        return JsonResponse(resource.serialize(queryset.filter(pk=pk), names)[0])
+
+    if request.method in ('PATCH', 'PUT'):
+        data = _json_body(request)
+        # Goods edits that send the version they were based on are refused if it is out of date
+        expected = data.pop('version', None) if isinstance(data, dict) and resource.model is Goods else None
+        if expected is not None and (not isinstance(expected, int) or isinstance(expected, bool)):
+            raise ApiError(400, {'version': 'Must be a whole number'})
+        obj, errors = Writer(resource, request.user).build(data, instance)
+        if errors:
+            raise ApiError(400, errors)
+        try:
+            if expected is None:
+                obj.save()
+            else:
+                stock.save_if_current(obj, expected)
+        except stock.StaleVersion:
+            raise ApiError(409, 'The record was changed by someone else; fetch it again')
+        except IntegrityError:
+            raise ApiError(409, 'Conflicts with an existing record (duplicate barcode?)')
+        return JsonResponse(resource.serialize(queryset.filter(pk=pk), list(resource.fields))[0])
+
+    if request.method == 'DELETE':
+        deletion.delete(instance)
+        return HttpResponse(status=204)
+
+    return JsonResponse({'errors': 'Method not allowed'}, status=405)
+
+
+# POST {"create": [...], "update": [{"id": ..}, ...], "delete": [ids]} applied in one transaction.
+# Any invalid record rejects the whole batch with per-record errors.
+@api_view
+def batch(request, resource):
+    if request.method != 'POST':
+        return JsonResponse({'errors': 'Method not allowed'}, status=405)
+
+    body = _json_body(request)
+    if not isinstance(body, dict):
+        raise ApiError(400, 'Body must be an object with create, update and/or delete lists')
+    to_create = body.get('create') or []
+    to_update = body.get('update') or []
+    to_delete = body.get('delete') or []
+    if not all(isinstance(part, list) for part in (to_create, to_update, to_delete)):
+        raise ApiError(400, 'create, update and delete must be lists')
+    if len(to_create) + len(to_update) + len(to_delete) > BATCH_LIMIT:
+        raise ApiError(413, f'At most {BATCH_LIMIT} records per batch')
+
+    writer = Writer(resource, request.user)
+    created, create_errors = writer.create(to_create)
+    updated, update_errors = writer.update(to_update)
+    if create_errors or update_errors:
+        raise ApiError(400, {'create': create_errors, 'update': update_errors})
+
+    delete_ids = [pk for pk in to_delete if _is_id(pk)]
+    try:
+        with transaction.atomic(), rollups.batched() as changes:
+            # New rows go in with one bulk insert; bulk_create skips model signals,
+            # so the rollups, stock ledger and barcode cache are brought up to date by hand
+            resource.model.objects.bulk_create(created)
+            if resource.model is Goods:
+                for obj in created:
+                    changes.add(obj.rollup_state())
+                ledger.record_many(((obj.pk, obj.quantity) for obj in created), StockMovement.RECEIPT)
+                lookup_cache.invalidate_user(request.user.pk)
+            elif created:
+                choices.invalidate_user(request.user.pk)
+            if created:
+                fragments.invalidate_user(request.user.pk)
+            for obj in updated:
+                obj.save()
+            doomed = resource.queryset(request.user).filter(pk__in=delete_ids)
+            if resource.model in deletion.OWNERS:
+                deleted = deletion.soft_delete(doomed)
+            else:
+                deleted = doomed.delete()[1].get(resource.model._meta.label, 0)
+    except IntegrityError:
+        raise ApiError(409, 'Batch conflicts with existing records (duplicate barcode?)')
+
+    ids = [obj.pk for obj in created]
+    return JsonResponse({
+        'created': resource.serialize(
+            resource.queryset(request.user).filter(pk__in=ids).order_by('id'), list(resource.fields),
+        ),
+        'updated': len(updated),
+        'deleted': deleted,
+    })
+
+
+# Read an ISO date or datetime query parameter (dates mean midnight, naive times the current zone)
+def _moment(request, name):
+    text = request.GET.get(name, '')
+    try:
+        moment = parse_datetime(text) or datetime.combine(parse_date(text), time.min)
+    except (TypeError, ValueError):
+        raise ApiError(400, {name: 'Must be an ISO date or datetime'})
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def _movement(entry):
+    return {**entry, 'at': entry['at'].isoformat()}
+
+
+# GET: current stock, or ?at=<datetime> for the stock at that moment, or ?from=..&to=.. for the
+# opening and closing stock of a period with every movement in between.
+# POST {"delta": n, "allow_negative": true, "kind": "receipt"} to add n units of a product (remove
+# them when n is negative) in one atomic UPDATE, safe against other stations adjusting the same
+# product. With "allow_negative": false a removal larger than the stock is refused with 409 and
+# changes nothing. kind (receipt, issue or adjustment) defaults to receipt or issue by sign.
+@api_auth
+@conditional.api
+def goods_stock(request, pk):
+    if request.method == 'GET':
+        product = Goods.objects.filter(pk=pk, user=request.user).first()
+        if product is None:
+            raise ApiError(404, 'Not found')
+        if 'from' in request.GET or 'to' in request.GET:
+            start, end = _moment(request, 'from'), _moment(request, 'to')
+            if end < start:
+                raise ApiError(400, {'to': 'Must not be before from'})
+            opening, entries, closing = ledger.history(product, start, end)
+            return JsonResponse({
+                'id': pk, 'from': start.isoformat(), 'to': end.isoformat(),
+                'opening': opening, 'closing': closing, 'movements': [_movement(entry) for entry in entries],
+            })
+        if 'at' in request.GET:
+            at = _moment(request, 'at')
+            return JsonResponse({'id': pk, 'at': at.isoformat(), 'quantity': ledger.stock_at(product, at)})
+        return JsonResponse({'id': pk, 'quantity': product.quantity, 'version': product.version})
+
+    if request.method != 'POST':
+        return JsonResponse({'errors': 'Method not allowed'}, status=405)
+
+    body = _json_body(request)
+    if not isinstance(body, dict):
+        raise ApiError(400, 'Body must be an object with a delta')
+    delta = body.get('delta')
+    if not isinstance(delta, int) or isinstance(delta, bool):
+        raise ApiError(400, {'delta': 'Must be a whole number'})
+    allow_negative = body.get('allow_negative', True)
+    if not isinstance(allow_negative, bool):
+        raise ApiError(400, {'allow_negative': 'Must be true or false'})
+    kind = body.get('kind')
+    if kind is not None and kind not in dict(StockMovement.KIND_CHOICES):
+        raise ApiError(400, {'kind': f"Must be one of {', '.join(dict(StockMovement.KIND_CHOICES))}"})
+
+    try:
+        quantity, version = stock.adjust(request.user, pk, delta, allow_negative=allow_negative, kind=kind)
+    except Goods.DoesNotExist:
+        raise ApiError(404, 'Not found')
+    except stock.InsufficientStock as exc:
+        raise ApiError(409, str(exc))
+    return JsonResponse({'id': pk, 'quantity': quantity, 'version': version})
+
+
+# POST {"scans": [{"barcode": .., "quantity": n}, ...]} from a receiving dock. Known barcodes are
+# incremented atomically; unknown ones are created when the scan carries a name (plus optional
+# price, description, category and customer). Every scan gets a result, in the order sent.
+@api_auth
+def scans(request):
+    if request.method != 'POST':
+        return JsonResponse({'errors': 'Method not allowed'}, status=405)
+
+    body = _json_body(request)
+    items = body.get('scans') if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        raise ApiError(400, 'Body must be an object with a scans list')
+    if len(items) > SCAN_BATCH_LIMIT:
+        raise ApiError(413, f'At most {SCAN_BATCH_LIMIT} scans per batch')
+
+    results = [result.as_dict() for result in ScanBatch(request.user).apply(items)]
+    return JsonResponse({
+        'results': results,
+        'applied': sum(result['status'] != 'error' for result in results),
+        'failed': sum(result['status'] == 'error' for result in results),
+    })
+
+
+# POST one or more images as multipart "image" fields (camera frames as PGM, or photos).
+# Returns the barcodes read from each image and the stocked product they identify.
+@api_auth
+def decode_barcodes(request):
+    if request.method != 'POST':
+        return JsonResponse({'errors': 'Method not allowed'}, status=405)
+
+    uploads = request.FILES.getlist('image')
+    if not uploads:
+        raise ApiError(400, {'image': 'Upload one or more images'})
+    if len(uploads) > DECODE_MAX_IMAGES:
+        raise ApiError(413, f'At most {DECODE_MAX_IMAGES} images per call')
+    if any(upload.size > decoding.DECODE_MAX_IMAGE_SIZE for upload in uploads):
+        raise ApiError(413, f'Images may be at most {decoding.DECODE_MAX_IMAGE_SIZE // (1024 * 1024)} MB')
+
+    try:
+        # Several images are decoded in parallel by the worker processes
+        decoded = decoding.decode_images([upload.read() for upload in uploads])
+    except ValueError as exc:
+        raise ApiError(503, str(exc))
+
+    # Too many pixels is refused like too many bytes; other unreadable images are reported per image
+    for upload, (_, error) in zip(uploads, decoded):
+        if error == decoding.TOO_LARGE_MESSAGE:
+            raise ApiError(413, f'{upload.name}: {error}')
+
+    results = []
+    for upload, (found, error) in zip(uploads, decoded):
+        result = {
+            'name': upload.name,
+            'barcodes': found,
+            'product': _product(barcodes.lookup_decoded(request.user, found)),
+        }
+        if error:
+            result['errors'] = error
+        results.append(result)
+    return JsonResponse({'results': results})
+
+
+# GET the stocked product for a barcode (404 if there is none). An async view: under ASGI, scanner
+# clients can keep many lookups in flight without each one holding a worker thread.
+@api_auth
+async def barcode_lookup(request, barcode):
+    if request.method != 'GET':
+        return JsonResponse({'errors': 'Method not allowed'}, status=405)
+    product = await barcodes.alookup(request.user, barcode)
+    if product is None:
+        raise ApiError(404, 'Not found')
+    return JsonResponse(_product(product))
+
+
+def _product(product):
+    if product is None:
+        return None
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'barcode': product.barcode,
+        'quantity': product.quantity,
+        'price': str(product.price),
+        'description': product.description,
+        'category_name': product.category.name if product.category_id else None,
+    }
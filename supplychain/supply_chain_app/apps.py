@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class SupplyChainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'supply_chain_app'
+
+    def ready(self):
+        # Register model signal handlers (cache invalidation)
+        from . import signals  # noqa: F401
+        # Register the background job tasks
+        from . import tasks  # noqa: F401
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .models import Goods, PLACEHOLDER_BARCODE
+
+# Barcodes remembered per user before the least recently scanned one is dropped
+CACHE_SIZE_PER_USER = 1024
+
+# Users kept in the cache before the least recently active one is dropped
+CACHE_MAX_USERS = 256
+
+# Seconds an entry may be served; bounds staleness from writes made in other processes
+CACHE_TTL = 30.0
+
+# Marks a remembered "no such product" answer
+_MISSING = object()
+
+
+class BarcodeLookupCache:
+    # Per-user LRU of barcode -> product, shared by every thread in the process
+    def __init__(self, maxsize=CACHE_SIZE_PER_USER, max_users=CACHE_MAX_USERS, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns (hit, value); value is None for a remembered miss
+    def get(self, user_id, barcode):
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                return False, None
+            entry = entries.get(barcode)
+            if entry is None:
+                return False, None
+            value, expires = entry
+            if expires < time.monotonic():
+                del entries[barcode]
+                return False, None
+            entries.move_to_end(barcode)
+            self._users.move_to_end(user_id)
+            return True, (None if value is _MISSING else value)
+
+    def put(self, user_id, barcode, value):
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                entries = self._users[user_id] = OrderedDict()
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            entries[barcode] = (_MISSING if value is None else value, time.monotonic() + self.ttl)
+            entries.move_to_end(barcode)
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+
+    # Forget everything cached for one user (called from the Goods/Category signals)
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+lookup_cache = BarcodeLookupCache()
+
+
+# True for barcodes that identify a single product (not blank, not the placeholder)
+def is_real_barcode(barcode):
+    return bool(barcode) and barcode != PLACEHOLDER_BARCODE
+
+
+# Product for a scanned barcode, or None. Repeat scans are answered from the in-process cache;
+# the returned instance is shared between requests and must be treated as read-only.
+def lookup(user, barcode, use_cache=True):
+    barcode = (barcode or '').strip()
+    if not is_real_barcode(barcode):
+        return None
+
+    if use_cache:
+        hit, product = lookup_cache.get(user.pk, barcode)
+        if hit:
+            return product
+
+    # The (user, barcode) index plus the uniqueness constraint make this a single-row seek
+    product = (
+        Goods.objects.select_related('category')
+        .filter(user=user, barcode=barcode)
+        .first()
+    )
+    if use_cache:
+        lookup_cache.put(user.pk, barcode, product)
+    return product
+
+
+# lookup() for async views: cache hits are answered on the event loop, misses use the async ORM
+async def alookup(user, barcode, use_cache=True):
+    barcode = (barcode or '').strip()
+    if not is_real_barcode(barcode):
+        return None
+
+    if use_cache:
+        hit, product = lookup_cache.get(user.pk, barcode)
+        if hit:
+            return product
+
+    product = await (
+        Goods.objects.select_related('category')
+        .filter(user=user, barcode=barcode)
+        .afirst()
+    )
+    if use_cache:
+        lookup_cache.put(user.pk, barcode, product)
+    return product
+
+
+# Barcodes worth looking up for one decoded item; a UPC-A code may have been stored in its
+# 13-digit EAN form
+def _decoded_codes(item):
+    if item['format'] == 'upc_a':
+        return [item['code'], '0' + item['code']]
+    return [item['code']]
+
+
+# Product for the first barcode read from an image that is in stock, or None. decoded is the
+# decoding.decode_array() result.
+def lookup_decoded(user, decoded):
+    for item in decoded:
+        for code in _decoded_codes(item):
+            product = lookup(user, code)
+            if product is not None:
+                return product
+    return None
+
+
+async def alookup_decoded(user, decoded):
+    for item in decoded:
+        for code in _decoded_codes(item):
+            product = await alookup(user, code)
+            if product is not None:
+                return product
+    return None
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from . import versions
+from .models import Category, Customer
+
+# Seconds a user's choice lists are kept. Invalidation bumps a version in the cache, so this only
+# bounds staleness when each server process has its own cache (the default local-memory cache).
+CHOICES_TIMEOUT = 300
+
+# One dropdown option; templates read .id and .name just like a model instance
+Choice = namedtuple('Choice', ['id', 'name'])
+
+
+class UserChoices:
+    # A user's categories and customers as (id, name) lists for dropdowns
+    def __init__(self, categories, customers):
+        self.categories = categories
+        self.customers = customers
+        self.category_ids = frozenset(choice.id for choice in categories)
+        self.customer_ids = frozenset(choice.id for choice in customers)
+
+
+def _version_key(user_id):
+    return f'choices:{user_id}:version'
+
+
+def _cache_key(user_id):
+    return f'choices:{user_id}:{versions.get(_version_key(user_id))}'
+
+
+def _rows(model, user):
+    return model.objects.filter(user=user).order_by('id').values_list('id', 'name')
+
+
+# Cached dropdown choices for one user; two small queries on a miss, none on a hit
+def for_user(user):
+    key = _cache_key(user.pk)
+    choices = cache.get(key)
+    if choices is None:
+        choices = UserChoices(
+            categories=[Choice(*row) for row in _rows(Category, user)],
+            customers=[Choice(*row) for row in _rows(Customer, user)],
+        )
+        cache.set(key, choices, CHOICES_TIMEOUT)
+    return choices
+
+
+# for_user() for async views. The cache is called directly: the default local-memory cache never
+# blocks, and Django's async cache methods would only move the same call onto a thread.
+async def afor_user(user):
+    key = _cache_key(user.pk)
+    choices = cache.get(key)
+    if choices is None:
+        choices = UserChoices(
+            categories=[Choice(*row) async for row in _rows(Category, user)],
+            customers=[Choice(*row) async for row in _rows(Customer, user)],
+        )
+        cache.set(key, choices, CHOICES_TIMEOUT)
+    return choices
+
+
+# Make the next for_user() reload. Called from the Category/Customer signals.
+def invalidate_user(user_id):
+    versions.bump(_version_key(user_id))
@@ -0,0 +1,40 @@
+import hashlib
+import time
+
+from django.views.decorators.http import condition
+
+from . import fragments
+
+# Conditional GET for the list pages and the JSON API. Validators come from the user's list version
+# (fragments.data_version), which every write to their goods, categories or customers moves on, so a
+# client whose copy is current gets a 304 before any query or template work.
+
+
+# ETags also change every FRAGMENT_TIMEOUT seconds. With a cache per server process (the default)
+# a write seen by one process does not move the version in the others; this bounds how long they
+# can keep answering 304 to a stale copy, just as it bounds their cached pages.
+def _window():
+    return int(time.time() // fragments.FRAGMENT_TIMEOUT)
+
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+# Pages embed a CSRF token, which is only valid for the client's current CSRF secret
+def page_etag(request, *args, **kwargs):
+    return _etag(request.user.pk, fragments.data_version(request.user.pk), _window(), request.META.get('CSRF_COOKIE'))
+
+
+def api_etag(request, *args, **kwargs):
+    return _etag(request.user.pk, fragments.data_version(request.user.pk), _window())
+
+
+def last_modified(request, *args, **kwargs):
+    return fragments.last_modified(request.user.pk)
+
+
+# Decorators adding ETag/Last-Modified to GET responses and answering matching
+# If-None-Match/If-Modified-Since with 304. Apply inside the login/API authentication.
+page = condition(etag_func=page_etag, last_modified_func=last_modified)
+api = condition(etag_func=api_etag, last_modified_func=last_modified)
@@ -0,0 +1,344 @@
+import io
+import multiprocessing
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # decoding is unavailable, the rest of the app still works
+    np = None
+
+# Server-side decoding of EAN-13, UPC-A and Code 128 from camera frames and photos.
+# This module is imported by the worker processes, so it must not touch Django.
+
+# Longest image side decoded; larger photos are scaled down first
+MAX_IMAGE_SIDE = 1600
+
+# Largest uploaded image file accepted, in bytes
+DECODE_MAX_IMAGE_SIZE = 10 * 1024 * 1024
+
+# Largest image accepted, in pixels (a 48-megapixel phone photo fits). Checked before any pixels
+# are decoded, so a small compressed file cannot unpack into gigabytes (a decompression bomb).
+MAX_IMAGE_PIXELS = 50_000_000
+
+# Horizontal lines sampled across an image (the same again vertically when nothing is found)
+SCANLINES = 24
+
+# Processes decoding batched uploads in parallel
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Largest difference, in modules, between a measured symbol and its pattern (see _symbol_error)
+MAX_SYMBOL_ERROR = 1.0
+
+# EAN/UPC digit run widths in modules (space, bar, space, bar for the L code). The R code has
+# the same widths with the colours swapped, the G code has them reversed.
+EAN_WIDTHS = (
+    (3, 2, 1, 1), (2, 2, 2, 1), (2, 1, 2, 2), (1, 4, 1, 1), (1, 1, 3, 2),
+    (1, 2, 3, 1), (1, 1, 1, 4), (1, 3, 1, 2), (1, 2, 1, 3), (3, 1, 1, 2),
+)
+
+# L/G parity of the six left digits, which encodes the leading EAN-13 digit
+EAN_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG', 'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+# Code 128 symbol values 0-105 as bar/space widths (stop is 106 and has a seventh bar)
+CODE128_WIDTHS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232',
+)
+CODE128_STOP = '2331112'
+CODE128_START = {103: 'A', 104: 'B', 105: 'C'}
+
+if np is not None:
+    _EAN_L = np.array(EAN_WIDTHS, dtype=float)
+    _EAN_LG = np.concatenate([_EAN_L, _EAN_L[:, ::-1]])  # rows 0-9: L code, 10-19: G code
+    # 6-bit parity pattern (bit k set when left digit k uses the G code) -> leading digit, -1 if invalid
+    _EAN_FIRST_DIGIT = np.full(64, -1)
+    for _digit, _pattern in enumerate(EAN_PARITY):
+        _EAN_FIRST_DIGIT[sum(1 << k for k, p in enumerate(_pattern) if p == 'G')] = _digit
+    _CODE128 = np.array([[int(w) for w in widths] for widths in CODE128_WIDTHS], dtype=float)
+    _CODE128_STOP = np.array([int(w) for w in CODE128_STOP], dtype=float)
+    _EAN_GUARDS = [0, 1, 2, 27, 28, 29, 30, 31, 56, 57, 58]
+
+
+def _require_numpy():
+    if np is None:
+        raise ValueError("Barcode decoding requires the numpy package.")
+
+
+# Binarize sample lines of a grayscale image at once and yield (run widths, first run is dark)
+def _scanline_runs(gray, count=SCANLINES):
+    height, width = gray.shape
+    if width < 30:
+        return
+    ys = np.unique(np.linspace(height * 0.05, height * 0.95, count).astype(int))
+    # Each line averages a few neighbouring rows: bars run across them, sensor noise does not
+    band = np.clip(ys[:, None] + np.arange(-2, 3), 0, height - 1)
+    rows = gray[band].astype(np.float32).mean(axis=1)
+
+    # Threshold each pixel halfway between the darkest and lightest pixel around it, so uneven
+    # lighting is tolerated; flat areas (little local contrast) count as light
+    half = max(4, width // 24)
+    padded = np.pad(rows, ((0, 0), (half, half)), mode='edge')
+    neighbourhood = sliding_window_view(padded, 2 * half + 1, axis=1)
+    local_min = neighbourhood.min(axis=2)
+    local_max = neighbourhood.max(axis=2)
+    threshold = (local_min + local_max) / 2
+    low, high = np.percentile(rows, [5, 95], axis=1)
+    contrast = (high - low)[:, None]
+    dark = (rows < threshold) & (local_max - local_min > contrast / 4)
+
+    for line, values, limit, line_contrast in zip(dark, rows, threshold, contrast[:, 0]):
+        if line_contrast < 20:
+            continue
+        edges = np.flatnonzero(line[1:] != line[:-1]) + 1
+        # Place each edge where the brightness crosses the threshold between the two pixels;
+        # whole-pixel edges are too coarse for modules only two or three pixels wide
+        before = values[edges - 1] - limit[edges - 1]
+        after = values[edges] - limit[edges]
+        step = before - after
+        fraction = np.clip(np.divide(before, step, out=np.full(len(edges), 0.5), where=step != 0), 0, 1)
+        runs = np.diff(np.concatenate(([0], edges - 0.5 + fraction, [width])))
+        yield runs, bool(line[0])
+
+
+# Distance of measured symbols (..., runs), scaled to their module count, to every pattern
+# (patterns, runs). Mostly compares edge-to-similar-edge widths (bar + following space and so on),
+# which do not change when ink spread or blur makes bars wider and spaces narrower; plain run
+# widths only break ties between the EAN digits whose edge widths are equal (1/7, 2/8).
+def _symbol_error(measured, patterns):
+    measured_edges = measured[..., 1:] + measured[..., :-1]
+    pattern_edges = patterns[:, 1:] + patterns[:, :-1]
+    edge_error = np.abs(measured_edges[..., None, :] - pattern_edges).sum(axis=-1)
+    width_error = np.abs(measured[..., None, :] - patterns).sum(axis=-1)
+    return edge_error + 0.1 * width_error
+
+
+# Start indices of windows of `size` runs that begin on a dark run
+def _dark_starts(count, size, first_dark):
+    return np.arange(0 if first_dark else 1, count - size + 1, 2)
+
+
+def _decode_ean13(runs, first_dark):
+    starts = _dark_starts(len(runs), 59, first_dark)
+    if not len(starts):
+        return []
+    windows = sliding_window_view(runs, 59)[starts].astype(float)
+    modules = windows / (windows.sum(axis=1, keepdims=True) / 95)
+    windows = windows[(np.abs(modules[:, _EAN_GUARDS] - 1) < 0.6).all(axis=1)]
+    if not len(windows):
+        return []
+
+    left = windows[:, 3:27].reshape(-1, 6, 4)
+    right = windows[:, 32:56].reshape(-1, 6, 4)
+    left = left / left.sum(axis=2, keepdims=True) * 7
+    right = right / right.sum(axis=2, keepdims=True) * 7
+    # Error of every digit against every pattern: (windows, 6 digits, patterns)
+    left_error = _symbol_error(left, _EAN_LG)
+    right_error = _symbol_error(right, _EAN_L)
+    left_code = left_error.argmin(axis=2)
+    right_code = right_error.argmin(axis=2)
+    good = (left_error.min(axis=2) < MAX_SYMBOL_ERROR).all(axis=1)
+    good &= (right_error.min(axis=2) < MAX_SYMBOL_ERROR).all(axis=1)
+
+    parity = ((left_code >= 10) << np.arange(6)).sum(axis=1)
+    first = _EAN_FIRST_DIGIT[parity]
+    digits = np.concatenate([first[:, None], left_code % 10, right_code], axis=1)
+    checksum = (digits * np.array([1, 3] * 6 + [1])).sum(axis=1) % 10
+    good &= (first >= 0) & (checksum == 0)
+
+    found = []
+    for row in digits[good]:
+        code = ''.join(map(str, row))
+        # UPC-A is EAN-13 with a leading zero
+        found.append((code[1:], 'upc_a') if code[0] == '0' else (code, 'ean13'))
+    return found
+
+
+def _decode_code128(runs, first_dark):
+    count = len(runs)
+    starts = _dark_starts(count, 6, first_dark)
+    if len(starts) < 4:
+        return []
+    windows = sliding_window_view(runs, 6)[starts].astype(float)
+    widths = windows.sum(axis=1)
+    error = _symbol_error(windows / widths[:, None] * 11, _CODE128)
+    values = np.full(count, -1)
+    values[starts] = np.where(error.min(axis=1) < MAX_SYMBOL_ERROR, error.argmin(axis=1), -1)
+    symbol_width = np.zeros(count)
+    symbol_width[starts] = widths
+
+    stop = np.zeros(count, dtype=bool)
+    stop_starts = starts[starts <= count - 7]
+    if len(stop_starts):
+        stop_windows = sliding_window_view(runs, 7)[stop_starts].astype(float)
+        stop_windows = stop_windows / stop_windows.sum(axis=1, keepdims=True) * 13
+        stop[stop_starts] = _symbol_error(stop_windows, _CODE128_STOP[None])[:, 0] < MAX_SYMBOL_ERROR
+
+    found = []
+    for start in np.flatnonzero(values >= 103):
+        width = symbol_width[start]
+        symbols = [int(values[start])]
+        position = start + 6
+        while position < count and not stop[position]:
+            value = values[position]
+            # Every symbol is 11 modules wide; a symbol of a different size is not part of this code
+            if value < 0 or value >= 103 or abs(symbol_width[position] - width) > width * 0.25:
+                break
+            symbols.append(int(value))
+            position += 6
+        if position >= count or not stop[position] or len(symbols) < 3:
+            continue
+        *data, check = symbols
+        if (data[0] + sum(weight * value for weight, value in enumerate(data[1:], start=1))) % 103 != check:
+            continue
+        text = _code128_text(data)
+        if text:
+            found.append((text, 'code128'))
+    return found
+
+
+# Turn Code 128 symbol values (start code first, checksum removed) into text
+def _code128_text(values):
+    code_set = CODE128_START[values[0]]
+    shift = False
+    text = []
+    for value in values[1:]:
+        current = ('B' if code_set == 'A' else 'A') if shift else code_set
+        shift = False
+        if current == 'C':
+            if value < 100:
+                text.append(f'{value:02d}')
+            elif value == 100:
+                code_set = 'B'
+            elif value == 101:
+                code_set = 'A'
+            continue
+        if value < 96:
+            if current == 'A' and value >= 64:
+                text.append(chr(value - 64))
+            else:
+                text.append(chr(value + 32))
+        elif value == 98:
+            shift = True
+        elif value == 99:
+            code_set = 'C'
+        elif value == (101 if current == 'B' else 100):
+            code_set = 'A' if current == 'B' else 'B'
+        # FNC1-4 carry no text
+    return ''.join(text)
+
+
+# Barcodes in a 2-D grayscale array, most often read first: [{'code': .., 'format': ..}]
+def decode_array(gray):
+    _require_numpy()
+    gray = np.asarray(gray)
+    votes = Counter()
+    # Rows first; columns only when nothing was read, for codes photographed sideways
+    for image in (gray, gray.T):
+        for runs, first_dark in _scanline_runs(image):
+            # Each line is read in both directions so upside-down codes decode too
+            last_dark = first_dark if len(runs) % 2 else not first_dark
+            for line, dark in ((runs, first_dark), (runs[::-1], last_dark)):
+                votes.update(_decode_ean13(line, dark))
+                votes.update(_decode_code128(line, dark))
+        if votes:
+            break
+    return [{'code': code, 'format': fmt} for (code, fmt), _ in votes.most_common()]
+
+
+_NETPBM_HEADER = re.compile(rb'(P[56])(?:\s+|#[^\n]*\n)+(\d+)(?:\s+|#[^\n]*\n)+(\d+)(?:\s+|#[^\n]*\n)+(\d+)\s')
+
+
+TOO_LARGE_MESSAGE = "Image is too large; send a smaller photo."
+
+
+# Grayscale array from binary PGM/PPM bytes (what the scanner pages upload) or, with Pillow
+# installed, from any image format it reads (JPEG and PNG photos)
+def load_image(data):
+    _require_numpy()
+    header = _NETPBM_HEADER.match(data)
+    if header:
+        magic, width, height, maxval = header.group(1), *map(int, header.groups()[1:])
+        if not 0 < maxval < 65536:
+            raise ValueError("Unsupported image.")
+        channels = 3 if magic == b'P6' else 1
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ValueError(TOO_LARGE_MESSAGE)
+        dtype = np.dtype('>u2' if maxval > 255 else 'u1')
+        size = width * height * channels
+        pixels = np.frombuffer(data, dtype=dtype, count=size, offset=header.end()) if width and height else None
+        if pixels is None or pixels.size != size:
+            raise ValueError("Truncated image.")
+        pixels = pixels.reshape(height, width, channels).astype(np.float32) * (255 / maxval)
+        gray = pixels[:, :, 0] if channels == 1 else pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        step = -(-max(width, height) // MAX_IMAGE_SIDE)
+        return gray[::step, ::step].astype(np.uint8)
+
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        raise ValueError("Only PGM/PPM images can be read; install Pillow for JPEG and PNG.")
+    try:
+        # Opening only reads the header; Pillow refuses far larger images itself
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ValueError(TOO_LARGE_MESSAGE)
+            image.draft('L', (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))  # JPEGs decode at reduced size directly
+            image = image.convert('L')
+            image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+            return np.asarray(image)
+    except Image.DecompressionBombError:
+        raise ValueError(TOO_LARGE_MESSAGE)
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Not a readable image.")
+
+
+# Decode one uploaded image; returns (barcodes, error message). Runs inside the worker processes.
+def decode_image(data):
+    try:
+        return decode_array(load_image(data)), None
+    except ValueError as exc:
+        return [], str(exc)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Worker processes are started on first use and live as long as the server process
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server (and its open database connections) is unsafe
+            _pool = ProcessPoolExecutor(DECODE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+# Decode a batch of uploads, in parallel when there is more than one; results keep upload order
+def decode_images(images):
+    _require_numpy()
+    if len(images) < 2 or DECODE_WORKERS < 2:
+        return [decode_image(data) for data in images]
+    global _pool
+    try:
+        return list(get_pool().map(decode_image, images))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time, decode here now
+        with _pool_lock:
+            _pool = None
+        return [decode_image(data) for data in images]
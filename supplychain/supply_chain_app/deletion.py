@@ -0,0 +1,103 @@
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import choices, fragments, jobs, rollups
+from .barcodes import lookup_cache
+from .models import Category, Customer, Goods
+
+# Products removed per purge transaction; each batch holds the database write lock only briefly
+PURGE_BATCH_SIZE = 1000
+
+# Soft-deletable owners of products: their Goods foreign key, and the other owner that can also
+# hide a product
+OWNERS = {
+    Category: ('category', 'customer'),
+    Customer: ('customer', 'category'),
+}
+
+
+# Delete the categories or customers in `owners` without touching their products: the rows are
+# only marked deleted, which hides them and their products (see GoodsManager), and the products
+# are taken out of the rollups with one grouped query. A queued purge job removes the rows later.
+# Returns the number of owners deleted.
+def soft_delete(owners):
+    field, other = OWNERS[owners.model]
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(owners.values_list('pk', 'user_id'))
+        owner_ids = [pk for pk, _ in rows]
+        deleted = owners.model.objects.filter(pk__in=owner_ids).update(deleted_at=now)
+        # Only the owners this call marked (deleted_at == now), and only products not already
+        # hidden by the other owner, so nothing is taken out of the rollups twice
+        rollups.goods_removed(Goods.all_objects.filter(**{
+            f'{field}__in': owner_ids, f'{field}__deleted_at': now, f'{other}__deleted_at__isnull': True,
+        }))
+        # The rows themselves go in the background (tasks.purge_deleted)
+        if deleted:
+            jobs.enqueue('purge_deleted', priority=-1, unique=True)
+    # Queryset updates skip model signals
+    for user_id in {user_id for _, user_id in rows}:
+        lookup_cache.invalidate_user(user_id)
+        choices.invalidate_user(user_id)
+        fragments.invalidate_user(user_id)
+    return deleted
+
+
+# Delete one record: categories and customers are soft-deleted, anything else is deleted outright
+def delete(instance):
+    if type(instance) in OWNERS:
+        soft_delete(type(instance).objects.filter(pk=instance.pk))
+    else:
+        instance.delete()
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+# Raw DELETEs removing one batch of an owner's products: first the rows depending on them (every
+# relation to Goods cascades: stock movements and snapshots), then the products. The same
+# id-ordered subquery picks the batch each time; the transaction keeps it stable in between.
+def _purge_statements(field):
+    batch = (
+        f"SELECT {_quote('id')} FROM {_quote(Goods._meta.db_table)} "
+        f"WHERE {_quote(Goods._meta.get_field(field).column)} = %s ORDER BY {_quote('id')} LIMIT %s"
+    )
+    statements = [
+        f"DELETE FROM {_quote(relation.related_model._meta.db_table)} "
+        f"WHERE {_quote(relation.field.column)} IN ({batch})"
+        for relation in Goods._meta.related_objects
+    ]
+    statements.append(f"DELETE FROM {_quote(Goods._meta.db_table)} WHERE {_quote('id')} IN ({batch})")
+    return statements
+
+
+# Products were already taken out of the rollups and caches by soft_delete(), so nothing else needs updating
+def _purge_batch(statements, owner_id, batch_size):
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql, [owner_id, batch_size])
+        return cursor.rowcount
+
+
+# Remove soft-deleted categories and customers for good: their products go in batches of
+# batch_size, each in its own short transaction with `pause` seconds between them so requests get
+# the database in between, then the owner row with its rollup. Returns (owners, products) removed.
+def purge(batch_size=PURGE_BATCH_SIZE, pause=0):
+    owners = products = 0
+    for model, (field, _) in OWNERS.items():
+        statements = _purge_statements(field)
+        for owner_id in list(model.all_objects.filter(deleted_at__isnull=False).values_list('pk', flat=True)):
+            while True:
+                removed = _purge_batch(statements, owner_id, batch_size)
+                products += removed
+                if removed < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+            # Only the rollup row is left to cascade to
+            model.all_objects.filter(pk=owner_id).delete()
+            owners += 1
+    return owners, products
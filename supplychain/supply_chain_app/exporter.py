@@ -0,0 +1,143 @@
+import csv
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+from .models import Customer, Goods
+
+# Rows fetched from the database cursor at a time
+EXPORT_CHUNK_SIZE = 2000
+
+# Encoded bytes gathered before a chunk is handed to the response
+STREAM_BUFFER_SIZE = 64 * 1024
+
+FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Exported goods columns: header -> values_list lookup (total_value is annotated in SQL)
+GOODS_COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('barcode', 'barcode'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+    ('total_value', 'total_value'),
+    ('category', 'category__name'),
+    ('customer', 'customer__name'),
+    ('description', 'description'),
+    ('reorder_point', 'reorder_point'),
+    ('reorder_qty', 'reorder_qty'),
+    ('date_added', 'date_added'),
+)
+
+CUSTOMER_COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('address', 'address'),
+    ('date_added', 'date_added'),
+)
+
+
+# Goods rows for one user as plain tuples, read from the cursor in chunks
+def goods_rows(user, chunk_size=EXPORT_CHUNK_SIZE):
+    total_value = ExpressionWrapper(
+        F('price') * F('quantity'),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+    rows = (
+        Goods.objects.filter(user=user)
+        .annotate(total_value=total_value)
+        .order_by('id')
+        .values_list(*(lookup for _, lookup in GOODS_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+    # SQLite hands computed decimals back unscaled (10 rather than 10.00)
+    position = [header for header, _ in GOODS_COLUMNS].index('total_value')
+    cents = Decimal('0.01')
+    for row in rows:
+        if row[position] is not None:
+            row = row[:position] + (row[position].quantize(cents),) + row[position + 1:]
+        yield row
+
+
+def customer_rows(user, chunk_size=EXPORT_CHUNK_SIZE):
+    return (
+        Customer.objects.filter(user=user)
+        .order_by('id')
+        .values_list(*(lookup for _, lookup in CUSTOMER_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+# What each export is called and where its rows come from
+DATASETS = {
+    'goods': ([header for header, _ in GOODS_COLUMNS], goods_rows),
+    'customers': ([header for header, _ in CUSTOMER_COLUMNS], customer_rows),
+}
+
+
+# Make database values JSON/CSV friendly
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    # File-like object whose write() just hands back the line, so csv.writer can feed a generator
+    def write(self, value):
+        return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def _ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, map(_plain, row))), ensure_ascii=False) + '\n'
+
+
+# Encoded, buffered byte chunks for a dataset; memory use does not depend on the row count
+def stream(header, rows, fmt='csv', compress=False):
+    lines = _csv_lines(header, rows) if fmt == 'csv' else _ndjson_lines(header, rows)
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= STREAM_BUFFER_SIZE:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+# File name offered for download, e.g. goods.csv.gz
+def filename(dataset, fmt, compress=False):
+    return f"{dataset}.{fmt}" + ('.gz' if compress else '')
@@ -0,0 +1,166 @@
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+
+from django.db import connection, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DailyConsumption, Goods, ReorderSuggestion
+
+try:
+    import numpy as np
+except ImportError:  # forecasting is unavailable, the rest of the app still works
+    np = None
+
+# Demand forecast and reorder suggestions for every product at once. The daily consumption of all
+# products is loaded into one (products x days) array, and smoothing, variability and order sizes
+# are whole-array operations: nothing loops over products in Python.
+
+# Days of consumption the forecast looks back over, ending yesterday (today is not over yet)
+HISTORY_DAYS = 56
+
+# Weight of the latest day in the exponentially smoothed demand; higher reacts faster
+SMOOTHING = 0.2
+
+# Days between placing an order and receiving the stock
+LEAD_TIME_DAYS = 7
+
+# Days of demand an order covers beyond the lead time
+REVIEW_DAYS = 7
+
+# Chance of not running out while an order is on its way; sets the safety stock
+SERVICE_LEVEL = 0.95
+
+# Suggestions written per executemany()
+WRITE_BATCH_SIZE = 5000
+
+# Rows shown in the dashboard's reorder suggestion panel
+SUGGESTION_PANEL_SIZE = 10
+
+# ReorderSuggestion fields written by run(), in the order of its rows
+SUGGESTION_FIELDS = ('goods', 'user', 'daily_demand', 'safety_stock', 'reorder_point', 'quantity', 'computed_at')
+
+
+# Round up to whole units, ignoring floating point noise (10.000000001 units is 10, not 11)
+def _units(values):
+    return np.ceil(np.round(values, 6))
+
+
+def _require_numpy():
+    if np is None:
+        raise ValueError("Demand forecasting requires the numpy package.")
+
+
+# Forecast every product from `demand`, a (products x days) array of units issued per day, oldest
+# first. first_day holds the index of each product's first day in it (days before it was added
+# are not counted as zero demand), on_hand its stock and minimum_order its reorder quantity (0 if
+# unset). Returns arrays (daily demand, safety stock, reorder point, units to order), the last 0
+# for products that need no order.
+def forecast(demand, first_day, on_hand, minimum_order, lead_time=LEAD_TIME_DAYS, review=REVIEW_DAYS):
+    days = demand.shape[1]
+    observed = days - first_day
+    recent = np.flatnonzero(first_day)
+    if len(recent):
+        demand = demand.copy()
+        demand[recent] *= np.arange(days) >= first_day[recent, None]
+    counted = np.maximum(observed, 1)
+    mean = demand.sum(axis=1) / counted
+
+    # Exponential smoothing started from the mean on each product's first day, in closed form:
+    # day t weighs SMOOTHING * (1 - SMOOTHING) ** (days - 1 - t), the starting level what is left
+    weights = SMOOTHING * (1 - SMOOTHING) ** np.arange(days - 1, -1, -1)
+    level = demand @ weights + (1 - SMOOTHING) ** observed * mean
+
+    # Sample variance of daily demand over the days each product existed, from the sum of squares
+    squares = np.einsum('ij,ij->i', demand, demand)
+    spread = np.maximum(squares - counted * mean ** 2, 0) / np.maximum(observed - 1, 1)
+    safety_stock = _units(NormalDist().inv_cdf(SERVICE_LEVEL) * np.sqrt(spread * lead_time))
+
+    reorder_point = _units(level * lead_time + safety_stock)
+    # Order enough to cover the lead time and the review period on top of the safety stock
+    target = level * (lead_time + review) + safety_stock
+    needed = np.maximum(_units(target - on_hand), np.maximum(minimum_order, 1))
+    order = np.where((on_hand <= reorder_point) & (level > 0), needed, 0)
+    return level, safety_stock, reorder_point, order
+
+
+# Rows of a values_list() queryset straight from the database cursor. Skipping the ORM's per-row
+# work matters at a million rows; the columns must be plain numbers that need no converting.
+def _fetch(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+# Visible products ordered by id as arrays (ids, user ids, stock, reorder quantity or 0, index of
+# the day they were added within the window starting at `start`, 0 for those added before it)
+def _load_products(start):
+    rows = _fetch(
+        Goods.objects.order_by('id').values_list('id', 'user_id', 'quantity', Coalesce('reorder_qty', 0))
+    )
+    products = np.array(rows, dtype=np.int64).reshape(-1, 4)
+    ids = products[:, 0]
+    first_day = np.zeros(len(ids), dtype=np.int64)
+    # Only products added within the window need their first day worked out
+    window_start = timezone.make_aware(datetime.combine(start, time.min))
+    added = Goods.objects.filter(date_added__gte=window_start).values_list('id', 'date_added')
+    for goods_id, when in added:
+        position = np.searchsorted(ids, goods_id)
+        if position < len(ids) and ids[position] == goods_id:
+            first_day[position] = min((timezone.localdate(when) - start).days, HISTORY_DAYS)
+    return ids, products[:, 1], products[:, 2].astype(float), products[:, 3].astype(float), first_day
+
+
+# Daily consumption from `start` for HISTORY_DAYS days as a (products x days) array whose rows
+# follow `ids` (sorted); consumption of products not in `ids` is dropped. Read one day (column) per
+# query, so rows arrive as plain number pairs with no dates to convert.
+def _load_demand(ids, start):
+    demand = np.zeros((len(ids), HISTORY_DAYS))
+    if not len(ids):
+        return demand
+    for offset in range(HISTORY_DAYS):
+        rows = _fetch(
+            DailyConsumption.objects.filter(day=start + timedelta(days=offset)).values_list('goods_id', 'quantity')
+        )
+        day = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        position = np.minimum(np.searchsorted(ids, day[:, 0]), len(ids) - 1)
+        known = ids[position] == day[:, 0]
+        demand[position[known], offset] = day[known, 1]
+    return demand
+
+
+# One parameterised INSERT for ReorderSuggestion rows in SUGGESTION_FIELDS order, run through
+# executemany() like the importer's
+def _insert_sql():
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(ReorderSuggestion._meta.get_field(name).column) for name in SUGGESTION_FIELDS)
+    placeholders = ', '.join(['%s'] * len(SUGGESTION_FIELDS))
+    return f"INSERT INTO {quote(ReorderSuggestion._meta.db_table)} ({columns}) VALUES ({placeholders})"
+
+
+# Forecast every visible product from its consumption up to yesterday and replace the reorder
+# suggestions with one per product that should be ordered now. Run ledger.record_consumption()
+# first so the latest issues are counted. Returns (products forecast, suggestions written).
+def run(today=None):
+    _require_numpy()
+    today = today or timezone.localdate()
+    start = today - timedelta(days=HISTORY_DAYS)
+    ids, users, on_hand, minimum_order, first_day = _load_products(start)
+    demand = _load_demand(ids, start)
+    level, safety_stock, reorder_point, order = forecast(demand, first_day, on_hand, minimum_order)
+
+    chosen = np.flatnonzero(order)
+    computed_at = ReorderSuggestion._meta.get_field('computed_at').get_db_prep_save(timezone.now(), connection)
+    # tolist() hands back plain Python numbers for the database
+    rows = list(zip(
+        ids[chosen].tolist(), users[chosen].tolist(), np.round(level[chosen], 3).tolist(),
+        safety_stock[chosen].astype(np.int64).tolist(), reorder_point[chosen].astype(np.int64).tolist(),
+        order[chosen].astype(np.int64).tolist(), [computed_at] * len(chosen),
+    ))
+    with transaction.atomic(), connection.cursor() as cursor:
+        ReorderSuggestion.objects.all().delete()
+        sql = _insert_sql()
+        for offset in range(0, len(rows), WRITE_BATCH_SIZE):
+            cursor.executemany(sql, rows[offset:offset + WRITE_BATCH_SIZE])
+    return len(ids), len(rows)
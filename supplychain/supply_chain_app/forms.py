@@ -1,17 +1,35 @@
 from django import forms
 from .models import *
+from . import choices
 
 
   
 class GoodsForm(forms.ModelForm):
+    # Version of the product the form was rendered from; saving checks nobody changed it since
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
     class Meta:
         model = Goods
-        fields = ['category', 'name', 'quantity', 'description', 'price', 'customer']  # ✅ Include customer here
+        fields = ['category', 'name', 'quantity', 'description', 'price', 'customer', 'reorder_point', 'reorder_qty']  # ✅ Include customer here
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['category'].required = False
         self.fields['customer'].required = False  # optional if you want
+        if self.instance.pk:
+            self.fields['version'].required = True
+            self.fields['version'].initial = self.instance.version
+
+        # Only the user's own categories and customers can be picked; the options come from
+        # the per-user choices cache, the queryset is only used to validate a submitted id
+        cached = choices.for_user(user)
+        for name, model, options in (
+            ('category', Category, cached.categories),
+            ('customer', Customer, cached.customers),
+        ):
+            field = self.fields[name]
+            field.queryset = model.objects.filter(user=user)
+            field.choices = [('', field.empty_label)] + [(option.id, option.name) for option in options]
 
 
 class CategoryForm(forms.ModelForm):
@@ -55,4 +73,19 @@ def clean_email(self):
     email = self.cleaned_data['email']
     if not email.endswith('@gmail.com'):
         raise forms.ValidationError("Only Gmail addresses are allowed.")
-    return email
\ No newline at end of file
+    return email
+
+# Field validation for the JSON API. Category and customer ids are checked by the API itself
+# against the caller's own records, so they are not ModelChoiceFields here.
+class GoodsApiForm(forms.ModelForm):
+    class Meta:
+        model = Goods
+        fields = ['name', 'quantity', 'description', 'price', 'barcode', 'reorder_point', 'reorder_qty']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['barcode'].required = False
+
+    def clean_barcode(self):
+        # Products sent without a barcode get the placeholder, like the other entry forms
+        return self.cleaned_data['barcode'] or PLACEHOLDER_BARCODE
@@ -0,0 +1,57 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import versions
+
+# Seconds rendered list pages and table rows are kept. A write to a user's goods, categories or
+# customers moves their list version on, so cached pages are never served stale; rows are keyed on
+# the record's updated_at and simply miss once it changes.
+FRAGMENT_TIMEOUT = 300
+
+
+def _version_key(user_id):
+    return f'fragments:{user_id}:version'
+
+
+def _modified_key(user_id):
+    return f'fragments:{user_id}:modified'
+
+
+# Changes whenever anything shown on the user's goods, category or customer lists changes
+def data_version(user_id):
+    return versions.get(_version_key(user_id))
+
+
+# When that last happened, or None if not known (nothing written since the cache was emptied)
+def last_modified(user_id):
+    return cache.get(_modified_key(user_id))
+
+
+# Cache key of one rendered list page; parts are the request values the page depends on
+def page_key(user_id, name, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'fragments:{user_id}:{data_version(user_id)}:{name}:{digest}'
+
+
+# The page cached under key, or render() it and keep it
+def cached_page(key, render):
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return html
+
+
+def _touch(user_id):
+    cache.set(_modified_key(user_id), timezone.now(), None)
+
+
+# Make every cached list page of the user stale. Called from the signals and from the bulk write
+# paths that skip them.
+def invalidate_user(user_id):
+    versions.bump(_version_key(user_id))
+    _touch(user_id)
+    transaction.on_commit(lambda: _touch(user_id))
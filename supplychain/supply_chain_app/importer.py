@@ -0,0 +1,248 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import fragments, ledger, rollups, search
+from .barcodes import is_real_barcode, lookup_cache
+from .models import Category, Customer, Goods, PLACEHOLDER_BARCODE, StockMovement
+
+# Rows written per bulk_create/transaction
+DEFAULT_BATCH_SIZE = 5000
+
+# Column headers understood in import files (case-insensitive); only name and quantity are required
+COLUMNS = ('name', 'quantity', 'price', 'description', 'category', 'customer', 'barcode', 'reorder_point', 'reorder_qty')
+
+# Goods fields written by the importer, in the order build() returns them
+INSERT_FIELDS = (
+    'user', 'name', 'quantity', 'price', 'description', 'category', 'customer', 'barcode',
+    'reorder_point', 'reorder_qty', 'date_added', 'updated_at',
+)
+
+
+# One parameterised INSERT for `rows` Goods rows, returning the id and quantity of each new row
+# when the database can. Writing the SQL directly skips the per-value SQL compilation of
+# bulk_create(), which is most of the cost of a large import.
+def goods_insert_sql(rows=1, returning=False):
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Goods._meta.get_field(name).column) for name in INSERT_FIELDS)
+    placeholders = ', '.join([f"({', '.join(['%s'] * len(INSERT_FIELDS))})"] * rows)
+    sql = f"INSERT INTO {quote(Goods._meta.db_table)} ({columns}) VALUES {placeholders}"
+    if returning:
+        sql += f" RETURNING {quote(Goods._meta.pk.column)}, {quote(Goods._meta.get_field('quantity').column)}"
+    return sql
+
+
+class ImportResult:
+    # Outcome of one import: rows created plus (row number, message) for every rejected row
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+
+# Yield one dict per CSV data row without reading the whole file into memory
+def iter_csv_rows(fileobj):
+    if isinstance(fileobj, io.TextIOBase):
+        text = fileobj
+    else:
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = [column.strip().lower() for column in next(reader, [])]
+    for values in reader:
+        yield dict(zip(header, values))
+
+
+# Yield one dict per row of the first worksheet of an .xlsx file (needs openpyxl)
+def iter_xlsx_rows(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Reading .xlsx files requires the openpyxl package.")
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(column or '').strip().lower() for column in next(rows, ())]
+        for values in rows:
+            yield {key: ('' if value is None else str(value)) for key, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+# Pick a row reader from the file name
+def iter_rows(fileobj, filename):
+    if filename.lower().endswith('.xlsx'):
+        return iter_xlsx_rows(fileobj)
+    return iter_csv_rows(fileobj)
+
+
+class GoodsImporter:
+    # Streams rows into Goods for one user, resolving category/customer names from dictionaries
+    # loaded once up front and writing them in batches, one transaction per batch.
+    def __init__(self, user, batch_size=DEFAULT_BATCH_SIZE, create_missing=True):
+        self.user = user
+        # Rows per INSERT statement: as many as the database takes parameters for when it can return
+        # the new ids, otherwise one at a time so each id can be read from the cursor
+        self.returning = connection.features.can_return_rows_from_bulk_insert
+        self.rows_per_insert = connection.ops.bulk_batch_size(INSERT_FIELDS, [None] * batch_size) if self.returning else 1
+        self.insert_sql = goods_insert_sql(self.rows_per_insert, self.returning)
+        self.price_field = Goods._meta.get_field('price')
+        self.batch_size = batch_size
+        self.create_missing = create_missing
+        self.categories = dict(Category.objects.filter(user=user).values_list('name', 'id'))
+        self.customers = dict(Customer.objects.filter(user=user).values_list('name', 'id'))
+        # Real barcodes already taken, so duplicates are reported per row instead of failing a batch
+        # (products hidden with a deleted category or customer hold theirs until they are purged)
+        self.barcodes = set(
+            Goods.all_objects.filter(user=user)
+            .exclude(barcode__in=['', PLACEHOLDER_BARCODE])
+            .values_list('barcode', flat=True)
+            .iterator(chunk_size=self.batch_size)
+        )
+
+    # progress, if given, is called with the number of rows read after every batch written
+    def run(self, rows, progress=None):
+        result = ImportResult()
+        batch = []
+        # Row 1 is the header, so data starts on row 2
+        for row_number, row in enumerate(rows, start=2):
+            try:
+                batch.append(self.build(row))
+            except ValueError as exc:
+                result.errors.append((row_number, str(exc)))
+                continue
+            if len(batch) >= self.batch_size:
+                result.created += self.flush(batch)
+                batch = []
+                if progress:
+                    progress(row_number - 1)
+        if batch:
+            result.created += self.flush(batch)
+
+        # Raw inserts skip model signals, so drop cached barcode lookups and list pages here
+        lookup_cache.invalidate_user(self.user.pk)
+        fragments.invalidate_user(self.user.pk)
+        return result
+
+    def flush(self, batch):
+        # Every row of a batch shares one date_added (and updated_at), like bulk_create would give them
+        now = timezone.now()
+        date_added = Goods._meta.get_field('date_added').get_db_prep_save(now, connection)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Categories and customers new to the user are created with the rows that name them
+            self.create_missing_owners(self.categories, Category, {row[5] for row in batch})
+            self.create_missing_owners(self.customers, Customer, {row[6] for row in batch})
+            batch = [
+                (*row[:5], self.categories.get(row[5]), self.customers.get(row[6]), *row[7:], date_added, date_added)
+                for row in batch
+            ]
+            inserted = self.insert(cursor, batch)
+            # The opening stock of the new rows goes into the ledger
+            ledger.record_many(inserted, StockMovement.RECEIPT)
+            # Index the new rows for search in the same transaction
+            search.sync_pending()
+            # Raw inserts skip model signals, so fold the batch into the rollups here
+            changes = rollups.RollupChanges()
+            for user_id, _, quantity, price, _, category_id, customer_id, *_ in batch:
+                changes.add((user_id, category_id, customer_id, quantity, price))
+            changes.apply()
+        return len(batch)
+
+    # Insert the rows and return (id, quantity) of each, without guessing which rows are new
+    def insert(self, cursor, rows):
+        inserted = []
+        if not self.returning:
+            for row in rows:
+                cursor.execute(self.insert_sql, row)
+                inserted.append((cursor.lastrowid, row[INSERT_FIELDS.index('quantity')]))
+            return inserted
+        for offset in range(0, len(rows), self.rows_per_insert):
+            chunk = rows[offset:offset + self.rows_per_insert]
+            sql = self.insert_sql if len(chunk) == self.rows_per_insert else goods_insert_sql(len(chunk), True)
+            cursor.execute(sql, [value for row in chunk for value in row])
+            inserted += cursor.fetchall()
+        return inserted
+
+    # Validate one row and turn it into a tuple of INSERT_FIELDS values (minus the timestamps, and
+    # with category and customer as names that flush() resolves); raises ValueError with a readable
+    # message
+    def build(self, row):
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise ValueError("name is required")
+        if len(name) > 255:
+            raise ValueError("name is longer than 255 characters")
+
+        try:
+            quantity = int((row.get('quantity') or '').strip())
+        except ValueError:
+            raise ValueError(f"invalid quantity {row.get('quantity')!r}")
+
+        price_text = (row.get('price') or '').strip() or '0'
+        try:
+            price = Decimal(price_text)
+        except InvalidOperation:
+            raise ValueError(f"invalid price {price_text!r}")
+        if not price.is_finite() or abs(price) >= Decimal('1e8'):
+            raise ValueError(f"invalid price {price_text!r}")
+
+        barcode = (row.get('barcode') or '').strip() or PLACEHOLDER_BARCODE
+        if is_real_barcode(barcode) and barcode in self.barcodes:
+            raise ValueError(f"barcode {barcode} already exists")
+
+        reorder_point = self.optional_count(row, 'reorder_point')
+        reorder_qty = self.optional_count(row, 'reorder_qty')
+
+        category = self.owner_name(self.categories, Category, row.get('category'))
+        customer = self.owner_name(self.customers, Customer, row.get('customer'))
+
+        # Only reserve the barcode once the row is known to be good
+        if is_real_barcode(barcode):
+            self.barcodes.add(barcode)
+
+        return (
+            self.user.pk,
+            name,
+            quantity,
+            self.price_field.get_db_prep_save(price.quantize(Decimal('0.01')), connection),
+            (row.get('description') or '').strip(),
+            category,
+            customer,
+            barcode,
+            reorder_point,
+            reorder_qty,
+        )
+
+    # A blank or non-negative whole number column; blank gives None
+    def optional_count(self, row, column):
+        text = (row.get(column) or '').strip()
+        if not text:
+            return None
+        try:
+            value = int(text)
+        except ValueError:
+            raise ValueError(f"invalid {column} {text!r}")
+        if value < 0:
+            raise ValueError(f"invalid {column} {text!r}")
+        return value
+
+    # A category/customer name (None if blank); unknown names are refused unless they may be created
+    def owner_name(self, lookup, model, name):
+        name = (name or '').strip()
+        if not name:
+            return None
+        if name not in lookup and not self.create_missing:
+            raise ValueError(f"unknown {model._meta.verbose_name} {name!r}")
+        return name
+
+    # Create the named categories/customers the user does not have yet; only called for rows that
+    # passed validation, so a rejected row leaves nothing behind
+    def create_missing_owners(self, lookup, model, names):
+        for name in sorted(names - lookup.keys() - {None}):
+            lookup[name] = model.objects.create(user=self.user, name=name).pk
@@ -0,0 +1,161 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+# Seconds an idle worker waits before looking for work again
+POLL_INTERVAL = 1.0
+
+# A running job whose worker has not been heard from for this long is taken back (the worker died).
+# Tasks that run longer without reporting progress must call report() now and then.
+JOB_LEASE = timedelta(minutes=15)
+
+# Wait before the first retry of a failed job; doubled for every further attempt
+RETRY_DELAY = timedelta(seconds=30)
+
+# Finished and failed jobs are deleted this long after they end
+JOB_RETENTION = timedelta(days=7)
+
+# Seconds between a worker's housekeeping passes (lost jobs, old jobs)
+HOUSEKEEPING_INTERVAL = 60
+
+# Registered tasks: kind -> (function, default max_attempts)
+TASKS = {}
+
+
+# Register func as the task `kind`. A worker calls func(job, **job.payload) and stores what it
+# returns (which must be JSON-serialisable) as the job's result. Tasks that must not run twice
+# (their work is committed as it goes) register with max_attempts=1.
+def task(kind, max_attempts=3):
+    def register(func):
+        TASKS[kind] = (func, max_attempts)
+        return func
+    return register
+
+
+# Queue a job; payload holds the task's keyword arguments. With unique=True an existing queued job
+# of the same kind for the same user is returned instead of queueing another.
+def enqueue(kind, payload=None, user=None, priority=0, unique=False):
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    if unique:
+        queued = Job.objects.filter(kind=kind, user=user, state=Job.QUEUED).first()
+        if queued is not None:
+            return queued
+    return Job.objects.create(
+        kind=kind, payload=payload or {}, user=user, priority=priority, max_attempts=TASKS[kind][1],
+    )
+
+
+def _ready():
+    return Job.objects.filter(state=Job.QUEUED, run_after__lte=timezone.now()).order_by('-priority', 'run_after', 'id')
+
+
+def _start(jobs, worker):
+    now = timezone.now()
+    return jobs.update(state=Job.RUNNING, worker=worker, attempts=F('attempts') + 1, started_at=now, heartbeat_at=now)
+
+
+# Claim the next due job for worker, or return None when there is none. Backends with
+# SELECT ... FOR UPDATE SKIP LOCKED lock the row, so concurrent workers pass over each other's
+# picks. SQLite has no row locks: the next job is read without locking and claimed with an UPDATE
+# that only matches while it is still queued; a worker that loses the race moves on to the next.
+def claim(worker):
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _ready().select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            _start(Job.objects.filter(pk=job.pk), worker)
+        job.refresh_from_db()
+        return job
+
+    while True:
+        pk = _ready().values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        if _start(Job.objects.filter(pk=pk, state=Job.QUEUED), worker):
+            return Job.objects.get(pk=pk)
+
+
+# The job's row while this claim of it still holds (it was not taken back as lost meanwhile)
+def _claimed(job):
+    return Job.objects.filter(pk=job.pk, state=Job.RUNNING, attempts=job.attempts)
+
+
+# Record progress from inside a task (done units out of total, when known); also keeps the lease
+def report(job, progress, total=None, message=''):
+    job.progress, job.total, job.message = progress, total, message[:255]
+    _claimed(job).update(progress=progress, total=total, message=job.message, heartbeat_at=timezone.now())
+
+
+# Run a claimed job to the end. A failure is retried after a growing delay until the job runs out
+# of attempts. Returns True if it succeeded.
+def run(job):
+    try:
+        func = TASKS[job.kind][0]
+    except KeyError:
+        func = None
+    try:
+        if func is None:
+            raise LookupError(f"No task registered as {job.kind!r}")
+        result = func(job, **job.payload)
+    except Exception as exc:
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            retry = {'state': Job.QUEUED, 'run_after': now + RETRY_DELAY * 2 ** (job.attempts - 1)}
+        else:
+            retry = {'state': Job.FAILED, 'finished_at': now}
+        _claimed(job).update(error=traceback.format_exc(), message=str(exc)[:255], heartbeat_at=now, **retry)
+        return False
+    now = timezone.now()
+    _claimed(job).update(state=Job.DONE, result=result, finished_at=now, heartbeat_at=now)
+    return True
+
+
+# Take back running jobs whose worker went quiet for longer than JOB_LEASE (queued again, or
+# failed if out of attempts) and delete jobs that ended more than JOB_RETENTION ago.
+# Returns (jobs taken back, jobs deleted).
+def housekeeping():
+    now = timezone.now()
+    lost = Job.objects.filter(state=Job.RUNNING, heartbeat_at__lt=now - JOB_LEASE)
+    error = f"Worker stopped responding (no sign of life for {JOB_LEASE})"
+    taken_back = lost.filter(attempts__lt=F('max_attempts')).update(state=Job.QUEUED, run_after=now, error=error)
+    taken_back += lost.update(state=Job.FAILED, finished_at=now, error=error)
+    deleted, _ = Job.objects.filter(state__in=[Job.DONE, Job.FAILED], finished_at__lt=now - JOB_RETENTION).delete()
+    return taken_back, deleted
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Claim and run jobs one at a time until `stop` is set. With burst=True return as soon as no job is
+# due instead of waiting for more. Returns the number of jobs run.
+def work(stop=None, burst=False, poll=POLL_INTERVAL, worker=None):
+    stop = stop or threading.Event()
+    worker = worker or worker_name()
+    ran, next_housekeeping = 0, 0
+    while not stop.is_set():
+        # Like the request cycle: drop connections past CONN_MAX_AGE or left broken by the last job
+        close_old_connections()
+        if time.monotonic() >= next_housekeeping:
+            housekeeping()
+            next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll)
+            continue
+        run(job)
+        ran += 1
+    return ran
@@ -0,0 +1,201 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import DateTimeField, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ChangeCursor, DailyConsumption, Goods, StockMovement, StockSnapshot
+
+# Snapshots are taken this far in the past, so writes still in flight when one is taken (whose
+# movements carry an earlier timestamp but are not committed yet) are never left out
+SNAPSHOT_SETTLE = timedelta(minutes=1)
+
+# Products handled per snapshot/compaction transaction
+SNAPSHOT_BATCH_SIZE = 5000
+
+# Stands in for "no snapshot yet": every movement is later than this
+_BEGINNING = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+_QUANTITY = Goods.ROLLUP_FIELDS.index('quantity')
+
+# ChangeCursor row tracking how far record_consumption() has read the ledger
+CONSUMPTION_CURSOR = 'consumption'
+
+
+def kind_for(delta):
+    return StockMovement.RECEIPT if delta > 0 else StockMovement.ISSUE
+
+
+# Append movements for (goods id, signed quantity) pairs; the kind follows the sign unless given.
+# Timestamps are taken here, after the stock change itself was written.
+def record_many(changes, kind=None):
+    now = timezone.now()
+    StockMovement.objects.bulk_create(
+        StockMovement(goods_id=goods_id, kind=kind or kind_for(quantity), quantity=quantity, created_at=now)
+        for goods_id, quantity in changes
+        if quantity
+    )
+
+
+def record(goods_id, quantity, kind=None):
+    record_many([(goods_id, quantity)], kind)
+
+
+# post_save: a new product's stock is received; a changed quantity on an edit is an adjustment
+def goods_saved(instance, previous):
+    if previous is None:
+        record(instance.pk, instance.quantity, StockMovement.RECEIPT)
+    elif instance.quantity != previous[_QUANTITY]:
+        record(instance.pk, instance.quantity - previous[_QUANTITY], StockMovement.ADJUSTMENT)
+
+
+# Annotate goods with stock_at: their stock at `when`, read from the latest snapshot taken at or
+# before `when` plus only the movements after that snapshot (snapshot_at; the epoch if none)
+def with_stock_at(goods, when):
+    snapshots = StockSnapshot.objects.filter(goods=OuterRef('pk'), taken_at__lte=when).order_by('-taken_at')
+    later = (
+        StockMovement.objects.filter(goods=OuterRef('pk'), created_at__gt=OuterRef('snapshot_at'), created_at__lte=when)
+        .order_by()
+        .values('goods')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return goods.annotate(
+        snapshot_at=Coalesce(
+            Subquery(snapshots.values('taken_at')[:1]), Value(_BEGINNING, output_field=DateTimeField()),
+        ),
+        snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), 0),
+    ).annotate(stock_at=F('snapshot_quantity') + Coalesce(Subquery(later), 0))
+
+
+def stock_at(product, when):
+    return with_stock_at(Goods.objects.filter(pk=product.pk), when).values_list('stock_at', flat=True).get()
+
+
+# A product's stock over (start, end]: returns (opening, entries, closing). Entries are dicts with
+# at, kind, change and the quantity after it, oldest first. Where compaction has folded movements
+# into a snapshot, the snapshot appears as an entry of kind 'snapshot' with the net change.
+def history(product, start, end):
+    opening = stock_at(product, start)
+    events = [
+        (movement.created_at, 0, movement.kind, movement.quantity)
+        for movement in product.movements.filter(created_at__gt=start, created_at__lte=end)
+    ] + [
+        # A snapshot includes the movements at its own timestamp, so it sorts after them
+        (snapshot.taken_at, 1, 'snapshot', snapshot.quantity)
+        for snapshot in product.snapshots.filter(taken_at__gt=start, taken_at__lte=end)
+    ]
+    entries, quantity = [], opening
+    for at, is_snapshot, kind, value in sorted(events, key=lambda event: event[:2]):
+        change = value - quantity if is_snapshot else value
+        if not change:
+            continue
+        quantity += change
+        entries.append({'at': at, 'kind': kind, 'change': change, 'quantity': quantity})
+    return opening, entries, quantity
+
+
+# Snapshot every product (or those in `goods`) that moved since its latest snapshot, as of `at`
+# (by default SNAPSHOT_SETTLE ago). Snapshots are computed from the ledger. Returns rows written.
+def take_snapshots(at=None, goods=None, batch_size=SNAPSHOT_BATCH_SIZE):
+    at = at or timezone.now() - SNAPSHOT_SETTLE
+    goods = Goods.objects.all() if goods is None else goods
+    moved = StockMovement.objects.filter(
+        goods=OuterRef('pk'), created_at__gt=OuterRef('snapshot_at'), created_at__lte=at,
+    )
+    written, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                with_stock_at(goods.filter(pk__gt=last_id), at)
+                .filter(Exists(moved))
+                .order_by('pk')
+                .values_list('pk', 'stock_at')[:batch_size]
+            )
+            if not rows:
+                return written
+            StockSnapshot.objects.bulk_create(
+                (StockSnapshot(goods_id=pk, taken_at=at, quantity=quantity) for pk, quantity in rows),
+                ignore_conflicts=True,
+            )
+        written += len(rows)
+        last_id = rows[-1][0]
+
+
+# Fold every movement at or before `before` into snapshots taken at `before`, then delete those
+# movements. Stock at any later moment is unchanged; earlier moments are answered at snapshot
+# granularity. Returns (snapshots written, movements deleted).
+def compact(before, batch_size=SNAPSHOT_BATCH_SIZE):
+    # Issues about to be deleted must be counted in the daily consumption first
+    record_consumption(until=before, batch_size=batch_size)
+    written = deleted = 0
+    last_id = 0
+    while True:
+        ids = list(
+            StockMovement.objects.filter(created_at__lte=before, goods_id__gt=last_id)
+            .order_by('goods_id')
+            .values_list('goods_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not ids:
+            return written, deleted
+        with transaction.atomic():
+            written += take_snapshots(at=before, goods=Goods.objects.filter(pk__in=ids), batch_size=batch_size)
+            deleted += StockMovement.objects.filter(goods_id__in=ids, created_at__lte=before).delete()[0]
+        last_id = ids[-1]
+
+
+# Add units to DailyConsumption rows, creating them as needed, with one upsert per row
+# ({(goods id, day): units}). The addition happens in SQL, so it holds up against other writers.
+def _add_consumption(totals):
+    quote = connection.ops.quote_name
+    table = quote(DailyConsumption._meta.db_table)
+    goods, day, quantity = (
+        quote(DailyConsumption._meta.get_field(name).column) for name in ('goods', 'day', 'quantity')
+    )
+    day_field = DailyConsumption._meta.get_field('day')
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({goods}, {day}, {quantity}) VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({goods}, {day}) DO UPDATE SET {quantity} = {table}.{quantity} + excluded.{quantity}",
+            [
+                (goods_id, day_field.get_db_prep_save(when, connection), units)
+                for (goods_id, when), units in totals.items()
+            ],
+        )
+
+
+# Fold the issues recorded since the last run into DailyConsumption (units sent out per product
+# and day), batch_size movements per transaction. Like snapshots it stops SNAPSHOT_SETTLE ago by
+# default, so movements still being committed are not passed over. Returns the movements read.
+def record_consumption(until=None, batch_size=SNAPSHOT_BATCH_SIZE):
+    until = until or timezone.now() - SNAPSHOT_SETTLE
+    cursor, _ = ChangeCursor.objects.get_or_create(name=CONSUMPTION_CURSOR, defaults={'position': _BEGINNING})
+    read = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockMovement.objects.filter(
+                    kind=StockMovement.ISSUE, created_at__gte=cursor.position, created_at__lte=until,
+                )
+                .exclude(created_at=cursor.position, id__lte=cursor.last_id)
+                .order_by('created_at', 'id')
+                .values_list('id', 'goods_id', 'created_at', 'quantity')[:batch_size]
+            )
+            if not rows:
+                return read
+            totals = Counter()
+            for _, goods_id, created_at, quantity in rows:
+                # Issues are recorded as negative quantities
+                totals[goods_id, timezone.localdate(created_at)] -= quantity
+            _add_consumption(totals)
+            last_id, _, position, _ = rows[-1]
+            ChangeCursor.objects.filter(pk=cursor.pk).update(
+                position=position, last_id=last_id, updated_at=timezone.now(),
+            )
+        cursor.position, cursor.last_id = position, last_id
+        read += len(rows)
+        if len(rows) < batch_size:
+            return read
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory
+from django.urls import reverse
+
+from supply_chain_app.synthetic import synthetic_barcode
+
+BENCH_PREFIX = 'bench'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent barcode lookups (api_barcode_lookup) served by sync workers (the WSGI "
+        "handler on a pool of threads, one request per thread) against the ASGI handler on one "
+        "event loop with the same number of requests in flight. Runs against a temporary "
+        "database of generated data and reports requests/s and latency per concurrency level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=10_000, help="Goods generated for the benchmark user.")
+        parser.add_argument('--requests', type=int, default=2_000, help="Lookups per mode and concurrency level.")
+        parser.add_argument(
+            '--concurrency', type=int, action='append',
+            help="Worker threads (sync) / requests in flight (async); repeatable. Default 1, 8 and 32.",
+        )
+        parser.add_argument(
+            '--distinct', type=int, default=500,
+            help="Distinct barcodes looked up; repeats are answered from the lookup cache.",
+        )
+        # Internal: the measurement runs in a child process using the temporary database
+        parser.add_argument('--run', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        options['concurrency'] = options['concurrency'] or [1, 8, 32]
+        if options['run']:
+            self.stdout.write(json.dumps(self.run(options)))
+            return
+
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'SUPPLYCHAIN_DB_PATH': os.path.join(tmp, 'bench.sqlite3')}
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            self.stdout.write(f"Migrating and generating {options['goods']} goods...")
+            subprocess.run(manage + ['migrate', '-v', '0'], env=env, check=True)
+            subprocess.run(
+                manage + ['generate_fixture_data', '--prefix', BENCH_PREFIX, '--goods', str(options['goods'])],
+                env=env, check=True, stdout=subprocess.DEVNULL,
+            )
+            command = manage + [
+                'bench_async_lookups', '--run', '--goods', str(options['goods']),
+                '--requests', str(options['requests']), '--distinct', str(options['distinct']),
+            ]
+            for level in options['concurrency']:
+                command += ['--concurrency', str(level)]
+            child = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE, text=True)
+
+        rows = json.loads(child.stdout)
+        self.stdout.write(f"\n{'mode':<7}{'concurrency':>12}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['mode']:<7}{row['concurrency']:>12}{row['rps']:>10.1f}"
+                f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['errors']:>8}"
+            )
+
+    # Child process: time both handlers at every concurrency level
+    def run(self, options):
+        user = User.objects.get(username=f'{BENCH_PREFIX}-0')
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+        # Log in once and send the session cookie with every request
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        random.seed(0)
+        working_set = [synthetic_barcode(random.randrange(options['goods'])) for _ in range(options['distinct'])]
+        paths = [reverse('api_barcode_lookup', args=[random.choice(working_set)]) for _ in range(options['requests'])]
+
+        rows = []
+        for level in options['concurrency']:
+            rows.append(self.summarize('sync', level, *self.run_sync(paths, cookie, level)))
+            rows.append(self.summarize('async', level, *asyncio.run(self.run_async(paths, cookie, level))))
+        return rows
+
+    def run_sync(self, paths, cookie, workers):
+        factory = RequestFactory(HTTP_COOKIE=cookie)
+        handler = WSGIHandler()
+
+        def lookup(path):
+            status = []
+            started = time.perf_counter()
+            response = handler(factory.get(path).environ, lambda code, headers, exc_info=None: status.append(code))
+            b''.join(response)
+            response.close()  # fires request_finished, which closes the thread's connection
+            return time.perf_counter() - started, status[0].startswith('200')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lookup, paths))
+        return results, time.perf_counter() - started
+
+    async def run_async(self, paths, cookie, in_flight):
+        handler = ASGIHandler()
+        limit = asyncio.Semaphore(in_flight)
+        headers = [(b'cookie', cookie.encode()), (b'host', b'testserver')]
+
+        async def lookup(path):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            finished = asyncio.Event()
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    finished.set()
+
+            async with limit:
+                started = time.perf_counter()
+                await handler(scope, receive, send)
+                return time.perf_counter() - started, status[0] == 200
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(lookup(path) for path in paths))
+        return results, time.perf_counter() - started
+
+    def summarize(self, mode, level, results, elapsed):
+        timings = sorted(seconds for seconds, ok in results if ok)
+        return {
+            'mode': mode,
+            'concurrency': level,
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings) * 1000, 3) if timings else 0,
+            'p95_ms': round(timings[int(len(timings) * 0.95)] * 1000, 3) if timings else 0,
+            'errors': sum(not ok for _, ok in results),
+        }
@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from supply_chain_app import barcodes
+from supply_chain_app.models import Goods
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark cold (database) against warm (in-process cache) barcode lookups. "
+        "Seeds a throwaway user inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=1_000_000, help="Products to seed.")
+        parser.add_argument('--lookups', type=int, default=2_000, help="Lookups per phase.")
+        parser.add_argument(
+            '--distinct', type=int, default=500,
+            help="Distinct barcodes scanned (the station's working set; keep within the cache size).",
+        )
+        parser.add_argument('--batch-size', type=int, default=10_000, help="bulk_create batch size.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['goods'], options['lookups'], options['distinct'], options['batch_size'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def run(self, total, lookups, distinct, batch_size):
+        user = User.objects.create_user(username=f'bench-{time.time_ns()}')
+
+        self.stdout.write(f"Seeding {total} goods...")
+        started = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            Goods.objects.bulk_create(
+                Goods(user=user, name=f'Item {i}', quantity=1, barcode=f'{i:013d}')
+                for i in range(offset, min(offset + batch_size, total))
+            )
+        self.stdout.write(f"  seeded in {time.perf_counter() - started:.1f}s")
+
+        working_set = [f'{random.randrange(total):013d}' for _ in range(distinct)]
+        sample = [random.choice(working_set) for _ in range(lookups)]
+        barcodes.lookup_cache.clear()
+
+        # Cold: every lookup goes to the database through the (user, barcode) index
+        cold = self.time_lookups(user, sample, use_cache=False)
+
+        # Warm: prime the cache once, then measure repeat scans
+        for barcode in working_set:
+            barcodes.lookup(user, barcode)
+        warm = self.time_lookups(user, sample, use_cache=True)
+
+        self.report('cold', cold)
+        self.report('warm', warm)
+        self.stdout.write(f"  speedup (mean): {statistics.mean(cold) / statistics.mean(warm):.0f}x")
+
+    def time_lookups(self, user, sample, use_cache):
+        timings = []
+        for barcode in sample:
+            started = time.perf_counter()
+            product = barcodes.lookup(user, barcode, use_cache=use_cache)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+            assert product is not None
+        return timings
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f"  {label}: mean {statistics.mean(timings):.1f}us  "
+            f"p50 {statistics.median(timings):.1f}us  p99 {p99:.1f}us"
+        )
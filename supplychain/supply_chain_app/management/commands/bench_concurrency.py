@@ -0,0 +1,185 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import got_request_exception
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from supply_chain_app.models import Category, Customer, Goods
+
+BENCH_USER = 'bench'
+
+PROFILES = ('default', 'production')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark parallel writers (barcode_scanner POSTs) and readers (dashboard GETs) against "
+        "each SQLite profile. Every profile runs in its own temporary database; requests go "
+        "through the full WSGI handler in separate processes, as they would behind a server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=PROFILES + ('both',), default='both')
+        parser.add_argument('--workers', type=int, default=8, help="Parallel client processes.")
+        parser.add_argument('--seconds', type=float, default=10.0, help="Measured duration.")
+        parser.add_argument('--scan-ratio', type=float, default=0.5, help="Share of requests that are scans.")
+        parser.add_argument('--goods', type=int, default=5_000, help="Products seeded before the run.")
+        # Internal: the phases run in child processes with the profile's settings
+        parser.add_argument('--seed', action='store_true', help='(internal)')
+        parser.add_argument('--worker', type=int, default=None, help='(internal)')
+        parser.add_argument('--start-at', type=float, default=0.0, help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            return self.seed(options['goods'])
+        if options['worker'] is not None:
+            return self.work(options)
+
+        profiles = PROFILES if options['profile'] == 'both' else (options['profile'],)
+        rows = [self.bench(profile, options) for profile in profiles]
+
+        self.stdout.write(
+            f"\n{'profile':<12}{'req/s':>9}{'scans/s':>9}{'views/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['profile']:<12}{row['rps']:>9.1f}{row['scans']:>9.1f}{row['views']:>9.1f}"
+                f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['errors']:>8}"
+            )
+        for row in rows:
+            for message, count in row['messages'].items():
+                self.stdout.write(f"  {row['profile']}: {count} x {message}")
+
+    # Run one profile in a fresh database and return its aggregated numbers
+    def bench(self, profile, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                'SUPPLYCHAIN_DB_PATH': os.path.join(tmp, 'bench.sqlite3'),
+                'SUPPLYCHAIN_DB_PROFILE': profile,
+            }
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            self.stdout.write(f"[{profile}] migrating and seeding {options['goods']} goods...")
+            subprocess.run(manage + ['migrate', '-v', '0'], env=env, check=True)
+            subprocess.run(manage + ['bench_concurrency', '--seed', '--goods', str(options['goods'])], env=env, check=True)
+
+            # Workers import Django at different speeds; they all start together at start_at
+            start_at = time.time() + 3 + options['workers'] * 0.2
+            self.stdout.write(f"[{profile}] {options['workers']} workers for {options['seconds']}s...")
+            workers = [
+                subprocess.Popen(
+                    manage + [
+                        'bench_concurrency', '--worker', str(index), '--start-at', str(start_at),
+                        '--seconds', str(options['seconds']), '--scan-ratio', str(options['scan_ratio']),
+                    ],
+                    env=env, stdout=subprocess.PIPE, text=True,
+                )
+                for index in range(options['workers'])
+            ]
+            results = [json.loads(worker.communicate()[0]) for worker in workers]
+
+        latencies = sorted(latency for result in results for latency in result['latencies'])
+        messages = {}
+        for result in results:
+            for message, count in result['messages'].items():
+                messages[message] = messages.get(message, 0) + count
+        seconds = options['seconds']
+        return {
+            'profile': profile,
+            'rps': sum(result['ok'] for result in results) / seconds,
+            'scans': sum(result['scans'] for result in results) / seconds,
+            'views': sum(result['views'] for result in results) / seconds,
+            'p50': statistics.median(latencies) * 1000 if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+            'errors': sum(result['errors'] for result in results),
+            'messages': messages,
+        }
+
+    def seed(self, total):
+        user = User.objects.create_user(username=BENCH_USER, password=get_random_string(20))
+        categories = Category.objects.bulk_create(Category(user=user, name=f'Category {i}') for i in range(20))
+        customers = Customer.objects.bulk_create(Customer(user=user, name=f'Customer {i}') for i in range(20))
+        Goods.objects.bulk_create(
+            (
+                Goods(
+                    user=user, name=f'Item {i}', quantity=i % 50, price=i % 100,
+                    category=categories[i % 20], customer=customers[i % 20], barcode=f'9{i:012d}',
+                )
+                for i in range(total)
+            ),
+            batch_size=1000,
+        )
+
+    # One client process: alternate scans and dashboard views until the time is up
+    def work(self, options):
+        user = User.objects.get(username=BENCH_USER)
+        category_ids = list(Category.objects.filter(user=user).values_list('id', flat=True))
+        customer_ids = list(Customer.objects.filter(user=user).values_list('id', flat=True))
+
+        # Log in once, then send the session and a CSRF token with every request
+        client = Client()
+        client.force_login(user)
+        csrf = get_random_string(32)
+        cookies = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; " \
+                  f"{settings.CSRF_COOKIE_NAME}={csrf}"
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        factory = RequestFactory(HTTP_COOKIE=cookies)
+        handler = WSGIHandler()
+        scanner_url, dashboard_url = reverse('barcode_scanner'), reverse('dashboard')
+
+        messages = {}
+
+        def record(sender, request=None, **kwargs):
+            error = str(sys.exc_info()[1])
+            messages[error] = messages.get(error, 0) + 1
+        got_request_exception.connect(record)
+
+        result = {'ok': 0, 'errors': 0, 'scans': 0, 'views': 0, 'latencies': []}
+        time.sleep(max(0.0, options['start_at'] - time.time()))
+        deadline = time.time() + options['seconds']
+        count = 0
+        while time.time() < deadline:
+            scan = random.random() < options['scan_ratio']
+            if scan:
+                count += 1
+                request = factory.post(scanner_url, {
+                    'csrfmiddlewaretoken': csrf,
+                    'barcode': f"8{options['worker']:03d}{count:09d}",
+                    'name': f"Scanned {count}",
+                    'quantity': 1,
+                    'price': '2.50',
+                    'description': 'Received at dock',
+                    'category': random.choice(category_ids),
+                    'customer': random.choice(customer_ids),
+                })
+            else:
+                request = factory.get(dashboard_url)
+
+            status = []
+            started = time.perf_counter()
+            response = handler(request.environ, lambda code, headers, exc_info=None: status.append(code))
+            b''.join(response)
+            response.close()  # fires request_finished, which closes or keeps the connection
+            elapsed = time.perf_counter() - started
+
+            if status[0].startswith(('200', '302')):
+                result['ok'] += 1
+                result['scans' if scan else 'views'] += 1
+                result['latencies'].append(elapsed)
+            else:
+                result['errors'] += 1
+
+        result['messages'] = messages
+        self.stdout.write(json.dumps(result))
@@ -0,0 +1,148 @@
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from statistics import NormalDist
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from supply_chain_app import forecast
+from supply_chain_app.models import DailyConsumption, Goods
+
+BENCH_PREFIX = 'bench'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the nightly demand forecast (forecast.run) over --goods products with --days of "
+        "generated daily consumption, against a temporary database. Also times the same "
+        "arithmetic written as a Python loop over products, for comparison with the NumPy version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=100_000, help="Products generated.")
+        parser.add_argument('--days', type=int, default=forecast.HISTORY_DAYS, help="Days of consumption generated.")
+        parser.add_argument(
+            '--sales-rate', type=float, default=0.3, help="Share of days on which a product is issued at all.",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        # Internal: the measurement runs in a child process using the temporary database
+        parser.add_argument('--run', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if forecast.np is None:
+            raise CommandError("Demand forecasting requires the numpy package.")
+        if options['run']:
+            self.stdout.write(json.dumps(self.run(options)))
+            return
+
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'SUPPLYCHAIN_DB_PATH': os.path.join(tmp, 'bench.sqlite3')}
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            self.stdout.write(
+                f"Migrating and generating {options['goods']} goods and {options['days']} days of consumption..."
+            )
+            subprocess.run(manage + ['migrate', '-v', '0'], env=env, check=True)
+            subprocess.run(
+                manage + ['generate_fixture_data', '--prefix', BENCH_PREFIX, '--goods', str(options['goods'])],
+                env=env, check=True, stdout=subprocess.DEVNULL,
+            )
+            command = manage + [
+                'bench_forecast', '--run', '--goods', str(options['goods']), '--days', str(options['days']),
+                '--sales-rate', str(options['sales_rate']), '--seed', str(options['seed']),
+            ]
+            child = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE, text=True)
+
+        result = json.loads(child.stdout)
+        self.stdout.write(
+            f"\n{result['products']} products, {result['consumption_rows']} consumption rows, "
+            f"{result['suggestions']} suggestions"
+        )
+        self.stdout.write(f"{'forecast.run() in total':<36}{result['run_s']:>9.2f}s")
+        self.stdout.write(f"{'  arithmetic (NumPy, all at once)':<36}{result['vectorized_s']:>9.3f}s")
+        self.stdout.write(f"{'  same arithmetic, Python loop':<36}{result['loop_s']:>9.3f}s")
+
+    # Child process: generate consumption, then time the forecast
+    def run(self, options):
+        np = forecast.np
+        generator = np.random.default_rng(options['seed'])
+        today = timezone.localdate()
+        ids = np.array(Goods.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+        # Backdate the products so the whole history counts
+        Goods.objects.update(date_added=timezone.now() - timedelta(days=options['days'] + 1))
+
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(DailyConsumption._meta.get_field(name).column) for name in ('goods', 'day', 'quantity'))
+        insert = f"INSERT INTO {quote(DailyConsumption._meta.db_table)} ({columns}) VALUES (%s, %s, %s)"
+
+        # Each product gets its own rate of units per selling day
+        rates = generator.gamma(2.0, 3.0, len(ids))
+        rows = 0
+        for offset in range(1, options['days'] + 1):
+            sold = generator.random(len(ids)) < options['sales_rate']
+            units = generator.poisson(rates[sold]) + 1
+            day = today - timedelta(days=offset)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(insert, [
+                    (goods_id, day.isoformat(), quantity)
+                    for goods_id, quantity in zip(ids[sold].tolist(), units.tolist())
+                ])
+            rows += int(sold.sum())
+
+        started = time.perf_counter()
+        products, suggestions = forecast.run(today)
+        run_seconds = time.perf_counter() - started
+
+        start = today - timedelta(days=forecast.HISTORY_DAYS)
+        ids, _, on_hand, minimum_order, first_day = forecast._load_products(start)
+        demand = forecast._load_demand(ids, start)
+        started = time.perf_counter()
+        vectorized = forecast.forecast(demand, first_day, on_hand, minimum_order)
+        vectorized_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        looped = [
+            self.forecast_one(row, first, stock, minimum)
+            for row, first, stock, minimum in zip(
+                demand.tolist(), first_day.tolist(), on_hand.tolist(), minimum_order.tolist(),
+            )
+        ]
+        loop_seconds = time.perf_counter() - started
+        if not np.allclose(np.array(looped), np.column_stack(vectorized)):
+            raise CommandError("The Python loop and the NumPy forecast disagree.")
+
+        return {
+            'products': products,
+            'consumption_rows': rows,
+            'suggestions': suggestions,
+            'run_s': round(run_seconds, 3),
+            'vectorized_s': round(vectorized_seconds, 4),
+            'loop_s': round(loop_seconds, 4),
+        }
+
+    # forecast.forecast() for one product, written as plain Python loops
+    def forecast_one(self, demand, first_day, on_hand, minimum_order):
+        lead_time, review, smoothing = forecast.LEAD_TIME_DAYS, forecast.REVIEW_DAYS, forecast.SMOOTHING
+        days = demand[first_day:]
+        mean = sum(days) / max(len(days), 1)
+        level = mean
+        for units in days:
+            level = smoothing * units + (1 - smoothing) * level
+        spread = sum((units - mean) ** 2 for units in days) / max(len(days) - 1, 1)
+        safety_stock = self.units(NormalDist().inv_cdf(forecast.SERVICE_LEVEL) * math.sqrt(spread * lead_time))
+        reorder_point = self.units(level * lead_time + safety_stock)
+        target = level * (lead_time + review) + safety_stock
+        order = 0
+        if on_hand <= reorder_point and level > 0:
+            order = max(self.units(target - on_hand), max(minimum_order, 1))
+        return level, safety_stock, reorder_point, order
+
+    def units(self, value):
+        return math.ceil(round(value, 6))
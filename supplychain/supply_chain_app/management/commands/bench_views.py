@@ -0,0 +1,319 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from supply_chain_app import urls
+from supply_chain_app.metrics import RequestStats
+from supply_chain_app.models import Category, Customer, Goods, Job
+from supply_chain_app.pagination import goods_table_queryset, keyset_page
+from supply_chain_app.synthetic import synthetic_barcode
+
+BENCH_PREFIX = 'bench'
+
+# Where results are written when --output is not given; one file per commit
+RESULTS_DIR = settings.BASE_DIR / 'benchmarks'
+
+# One request of a scenario. Requests with anonymous=True are sent without logging in.
+Call = namedtuple('Call', ['method', 'path', 'data', 'extra', 'anonymous'], defaults=(None, {}, False))
+
+
+class Scenarios:
+    # One method per URL name in supply_chain_app/urls.py, returning the next request to time.
+    # Anything a request destroys is created here first, outside the measured time.
+    def __init__(self, user):
+        self.user = user
+        self.goods_ids = list(Goods.objects.filter(user=user).values_list('id', flat=True))
+        self.category_ids = list(Category.objects.filter(user=user).values_list('id', flat=True))
+        self.customer_ids = list(Customer.objects.filter(user=user).values_list('id', flat=True))
+        self.sequence = 0
+
+    def next_number(self):
+        self.sequence += 1
+        return self.sequence
+
+    def home(self):
+        return Call('get', reverse('home'))
+
+    def login(self):
+        return Call('get', reverse('login'), anonymous=True)
+
+    def signup(self):
+        return Call('get', reverse('signup'), anonymous=True)
+
+    def dashboard(self):
+        return Call('get', reverse('dashboard'))
+
+    def search_goods(self):
+        return Call('get', reverse('search_goods'), {'q': random.choice(('steel drill', 'pump', 'blue valve'))})
+
+    def edit_good(self):
+        return Call('get', reverse('edit_good', args=[random.choice(self.goods_ids)]))
+
+    def delete_good(self):
+        product = Goods.objects.create(user=self.user, name=f'Doomed {self.next_number()}', quantity=1)
+        return Call('post', reverse('delete_good', args=[product.pk]))
+
+    def category_list(self):
+        return Call('get', reverse('category_list'))
+
+    def delete_category(self):
+        category = Category.objects.create(user=self.user, name=f'Doomed {self.next_number()}')
+        return Call('post', reverse('delete_category', args=[category.pk]))
+
+    def goods_list(self):
+        return Call('get', reverse('goods_list'))
+
+    # The batch after the first page, as the infinite-scroll script asks for it
+    def goods_rows(self):
+        return Call('get', reverse('goods_rows'), {'after': keyset_page(goods_table_queryset(self.user)).next_cursor or ''})
+
+    def import_goods(self):
+        number = self.next_number()
+        rows = ''.join(f'Imported {number}-{i},{i},1.50,,,\n' for i in range(100))
+        upload = SimpleUploadedFile('goods.csv', f'name,quantity,price,description,category,customer\n{rows}'.encode())
+        return Call('post', reverse('import_goods'), {'file': upload})
+
+    def job_status(self):
+        job = Job.objects.create(user=self.user, kind='rebuild_rollups')
+        return Call('get', reverse('job_status', args=[job.pk]))
+
+    def export_data(self):
+        return Call('get', reverse('export_data', args=['goods', 'csv']))
+
+    def customer_list(self):
+        return Call('get', reverse('customer_list'))
+
+    def customer_rows(self):
+        first_page = keyset_page(Customer.objects.filter(user=self.user))
+        return Call('get', reverse('customer_rows'), {'after': first_page.next_cursor or ''})
+
+    def edit_customer(self):
+        return Call('get', reverse('edit_customer', args=[random.choice(self.customer_ids)]))
+
+    def delete_customer(self):
+        customer = Customer.objects.create(user=self.user, name=f'Doomed {self.next_number()}')
+        return Call('post', reverse('delete_customer', args=[customer.pk]))
+
+    def edit_category(self):
+        return Call('get', reverse('edit_category', args=[random.choice(self.category_ids)]))
+
+    def barcode_scanner(self):
+        return Call('get', reverse('barcode_scanner'))
+
+    def barcode_retrieve(self):
+        return Call('post', reverse('barcode_retrieve'), {'barcode': synthetic_barcode(random.randrange(len(self.goods_ids)))})
+
+    def metrics(self):
+        return Call('get', reverse('metrics'))
+
+    def api_scans(self):
+        scans = [{'barcode': synthetic_barcode(random.randrange(len(self.goods_ids)))} for _ in range(20)]
+        return Call('post', reverse('api_scans'), json.dumps({'scans': scans}), {'content_type': 'application/json'})
+
+    def api_goods_stock(self):
+        payload = {'delta': random.choice((-1, 1))}
+        return Call('post', reverse('api_goods_stock', args=[random.choice(self.goods_ids)]), json.dumps(payload), {'content_type': 'application/json'})
+
+    def api_barcode_lookup(self):
+        return Call('get', reverse('api_barcode_lookup', args=[synthetic_barcode(random.randrange(len(self.goods_ids)))]))
+
+    def api_barcode_decode(self):
+        # A blank frame: nothing is found, so every scanline is tried (the slowest case)
+        image = SimpleUploadedFile('frame.pgm', b'P5\n640 480\n255\n' + bytes([200]) * (640 * 480))
+        return Call('post', reverse('api_barcode_decode'), {'image': image})
+
+    def api_collection(self):
+        return Call('get', reverse('api_collection', args=['goods']), {'limit': 50})
+
+    def api_batch(self):
+        number = self.next_number()
+        payload = {'create': [{'name': f'Batch {number}-{i}'} for i in range(10)]}
+        return Call('post', reverse('api_batch', args=['categories']), json.dumps(payload), {'content_type': 'application/json'})
+
+    def api_item(self):
+        return Call('get', reverse('api_item', args=['goods', random.choice(self.goods_ids)]))
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every view in supply_chain_app/urls.py through the test client against a fresh "
+        "database of generated data. Reports p50/p95/p99 latency and SQL queries per view, saves "
+        "the results as JSON and, with --compare, flags regressions against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=10_000, help="Goods generated for the benchmark user.")
+        parser.add_argument('--iterations', type=int, default=30, help="Timed requests per view.")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per view first.")
+        parser.add_argument('--view', action='append', help="Only these URL names (repeatable).")
+        parser.add_argument('--output', help=f"JSON results file (default {RESULTS_DIR}/<commit>.json).")
+        parser.add_argument('--compare', help="Earlier results file to compare with.")
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help="Relative p95 slowdown reported as a regression (default 0.2 = 20%%).",
+        )
+        # Internal: the measurement runs in a child process using the temporary database
+        parser.add_argument('--run', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['run']:
+            self.stdout.write(json.dumps(self.run(options)))
+            return
+
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'SUPPLYCHAIN_DB_PATH': os.path.join(tmp, 'bench.sqlite3')}
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            self.stdout.write(f"Migrating and generating {options['goods']} goods...")
+            subprocess.run(manage + ['migrate', '-v', '0'], env=env, check=True)
+            subprocess.run(
+                manage + ['generate_fixture_data', '--prefix', BENCH_PREFIX, '--goods', str(options['goods'])],
+                env=env, check=True, stdout=subprocess.DEVNULL,
+            )
+            command = manage + [
+                'bench_views', '--run',
+                '--iterations', str(options['iterations']), '--warmup', str(options['warmup']),
+            ]
+            for name in options['view'] or ():
+                command += ['--view', name]
+            child = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE, text=True)
+
+        results = {
+            'commit': _git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'goods': options['goods'],
+            'iterations': options['iterations'],
+            'views': json.loads(child.stdout),
+        }
+        self.report(results['views'])
+
+        output = options['output'] or RESULTS_DIR / f"{results['commit']}.json"
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results written to {output}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError(f"{regressions} view(s) regressed against {baseline.get('commit', options['compare'])}.")
+
+    # Child process: time each view and return {url name: numbers}
+    def run(self, options):
+        user = User.objects.get(username=f'{BENCH_PREFIX}-0')
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        client, anonymous = Client(), Client()
+        client.force_login(user)
+        scenarios = Scenarios(user)
+        random.seed(0)
+
+        names = [pattern.name for pattern in urls.urlpatterns if pattern.name]
+        if options['view']:
+            unknown = set(options['view']) - set(names)
+            if unknown:
+                raise CommandError(f"Unknown URL names: {', '.join(sorted(unknown))}")
+            names = [name for name in names if name in options['view']]
+
+        results = {}
+        for name in names:
+            scenario = getattr(scenarios, name, None)
+            if scenario is None:
+                # A new URL without a scenario shows up in the report instead of being skipped silently
+                results[name] = {'error': 'no scenario'}
+                continue
+            for _ in range(options['warmup']):
+                self.request(client, anonymous, scenario())
+            timings, queries, query_time, statuses = [], [], [], Counter()
+            for _ in range(options['iterations']):
+                call = scenario()
+                elapsed, stats, status = self.request(client, anonymous, call)
+                timings.append(elapsed)
+                queries.append(stats.query_count)
+                query_time.append(stats.query_time)
+                statuses[status] += 1
+            timings.sort()
+            results[name] = {
+                'p50_ms': round(statistics.median(timings) * 1000, 3),
+                'p95_ms': round(_percentile(timings, 0.95) * 1000, 3),
+                'p99_ms': round(_percentile(timings, 0.99) * 1000, 3),
+                'mean_ms': round(statistics.mean(timings) * 1000, 3),
+                'queries': statistics.median(queries),
+                'query_ms': round(statistics.mean(query_time) * 1000, 3),
+                'status': {str(code): count for code, count in sorted(statuses.items())},
+            }
+        return results
+
+    # Send one request, reading streamed bodies to the end; returns (seconds, query stats, status)
+    def request(self, client, anonymous, call):
+        stats = RequestStats(keep_sql=False)
+        send = getattr(anonymous if call.anonymous else client, call.method)
+        started = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = send(call.path, call.data, **call.extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return time.perf_counter() - started, stats, response.status_code
+
+    def report(self, views):
+        self.stdout.write(f"\n{'view':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}  status")
+        for name, row in views.items():
+            if 'error' in row:
+                self.stdout.write(f"{name:<22}  {row['error']}")
+                continue
+            status = ' '.join(f'{code}x{count}' for code, count in row['status'].items())
+            self.stdout.write(
+                f"{name:<22}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+                f"{row['queries']:>9g}  {status}"
+            )
+
+    # Print per-view changes against a baseline; returns how many views regressed
+    def compare(self, baseline, results, threshold):
+        self.stdout.write(f"\nCompared with {baseline.get('commit', '?')} (p95 threshold {threshold:.0%}):")
+        regressions = 0
+        for name, row in results['views'].items():
+            before = baseline.get('views', {}).get(name)
+            if 'error' in row or not before or 'error' in before:
+                continue
+            change = row['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            notes = []
+            if change > threshold:
+                notes.append('slower')
+            if row['queries'] > before['queries']:
+                notes.append(f"queries {before['queries']:g} -> {row['queries']:g}")
+            if notes:
+                regressions += 1
+            self.stdout.write(
+                f"  {name:<22}{before['p95_ms']:>9.1f} -> {row['p95_ms']:>9.1f} ms ({change:+.0%})"
+                + (f"  REGRESSION: {', '.join(notes)}" if notes else '')
+            )
+        return regressions
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app import alerts
+
+
+class Command(BaseCommand):
+    help = (
+        "Open low-stock alerts for products at or below their reorder point and resolve those "
+        "restocked, looking only at products written since the last check. Run periodically "
+        "(e.g. from cron), or keep it running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=alerts.ALERT_BATCH_SIZE, help="Products evaluated per transaction.",
+        )
+        parser.add_argument('--every', type=float, help="Keep running, checking again every N seconds.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        while True:
+            run = alerts.evaluate(options['batch_size'])
+            if run.checked or not options['every']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Checked {run.checked} changed products: {run.opened} alerts opened, {run.resolved} resolved."
+                ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from supply_chain_app import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold stock movements older than --days into snapshots and delete them, so the ledger "
+        "stays bounded. Stock at earlier moments is then answered at snapshot granularity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Keep movements from the last N days.")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        before = timezone.now() - timedelta(days=options['days'])
+        written, deleted = ledger.compact(before)
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded {deleted} movements up to {before:%Y-%m-%d %H:%M} into {written} snapshots."
+        ))
@@ -0,0 +1,40 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app import exporter
+
+
+class Command(BaseCommand):
+    help = "Stream one user's goods or customers to a CSV or NDJSON file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exporter.DATASETS))
+        parser.add_argument('--user', required=True, help="Username whose data is exported.")
+        parser.add_argument('--format', choices=exporter.FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output.")
+        parser.add_argument('--output', help="File to write; defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=exporter.EXPORT_CHUNK_SIZE, help="Rows per fetch.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+
+        header, rows = exporter.DATASETS[options['dataset']]
+        chunks = exporter.stream(
+            header, rows(user, chunk_size=options['chunk_size']),
+            fmt=options['format'], compress=options['gzip'],
+        )
+
+        if options['output']:
+            with open(options['output'], 'wb') as target:
+                for chunk in chunks:
+                    target.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
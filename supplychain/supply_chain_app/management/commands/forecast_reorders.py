@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app import forecast, jobs, ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the latest stock issues into the daily consumption, forecast the demand of every "
+        "product and replace the reorder suggestions shown on the dashboard. Run nightly (e.g. from "
+        "cron), or with --queue to leave the work to the background workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true', help="Queue a job for run_workers instead of running now.")
+
+    def handle(self, *args, **options):
+        if forecast.np is None:
+            raise CommandError("Demand forecasting requires the numpy package.")
+        if options['queue']:
+            job = jobs.enqueue('forecast_reorders', unique=True)
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        started = time.perf_counter()
+        movements = ledger.record_consumption()
+        products, suggestions = forecast.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {movements} new issues and forecast {products} products: {suggestions} reorder "
+            f"suggestions in {time.perf_counter() - started:.1f}s."
+        ))
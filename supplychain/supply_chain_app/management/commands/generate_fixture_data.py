@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app.synthetic import DEFAULT_BATCH_SIZE, SyntheticData
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users with generated categories, customers and goods for load testing. "
+        "Users are named <prefix>-0, <prefix>-1, ... and share one password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--categories', type=int, default=20, help="Categories per user.")
+        parser.add_argument('--customers', type=int, default=50, help="Customers per user.")
+        parser.add_argument('--goods', type=int, default=10_000, help="Goods per user (millions are fine).")
+        parser.add_argument('--prefix', default='fixture', help="Username prefix.")
+        parser.add_argument('--password', default='fixture')
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="bulk_create batch size.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--users and --batch-size must be at least 1.")
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Users named {options['prefix']}-* already exist; choose another --prefix.")
+
+        started = time.perf_counter()
+
+        def progress(user, done):
+            if done % (options['batch_size'] * 10) == 0 or done == options['goods']:
+                self.stdout.write(f"  {user.username}: {done} goods ({time.perf_counter() - started:.1f}s)")
+
+        users = SyntheticData(
+            prefix=options['prefix'], password=options['password'],
+            seed=options['seed'], batch_size=options['batch_size'],
+        ).generate(options['users'], options['categories'], options['customers'], options['goods'], progress)
+
+        total = len(users) * options['goods']
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} users and {total} goods in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,54 @@
+import csv
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app.importer import COLUMNS, DEFAULT_BATCH_SIZE, GoodsImporter, iter_rows
+
+
+class Command(BaseCommand):
+    help = f"Import goods for one user from a CSV (or .xlsx) file. Columns: {', '.join(COLUMNS)}."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import.")
+        parser.add_argument('--user', required=True, help="Username that will own the goods.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per bulk insert.")
+        parser.add_argument(
+            '--no-create', action='store_true',
+            help="Reject rows naming an unknown category or customer instead of creating it.",
+        )
+        parser.add_argument('--errors', help="Write rejected rows (row, error) to this CSV file.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        importer = GoodsImporter(user, batch_size=options['batch_size'], create_missing=not options['no_create'])
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = importer.run(iter_rows(fileobj, options['path']))
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(['row', 'error'])
+                writer.writerows(result.errors)
+        else:
+            for row_number, message in result.errors[:20]:
+                self.stderr.write(f"row {row_number}: {message}")
+            if result.failed > 20:
+                self.stderr.write(f"... and {result.failed - 20} more (use --errors to save them all)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} goods in {elapsed:.1f}s; {result.failed} rows rejected."
+        ))
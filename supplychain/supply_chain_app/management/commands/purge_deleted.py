@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app import deletion
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove soft-deleted categories and customers together with their products, in short "
+        "batches of raw DELETEs. Run periodically (e.g. from cron), or keep it running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=deletion.PURGE_BATCH_SIZE, help="Products removed per transaction.",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.05, help="Seconds to wait between batches, leaving the database to requests.",
+        )
+        parser.add_argument('--every', type=float, help="Keep running, purging again every N seconds.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        while True:
+            owners, products = deletion.purge(options['batch_size'], options['pause'])
+            if owners or not options['every']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Purged {owners} deleted categories/customers and {products} products."
+                ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the inventory valuation rollups from the goods table (reconciliation)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this username's rollups.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            User = get_user_model()
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']!r} does not exist.")
+
+        written = rollups.rebuild(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup rows."))
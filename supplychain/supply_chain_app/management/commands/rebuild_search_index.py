@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from supply_chain_app.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the goods full-text search index from the goods table."
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write(self.style.WARNING(
+                "Full-text index not available on this database; search uses icontains instead."
+            ))
+            return
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} goods."))
@@ -0,0 +1,69 @@
+import signal
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers (imports, rollup rebuilds, purges). Starts --processes worker "
+        "processes, each claiming and running one job at a time, and restarts any that crash. "
+        "Ctrl+C or SIGTERM lets running jobs finish before exiting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Worker processes; 1 runs in this process.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due instead of waiting for more.")
+        parser.add_argument('--poll', type=float, default=jobs.POLL_INTERVAL, help="Seconds between looks at an empty queue.")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError("--processes must be at least 1.")
+        stop = threading.Event()
+        previous = {signum: signal.signal(signum, lambda *_: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.run(stop, options)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def run(self, stop, options):
+        if options['processes'] == 1:
+            ran = jobs.work(stop=stop, burst=options['burst'], poll=options['poll'])
+            self.stdout.write(f"Worker {jobs.worker_name()} ran {ran} jobs.")
+            return
+
+        # Separate processes rather than threads: jobs are CPU-bound Python and SQLite work, and
+        # each process gets its own database connection
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_workers',
+            '--processes', '1', '--poll', str(options['poll']),
+        ] + (['--burst'] if options['burst'] else [])
+        workers = [subprocess.Popen(command) for _ in range(options['processes'])]
+        self.stdout.write(f"Started {len(workers)} workers (Ctrl+C to stop).")
+
+        while workers:
+            stop.wait(1)
+            if stop.is_set():
+                # Ctrl+C already reached the whole process group; SIGTERM is passed on
+                for worker in workers:
+                    worker.send_signal(signal.SIGTERM)
+                for worker in workers:
+                    worker.wait()
+                break
+            for index, worker in enumerate(workers):
+                code = worker.poll()
+                if code is None:
+                    continue
+                if code != 0 and not options['burst']:
+                    self.stderr.write(f"Worker {worker.pid} exited with status {code}; restarting it.")
+                    workers[index] = subprocess.Popen(command)
+                else:
+                    workers[index] = None
+            workers = [worker for worker in workers if worker is not None]
+        self.stdout.write("Workers stopped.")
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import signal
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+from supply_chain_app.decoding import DECODE_MAX_IMAGE_SIZE
+
+server_logger = logging.getLogger('supply_chain_app.runasgi')
+
+# Largest request head (request line plus headers) accepted
+MAX_HEAD_SIZE = 64 * 1024
+
+# Largest request body accepted. Bodies are held in memory, so this is Django's limit on form
+# data plus room for one photo upload at the largest size the barcode views accept.
+MAX_BODY_SIZE = (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0) + DECODE_MAX_IMAGE_SIZE
+
+# Seconds an idle keep-alive connection is held open
+KEEP_ALIVE_TIMEOUT = 5.0
+
+# Seconds a request body may take to arrive in full; a client that stalls or trickles it is
+# answered 408 instead of holding the connection and its buffer
+BODY_TIMEOUT = 30.0
+
+REASONS = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 301: 'Moved Permanently', 302: 'Found',
+    304: 'Not Modified', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 408: 'Request Timeout', 409: 'Conflict', 411: 'Length Required', 412: 'Precondition Failed',
+    413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class BadRequest(Exception):
+    def __init__(self, status):
+        self.status = status
+
+
+class Connection:
+    # One HTTP/1.1 client connection: reads requests one after another (keep-alive) and hands each
+    # to the ASGI application. Request bodies must come with Content-Length.
+    def __init__(self, app, reader, writer):
+        self.app = app
+        self.reader = reader
+        self.writer = writer
+        self.client = writer.get_extra_info('peername')
+        self.server = writer.get_extra_info('sockname')
+
+    async def serve(self):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    return await self.reject(431)
+                try:
+                    scope, body, keep_alive = await self.parse(head)
+                except BadRequest as exc:
+                    return await self.reject(exc.status)
+                if not await self.run(scope, body, keep_alive):
+                    return
+        finally:
+            self.writer.close()
+
+    async def parse(self, head):
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise BadRequest(400)
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise BadRequest(400)
+
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise BadRequest(400)
+            headers.append((name.strip().lower().encode('latin-1'), value.strip().encode('latin-1')))
+        values = dict(headers)
+
+        if b'transfer-encoding' in values:
+            raise BadRequest(411)
+        # Only one plain Content-Length: with two, this server and a proxy in front of it could each
+        # believe a different one and disagree on where the next request starts
+        lengths = [value for name, value in headers if name == b'content-length']
+        if len(lengths) > 1 or not (lengths or [b'0'])[0].isdigit():
+            raise BadRequest(400)
+        length = int(lengths[0]) if lengths else 0
+        if length > MAX_BODY_SIZE:
+            raise BadRequest(413)
+        try:
+            body = await asyncio.wait_for(self.reader.readexactly(length), BODY_TIMEOUT) if length else b''
+        except asyncio.TimeoutError:
+            raise BadRequest(408)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            raise BadRequest(400)
+
+        connection = values.get(b'connection', b'').lower()
+        keep_alive = connection != b'close' if version == 'HTTP/1.1' else connection == b'keep-alive'
+
+        path, _, query = target.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.3'},
+            'http_version': version[5:],
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': headers,
+            'client': self.client[:2] if self.client else None,
+            'server': self.server[:2] if self.server else None,
+        }
+        return scope, body, keep_alive
+
+    # Answer one request; returns whether the connection can take another
+    async def run(self, scope, body, keep_alive):
+        disconnected = asyncio.get_running_loop().create_future()
+        sent_body = False
+        response = {'started': False, 'chunked': False, 'close': not keep_alive}
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # Nothing else is read from the socket during a request; the application only hears
+            # of a disconnect once the connection is dropped
+            return await disconnected
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = [(bytes(name).lower(), bytes(value)) for name, value in message.get('headers', [])]
+                names = {name for name, _ in headers}
+                unframed = b'content-length' not in names and scope['method'] != 'HEAD' and status not in (204, 304)
+                if unframed and scope['http_version'] == '1.0':
+                    # HTTP/1.0 has no chunked encoding: the body ends where the connection does
+                    response['close'] = True
+                elif unframed:
+                    response['chunked'] = True
+                    headers.append((b'transfer-encoding', b'chunked'))
+                if response['close']:
+                    headers.append((b'connection', b'close'))
+                elif scope['http_version'] == '1.0':
+                    headers.append((b'connection', b'keep-alive'))
+                lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}".encode('latin-1')]
+                lines += [name + b': ' + value for name, value in headers]
+                self.writer.write(b'\r\n'.join(lines) + b'\r\n\r\n')
+                response['started'] = True
+            elif message['type'] == 'http.response.body':
+                chunk = message.get('body', b'')
+                if response['chunked']:
+                    if chunk:
+                        self.writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    if not message.get('more_body', False):
+                        self.writer.write(b'0\r\n\r\n')
+                elif scope['method'] != 'HEAD':
+                    self.writer.write(chunk)
+                await self.writer.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        except ConnectionError:
+            return False  # the client went away mid-response
+        except Exception:
+            # Django answers errors in views itself; this is a failure outside them. Once the status
+            # line is out the response cannot be changed, so the connection is simply closed.
+            server_logger.exception("Error serving %s %s", scope['method'], scope['path'])
+            if not response['started']:
+                await self.reject(500)
+            return False
+        finally:
+            if not disconnected.done():
+                disconnected.set_result({'type': 'http.disconnect'})
+        if not response['started']:
+            server_logger.error("No response to %s %s", scope['method'], scope['path'])
+            await self.reject(500)
+            return False
+        return not response['close']
+
+    async def reject(self, status):
+        self.writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode()
+        )
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the site through its ASGI application on a single asyncio event loop, without "
+        "uvicorn or daphne. Async views (barcode scanning and lookups) then wait on the database "
+        "without holding a thread each; sync views run on Django's thread pool as usual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('addrport', nargs='?', default='127.0.0.1:8000', help="[address:]port to listen on.")
+        parser.add_argument('--backlog', type=int, default=1024, help="Listen queue length.")
+
+    def handle(self, *args, **options):
+        address, _, port = options['addrport'].rpartition(':')
+        if not port.isdigit():
+            raise CommandError(f"{options['addrport']!r} is not a valid port or address:port.")
+        address = address.strip('[]') or '127.0.0.1'
+
+        application = get_asgi_application()
+        if settings.DEBUG and 'django.contrib.staticfiles' in settings.INSTALLED_APPS:
+            # Like runserver, serve static files while developing
+            application = ASGIStaticFilesHandler(application)
+
+        try:
+            asyncio.run(self.serve(application, address, int(port), options['backlog']))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, application, address, port, backlog):
+        async def accept(reader, writer):
+            await Connection(application, reader, writer).serve()
+
+        server = await asyncio.start_server(accept, address, port, backlog=backlog, limit=MAX_HEAD_SIZE)
+        stop = asyncio.get_running_loop().create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+            except (NotImplementedError, RuntimeError):
+                pass  # not available on this platform; Ctrl+C still ends asyncio.run()
+
+        self.stdout.write(f"Serving ASGI on http://{address}:{port}/ (Ctrl+C to quit)")
+        async with server:
+            await stop
+        self.stdout.write("Stopped.")
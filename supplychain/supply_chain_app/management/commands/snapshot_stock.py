@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from supply_chain_app import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot the stock of every product that moved since its last snapshot (run periodically, "
+        "e.g. nightly). Point-in-time stock queries start from the nearest snapshot."
+    )
+
+    def handle(self, *args, **options):
+        written = ledger.take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} stock snapshots."))
@@ -0,0 +1,276 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import Template
+
+# Request metrics kept in process memory and served in Prometheus text format on /metrics.
+# Each server process keeps its own numbers; Prometheus adds them up across scrape targets.
+
+slow_request_logger = logging.getLogger('supply_chain_app.slow_requests')
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 10_000_000)
+
+# Statements listed in a slow-request log entry, slowest first
+SLOW_LOG_MAX_QUERIES = 20
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for labels, counts in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{_labels(self.labels, labels, [("le", _number(bound))])} {count}'
+            yield f'{self.name}_bucket{_labels(self.labels, labels, [("le", "+Inf")])} {counts[-2]}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_number(float(counts[-1]))}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {counts[-2]}'
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter(
+                'supplychain_requests_total', 'Requests by URL name, method and status code.',
+                ('view', 'method', 'status'),
+            )
+            self.latency = Histogram(
+                'supplychain_request_duration_seconds', 'Time spent handling a request.',
+                ('view', 'method'), LATENCY_BUCKETS,
+            )
+            self.queries = Histogram(
+                'supplychain_request_db_queries', 'SQL statements executed per request.',
+                ('view',), QUERY_COUNT_BUCKETS,
+            )
+            self.query_time = Counter(
+                'supplychain_db_query_seconds_total', 'Time spent executing SQL.', ('view',),
+            )
+            self.template_time = Counter(
+                'supplychain_template_render_seconds_total', 'Time spent rendering templates.', ('view',),
+            )
+            self.size = Histogram(
+                'supplychain_response_size_bytes', 'Response body size (streamed responses excluded).',
+                ('view',), SIZE_BUCKETS,
+            )
+
+    def record(self, view, method, status, stats, elapsed, size):
+        with self.lock:
+            self.requests.inc((view, method, str(status)))
+            self.latency.observe((view, method), elapsed)
+            self.queries.observe((view,), stats.query_count)
+            self.query_time.inc((view,), stats.query_time)
+            self.template_time.inc((view,), stats.template_time)
+            if size is not None:
+                self.size.observe((view,), size)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in (self.requests, self.latency, self.queries, self.query_time, self.template_time, self.size):
+                lines.append(f'# HELP {metric.name} {metric.documentation}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    # What one request spent on SQL and templates
+    def __init__(self, keep_sql):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = [] if keep_sql else None
+
+    # connection.execute_wrapper hook: times every statement the request runs
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.query_count += 1
+            self.query_time += elapsed
+            if self.statements is not None:
+                self.statements.append((elapsed, sql))
+
+
+# Stats of the request being handled. A context variable rather than a thread local: async views
+# render on the event loop thread and run their queries in a worker thread, and the variable
+# follows the request into both.
+_current = contextvars.ContextVar('metrics_request_stats', default=None)
+
+
+# Execute wrapper installed once on every database connection: times the statement for the
+# request being measured, if any
+def _timed_execute(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def _install_query_timer(connection, **kwargs):
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+# Connections opened from now on (including those of ASGI worker threads) time their queries
+connection_created.connect(_install_query_timer)
+
+
+# Time the top-level render of every Django template while a request is being measured.
+# Includes render through the same engine internally, so nested templates are not counted twice.
+def _install_template_timer():
+    if getattr(Template.render, '_metrics_timed', False):
+        return
+    render = Template.render
+
+    @functools.wraps(render)
+    def timed_render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return render(self, context, request)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - started
+
+    timed_render._metrics_timed = True
+    Template.render = timed_render
+
+
+class MetricsMiddleware:
+    # Records latency, SQL count/time, template time and response size per URL name.
+    # Requests slower than settings.METRICS_SLOW_REQUEST_SECONDS are logged with their SQL.
+    # Runs natively under both WSGI and ASGI, so async views are not pushed onto a thread.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # The connection may predate the connection_created hook (e.g. the test database)
+        _install_query_timer(connection)
+        stats, started, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, started, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def start(self):
+        slow_after = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+        stats = RequestStats(keep_sql=slow_after is not None)
+        return stats, time.perf_counter(), _current.set(stats)
+
+    def finish(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        registry.record(view, request.method, response.status_code, stats, elapsed, size)
+
+        slow_after = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+        if slow_after is not None and elapsed >= slow_after:
+            self.log_slow_request(request, view, elapsed, stats)
+        return response
+
+    def log_slow_request(self, request, view, elapsed, stats):
+        slowest = sorted(stats.statements, reverse=True)[:SLOW_LOG_MAX_QUERIES]
+        slow_request_logger.warning(
+            "Slow request %s %s (%s) took %.0f ms: %d queries in %.0f ms, templates %.0f ms\n%s",
+            request.method, request.get_full_path(), view, elapsed * 1000,
+            stats.query_count, stats.query_time * 1000, stats.template_time * 1000,
+            '\n'.join(f'  {seconds * 1000:8.1f} ms  {sql}' for seconds, sql in slowest),
+        )
+
+
+# Prometheus scrape endpoint; open to the addresses in settings.METRICS_ALLOWED_IPS and to staff
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0013_delete_customuser_category_user_customer_user_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['user', '-date_added', '-id'], name='goods_user_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Full-text index over goods name, description and category name (SQLite FTS5 only).
+# Other database backends skip this migration and search falls back to icontains.
+
+from django.db import migrations
+
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS supply_chain_app_goods_fts USING fts5(
+        name, description, category, user_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    # Keep the index in step with every write, including bulk_create and queryset.update()
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_goods_fts_ai
+    AFTER INSERT ON supply_chain_app_goods BEGIN
+        INSERT INTO supply_chain_app_goods_fts (rowid, name, description, category, user_id)
+        VALUES (
+            new.id, new.name, new.description,
+            COALESCE((SELECT name FROM supply_chain_app_category WHERE id = new.category_id), ''),
+            new.user_id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_goods_fts_au
+    AFTER UPDATE OF name, description, category_id, user_id ON supply_chain_app_goods BEGIN
+        DELETE FROM supply_chain_app_goods_fts WHERE rowid = old.id;
+        INSERT INTO supply_chain_app_goods_fts (rowid, name, description, category, user_id)
+        VALUES (
+            new.id, new.name, new.description,
+            COALESCE((SELECT name FROM supply_chain_app_category WHERE id = new.category_id), ''),
+            new.user_id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_goods_fts_ad
+    AFTER DELETE ON supply_chain_app_goods BEGIN
+        DELETE FROM supply_chain_app_goods_fts WHERE rowid = old.id;
+    END
+    """,
+    # A category rename must reach every product filed under it
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_category_fts_au
+    AFTER UPDATE OF name ON supply_chain_app_category BEGIN
+        UPDATE supply_chain_app_goods_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM supply_chain_app_goods WHERE category_id = new.id);
+    END
+    """,
+    # Index whatever is already in the table
+    """
+    INSERT INTO supply_chain_app_goods_fts (rowid, name, description, category, user_id)
+    SELECT g.id, g.name, g.description, COALESCE(c.name, ''), g.user_id
+    FROM supply_chain_app_goods g
+    LEFT JOIN supply_chain_app_category c ON c.id = g.category_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS supply_chain_app_category_fts_au",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_ad",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_au",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_ai",
+    "DROP TABLE IF EXISTS supply_chain_app_goods_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0014_goods_user_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def check_duplicate_barcodes(apps, schema_editor):
+    # Refuse to add the uniqueness constraint over conflicting data; list what needs fixing instead
+    Goods = apps.get_model('supply_chain_app', 'Goods')
+    duplicates = (
+        Goods.objects.exclude(barcode__in=['', '000000'])
+        .values('user_id', 'barcode')
+        .annotate(n=models.Count('id'))
+        .filter(n__gt=1)
+    )
+    if duplicates.exists():
+        listing = ', '.join(f"user {d['user_id']}: {d['barcode']} x{d['n']}" for d in duplicates[:20])
+        raise RuntimeError(f"Duplicate barcodes must be resolved before migrating ({listing}).")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0015_goods_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_barcodes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['user', 'barcode'], name='goods_user_barcode_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='goods',
+            constraint=models.UniqueConstraint(condition=models.Q(('barcode__in', ['', '000000']), _negated=True), fields=('user', 'barcode'), name='goods_unique_user_barcode'),
+        ),
+    ]
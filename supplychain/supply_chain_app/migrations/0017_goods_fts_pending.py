@@ -0,0 +1,124 @@
+# Replace the per-row FTS5 index triggers with a queue of changed goods ids.
+# Indexing one row per trigger call makes FTS5 flush on every statement, which dominated
+# bulk imports; the queue is applied in one INSERT ... SELECT by search.sync_pending().
+
+from django.db import migrations
+
+
+CREATE_SQL = [
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_ai",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_au",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_ad",
+    "DROP TRIGGER IF EXISTS supply_chain_app_category_fts_au",
+    """
+    CREATE TABLE IF NOT EXISTS supply_chain_app_goods_fts_pending (
+        goods_id integer NOT NULL PRIMARY KEY
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_goods_fts_ai
+    AFTER INSERT ON supply_chain_app_goods BEGIN
+        INSERT OR IGNORE INTO supply_chain_app_goods_fts_pending (goods_id) VALUES (new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_goods_fts_au
+    AFTER UPDATE OF name, description, category_id, user_id ON supply_chain_app_goods BEGIN
+        INSERT OR IGNORE INTO supply_chain_app_goods_fts_pending (goods_id) VALUES (new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_goods_fts_ad
+    AFTER DELETE ON supply_chain_app_goods BEGIN
+        INSERT OR IGNORE INTO supply_chain_app_goods_fts_pending (goods_id) VALUES (old.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS supply_chain_app_category_fts_au
+    AFTER UPDATE OF name ON supply_chain_app_category BEGIN
+        INSERT OR IGNORE INTO supply_chain_app_goods_fts_pending (goods_id)
+        SELECT id FROM supply_chain_app_goods WHERE category_id = new.id;
+    END
+    """,
+]
+
+# Back to the 0015 triggers, after applying whatever is still queued
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_ai",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_au",
+    "DROP TRIGGER IF EXISTS supply_chain_app_goods_fts_ad",
+    "DROP TRIGGER IF EXISTS supply_chain_app_category_fts_au",
+    """
+    DELETE FROM supply_chain_app_goods_fts
+    WHERE rowid IN (SELECT goods_id FROM supply_chain_app_goods_fts_pending)
+    """,
+    """
+    INSERT INTO supply_chain_app_goods_fts (rowid, name, description, category, user_id)
+    SELECT g.id, g.name, g.description, COALESCE(c.name, ''), g.user_id
+    FROM supply_chain_app_goods_fts_pending p
+    JOIN supply_chain_app_goods g ON g.id = p.goods_id
+    LEFT JOIN supply_chain_app_category c ON c.id = g.category_id
+    """,
+    "DROP TABLE IF EXISTS supply_chain_app_goods_fts_pending",
+    """
+    CREATE TRIGGER supply_chain_app_goods_fts_ai
+    AFTER INSERT ON supply_chain_app_goods BEGIN
+        INSERT INTO supply_chain_app_goods_fts (rowid, name, description, category, user_id)
+        VALUES (
+            new.id, new.name, new.description,
+            COALESCE((SELECT name FROM supply_chain_app_category WHERE id = new.category_id), ''),
+            new.user_id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER supply_chain_app_goods_fts_au
+    AFTER UPDATE OF name, description, category_id, user_id ON supply_chain_app_goods BEGIN
+        DELETE FROM supply_chain_app_goods_fts WHERE rowid = old.id;
+        INSERT INTO supply_chain_app_goods_fts (rowid, name, description, category, user_id)
+        VALUES (
+            new.id, new.name, new.description,
+            COALESCE((SELECT name FROM supply_chain_app_category WHERE id = new.category_id), ''),
+            new.user_id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER supply_chain_app_goods_fts_ad
+    AFTER DELETE ON supply_chain_app_goods BEGIN
+        DELETE FROM supply_chain_app_goods_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER supply_chain_app_category_fts_au
+    AFTER UPDATE OF name ON supply_chain_app_category BEGIN
+        UPDATE supply_chain_app_goods_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM supply_chain_app_goods WHERE category_id = new.id);
+    END
+    """,
+]
+
+
+def queue_fts_changes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def index_fts_changes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0016_goods_barcode_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_fts_changes, index_fts_changes),
+    ]
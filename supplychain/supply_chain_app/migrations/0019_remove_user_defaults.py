@@ -0,0 +1,37 @@
+# Drop the get_default_user_id default from the user foreign keys.
+# Django applies defaults in Python, so nothing changes in the database; altering the fields for
+# real would make SQLite rebuild the goods table (and drop its search triggers) for no reason.
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0018_inventory_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='category',
+                    name='user',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='categories_user', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='customer',
+                    name='user',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customers_user', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='goods',
+                    name='user',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goods_user', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
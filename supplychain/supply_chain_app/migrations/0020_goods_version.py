@@ -0,0 +1,52 @@
+# Row version for optimistic concurrency checks on full product edits.
+# On SQLite the column is added with ALTER TABLE ADD COLUMN: the default AddField would rebuild the
+# goods table, which is slow on large inventories and drops the full-text index triggers.
+
+from django.db import migrations, models
+
+
+def version_field():
+    field = models.PositiveIntegerField(default=0, db_default=0)
+    field.set_attributes_from_name('version')
+    return field
+
+
+def add_version(apps, schema_editor):
+    Goods = apps.get_model('supply_chain_app', 'Goods')
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE supply_chain_app_goods '
+            'ADD COLUMN "version" integer unsigned NOT NULL DEFAULT 0 CHECK ("version" >= 0)'
+        )
+    else:
+        schema_editor.add_field(Goods, version_field())
+
+
+def remove_version(apps, schema_editor):
+    Goods = apps.get_model('supply_chain_app', 'Goods')
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ALTER TABLE supply_chain_app_goods DROP COLUMN "version"')
+    else:
+        schema_editor.remove_field(Goods, version_field())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0019_remove_user_defaults'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_version, remove_version),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='goods',
+                    name='version',
+                    field=models.PositiveIntegerField(default=0, db_default=0),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def open_ledger(apps, schema_editor):
+    # Stock history starts now: one opening snapshot per existing product with its current quantity
+    Goods = apps.get_model('supply_chain_app', 'Goods')
+    StockSnapshot = apps.get_model('supply_chain_app', 'StockSnapshot')
+    now = schema_editor.connection.ops.adapt_datetimefield_value(timezone.now())
+    schema_editor.execute(
+        f"INSERT INTO {StockSnapshot._meta.db_table} (goods_id, taken_at, quantity) "
+        f"SELECT id, %s, quantity FROM {Goods._meta.db_table}",
+        [now],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0020_goods_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('issue', 'Issue'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='supply_chain_app.goods')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['goods', 'created_at'], name='movement_goods_time_idx'), models.Index(fields=['created_at'], name='movement_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='supply_chain_app.goods')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('goods', 'taken_at'), name='snapshot_goods_time_unique')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
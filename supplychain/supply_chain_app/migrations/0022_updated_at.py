@@ -0,0 +1,65 @@
+# Last-write timestamps on goods and customers, used to key cached table rows.
+# Existing rows start from date_added. As in 0020, the goods column is added with ALTER TABLE ADD
+# COLUMN on SQLite so the table (and its full-text index triggers) is not rebuilt.
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def updated_at_field():
+    field = models.DateTimeField(default=timezone.now)
+    field.set_attributes_from_name('updated_at')
+    return field
+
+
+def add_goods_updated_at(apps, schema_editor):
+    Goods = apps.get_model('supply_chain_app', 'Goods')
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE supply_chain_app_goods '
+            'ADD COLUMN "updated_at" datetime NOT NULL DEFAULT \'1970-01-01 00:00:00\''
+        )
+    else:
+        schema_editor.add_field(Goods, updated_at_field())
+
+
+def remove_goods_updated_at(apps, schema_editor):
+    Goods = apps.get_model('supply_chain_app', 'Goods')
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ALTER TABLE supply_chain_app_goods DROP COLUMN "updated_at"')
+    else:
+        schema_editor.remove_field(Goods, updated_at_field())
+
+
+def start_from_date_added(apps, schema_editor):
+    for name in ('Goods', 'Customer'):
+        model = apps.get_model('supply_chain_app', name)
+        model.objects.update(updated_at=models.F('date_added'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0021_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_goods_updated_at, remove_goods_updated_at),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='goods',
+                    name='updated_at',
+                    field=models.DateTimeField(auto_now=True),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(start_from_date_added, migrations.RunPython.noop),
+    ]
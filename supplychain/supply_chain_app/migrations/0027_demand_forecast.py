@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supply_chain_app', '0026_stock_alerts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumption', to='supply_chain_app.goods')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='consumption_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('goods', 'day'), name='consumption_goods_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_demand', models.FloatField()),
+                ('safety_stock', models.PositiveIntegerField()),
+                ('reorder_point', models.PositiveIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('goods', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestion', to='supply_chain_app.goods')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-quantity'], name='suggestion_user_qty_idx')],
+            },
+        ),
+    ]
@@ -1,24 +1,47 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()  # Get the custom User model if it's used, otherwise the default Django User model
 
-# Default user ID function
+# Barcode given to products that were saved without scanning one; never treated as a real code
+PLACEHOLDER_BARCODE = "000000"
+
+# Former default for the user foreign keys. It is no longer used as a default because it queried
+# the users table every time a model was instantiated; migration 0013 still refers to it.
 def get_default_user_id():
     # Return the first user's ID if users exist, otherwise return None
     return User.objects.first().id if User.objects.exists() else None
 
+# Default manager of the soft-deletable models: rows with deleted_at set are hidden everywhere and
+# stay in the table only until purge_deleted removes them
+class SoftDeleteManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+# Default manager of Goods: products whose category or customer was soft-deleted are hidden with it
+# (a CASCADE that has not happened yet), so deleting an owner never has to touch its products
+class GoodsManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(category__deleted_at__isnull=True, customer__deleted_at__isnull=True)
+
+
 # Category model to store product categories
 class Category(models.Model):
     name = models.CharField(max_length=100)  # The name of the category
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories_user', default=get_default_user_id)  # ForeignKey to the User model, ensures categories are linked to users
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories_user')  # ForeignKey to the User model, ensures categories are linked to users
+    deleted_at = models.DateTimeField(null=True, blank=True)  # Set when the category is deleted; purged later with its products
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()  # Includes soft-deleted rows
 
     def __str__(self):
         return self.name  # Return the name of the category for better representation in the admin or shell
 
 # Goods model to store products
 class Goods(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goods_user', default=get_default_user_id)  # ForeignKey to User, ensures the product belongs to a user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goods_user')  # ForeignKey to User, ensures the product belongs to a user
     name = models.CharField(max_length=255)  # The name of the product
     quantity = models.IntegerField()  # The quantity of the product in stock
     description = models.TextField(blank=True)  # A text field to describe the product
@@ -26,23 +49,264 @@ class Goods(models.Model):
     category = models.ForeignKey('Category', on_delete=models.CASCADE, null=True, blank=True, related_name='goods')  # ForeignKey to the Category model (can be blank or null)
     customer = models.ForeignKey('Customer', on_delete=models.CASCADE, null=True, blank=True, related_name='goods')  # ForeignKey to the Customer model (can be blank or null)
     date_added = models.DateTimeField(auto_now_add=True)  # Automatically records when the product was added
-    barcode = models.CharField(max_length=255, default="000000")  # Barcode for the product with a default value of "000000"
+    barcode = models.CharField(max_length=255, default=PLACEHOLDER_BARCODE)  # Barcode for the product with a default value of "000000"
+    version = models.PositiveIntegerField(default=0, db_default=0)  # Moves on with every write; full edits check it to detect concurrent changes
+    updated_at = models.DateTimeField(auto_now=True)  # Last write; cached table rows are keyed on it
+    reorder_point = models.PositiveIntegerField(null=True, blank=True)  # Stock at or below which the product is low; blank to not watch it
+    reorder_qty = models.PositiveIntegerField(null=True, blank=True)  # Quantity to order when it is low
+
+    objects = GoodsManager()
+    all_objects = models.Manager()  # Includes products of soft-deleted categories and customers
+
+    class Meta:
+        indexes = [
+            # Serves the newest-first keyset pagination on (date_added, id) per user
+            models.Index(fields=['user', '-date_added', '-id'], name='goods_user_date_id_idx'),
+            # Serves barcode lookups at the scanner
+            models.Index(fields=['user', 'barcode'], name='goods_user_barcode_idx'),
+            # Partial index holding only products at or below their reorder point: the database keeps
+            # it current on every write, and the low-stock panel reads it without scanning the rest
+            models.Index(
+                fields=['user', 'quantity'], condition=models.Q(quantity__lte=models.F('reorder_point')),
+                name='goods_low_stock_idx',
+            ),
+            # Serves the stock alert engine's change cursor (products written since its last run)
+            models.Index(fields=['updated_at', 'id'], name='goods_updated_id_idx'),
+        ]
+        constraints = [
+            # A real barcode identifies exactly one product per user; blank and placeholder codes may repeat
+            models.UniqueConstraint(
+                fields=['user', 'barcode'],
+                condition=~models.Q(barcode__in=['', PLACEHOLDER_BARCODE]),
+                name='goods_unique_user_barcode',
+            ),
+        ]
+
+    # Fields whose loaded values are remembered so rollups can apply the difference on save
+    ROLLUP_FIELDS = ('user_id', 'category_id', 'customer_id', 'quantity', 'price')
 
     def __str__(self):
         return self.name  # Return the name of the product for easy display in the admin or shell
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the row held when it was loaded (skipped when any of the fields is deferred)
+        if all(name in instance.__dict__ for name in cls.ROLLUP_FIELDS):
+            instance._rollup_loaded = instance.rollup_state()
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Every write of an existing row moves its version on, so an edit made from an older copy
+        # can be told apart (see stock.save_if_current)
+        if not self._state.adding:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, *({'version', 'updated_at'} - set(update_fields))]
+        super().save(*args, **kwargs)
+
+    def rollup_state(self):
+        # The values this product contributes to the inventory rollups
+        return tuple(getattr(self, name) for name in self.ROLLUP_FIELDS)
+
     def total_value(self):
         # Calculate and return the total value of the product (price * quantity)
         return self.price * self.quantity
 
 # Customer model to store customer details
 class Customer(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='customers_user', default=get_default_user_id)  # ForeignKey to User, ensures the customer belongs to a user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='customers_user')  # ForeignKey to User, ensures the customer belongs to a user
     name = models.CharField(max_length=100)  # Customer's name
     email = models.EmailField(blank=True)  # Customer's email (optional)
     phone = models.CharField(max_length=20, blank=True)  # Customer's phone number (optional)
     address = models.TextField(blank=True)  # Customer's address (optional)
     date_added = models.DateTimeField(auto_now_add=True)  # Automatically records when the customer was added
+    updated_at = models.DateTimeField(auto_now=True)  # Last write; cached table rows are keyed on it
+    deleted_at = models.DateTimeField(null=True, blank=True)  # Set when the customer is deleted; purged later with their products
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()  # Includes soft-deleted rows
+
+    class Meta:
+        indexes = [
+            # Serves the newest-first keyset pagination of the customer list
+            models.Index(fields=['user', '-date_added', '-id'], name='customer_user_date_id_idx'),
+        ]
 
     def __str__(self):
         return self.name  # Return the customer's name for easy display in the admin or shell
+
+
+# Shared columns of the inventory valuation rollups, kept up to date from Goods saves and deletes
+class InventoryRollup(models.Model):
+    sku_count = models.IntegerField(default=0)  # Number of products
+    unit_count = models.BigIntegerField(default=0)  # Sum of quantities
+    total_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)  # Sum of price * quantity
+    updated_at = models.DateTimeField(auto_now=True)  # Last time the rollup changed
+
+    class Meta:
+        abstract = True
+
+
+# Portfolio totals for one user
+class UserRollup(InventoryRollup):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='inventory_rollup')
+
+
+# Totals for the products filed under one category
+class CategoryRollup(InventoryRollup):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name='rollup')
+
+
+# Totals for the products linked to one customer
+class CustomerRollup(InventoryRollup):
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='rollup')
+
+
+# Append-only record of every change to a product's stock
+class StockMovement(models.Model):
+    RECEIPT = 'receipt'
+    ISSUE = 'issue'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (RECEIPT, 'Receipt'),  # Stock received (purchases, returns, opening stock)
+        (ISSUE, 'Issue'),  # Stock sent out
+        (ADJUSTMENT, 'Adjustment'),  # Corrections, e.g. a count entered on the edit form
+    ]
+
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='movements')  # The product whose stock changed
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)  # Why the stock changed
+    quantity = models.IntegerField()  # Signed change in stock (negative for issues)
+    created_at = models.DateTimeField(default=timezone.now)  # When the change happened
+
+    class Meta:
+        indexes = [
+            # Serves replaying one product's movements after a snapshot
+            models.Index(fields=['goods', 'created_at'], name='movement_goods_time_idx'),
+            # Serves compaction, which folds everything older than a cutoff
+            models.Index(fields=['created_at'], name='movement_time_idx'),
+        ]
+
+
+# A product's stock at one moment; point-in-time queries start from the nearest one
+class StockSnapshot(models.Model):
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='snapshots')  # The product
+    taken_at = models.DateTimeField()  # Includes every movement up to and including this moment
+    quantity = models.IntegerField()  # Stock at taken_at
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['goods', 'taken_at'], name='snapshot_goods_time_unique'),
+        ]
+
+
+# Units of a product sent out (issued) on one day, summed from the stock ledger by
+# ledger.record_consumption(). Unlike the movements it outlives ledger compaction; the demand
+# forecast reads it.
+class DailyConsumption(models.Model):
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='consumption')  # The product
+    day = models.DateField()  # Day of the issues (in TIME_ZONE)
+    quantity = models.PositiveIntegerField()  # Units issued that day
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['goods', 'day'], name='consumption_goods_day_unique'),
+        ]
+        indexes = [
+            # Serves the forecast, which reads a window of days for every product
+            models.Index(fields=['day'], name='consumption_day_idx'),
+        ]
+
+
+# A reorder proposed by the demand forecast (forecast.run) for a product expected to run short
+# within its lead time. Every run replaces all of them.
+class ReorderSuggestion(models.Model):
+    goods = models.OneToOneField(Goods, on_delete=models.CASCADE, related_name='reorder_suggestion')  # The product
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reorder_suggestions')  # Its owner
+    daily_demand = models.FloatField()  # Forecast units per day (exponentially smoothed)
+    safety_stock = models.PositiveIntegerField()  # Buffer for demand above the forecast during the lead time
+    reorder_point = models.PositiveIntegerField()  # Demand over the lead time plus the safety stock
+    quantity = models.PositiveIntegerField()  # Units to order
+    computed_at = models.DateTimeField()  # The forecast run that proposed it
+
+    class Meta:
+        indexes = [
+            # Serves a user's suggestions, largest order first
+            models.Index(fields=['user', '-quantity'], name='suggestion_user_qty_idx'),
+        ]
+
+
+# A product falling to its reorder point. Opened by the alert engine (alerts.evaluate) and resolved
+# once the product is restocked or no longer watched; at most one is open per product.
+class StockAlert(models.Model):
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='alerts')  # The product running low
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_alerts')  # Its owner
+    quantity = models.IntegerField()  # Stock when the alert was opened
+    reorder_point = models.PositiveIntegerField()  # Reorder point when the alert was opened
+    opened_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)  # Set once stock is back above the reorder point
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['goods'], condition=models.Q(resolved_at__isnull=True), name='alert_one_open_per_goods',
+            ),
+        ]
+        indexes = [
+            # Serves a user's open alerts, newest first
+            models.Index(
+                fields=['user', '-opened_at'], condition=models.Q(resolved_at__isnull=True), name='alert_user_open_idx',
+            ),
+        ]
+
+
+# How far an incremental engine has read a stream of changes: the (timestamp, id) of the last row it
+# handled. Lets it pick up only the rows written since its previous run.
+class ChangeCursor(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # The engine reading the changes
+    position = models.DateTimeField()  # Timestamp of the last row handled
+    last_id = models.BigIntegerField(default=0)  # Id of that row, breaking timestamp ties
+    updated_at = models.DateTimeField(auto_now=True)  # Last run
+
+
+# Background work (imports, rollup rebuilds, purges) queued for the run_workers processes
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (QUEUED, 'Queued'),  # Waiting for a worker (again, after a failed attempt that will be retried)
+        (RUNNING, 'Running'),  # Claimed by a worker
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),  # Out of attempts
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')  # Who asked for it; None for housekeeping
+    kind = models.CharField(max_length=50)  # Task name in the jobs registry
+    payload = models.JSONField(default=dict, blank=True)  # Keyword arguments for the task
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)  # Higher runs first
+    attempts = models.PositiveSmallIntegerField(default=0)  # Times a worker has claimed it
+    max_attempts = models.PositiveSmallIntegerField(default=3)  # Failed attempts before giving up
+    run_after = models.DateTimeField(default=timezone.now)  # Not claimed before this (retry backoff)
+    worker = models.CharField(max_length=100, blank=True)  # Worker running, or last to run, the job
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last sign of life from that worker
+    progress = models.PositiveIntegerField(default=0)  # Units of work done, e.g. rows imported
+    total = models.PositiveIntegerField(null=True, blank=True)  # Units expected, when known
+    message = models.CharField(max_length=255, blank=True)  # Short progress note for the status page
+    result = models.JSONField(null=True, blank=True)  # Whatever the task returned
+    error = models.TextField(blank=True)  # Traceback of the last failed attempt
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves claiming the next job: queued, highest priority, due, oldest first
+            models.Index(fields=['state', '-priority', 'run_after', 'id'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.state})'
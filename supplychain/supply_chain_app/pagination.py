@@ -0,0 +1,100 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Goods
+
+# Number of rows shown per page in the goods tables
+PAGE_SIZE = 50
+
+# Columns the goods tables actually render; everything else stays deferred
+GOODS_LIST_FIELDS = (
+    'id', 'name', 'quantity', 'description', 'price', 'date_added', 'updated_at', 'barcode',
+    'category__name', 'customer__name',
+)
+
+
+# Turn a row's (date_added, id) sort key into an opaque, URL-safe token
+def encode_cursor(date_added, pk):
+    raw = f"{date_added.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# Reverse encode_cursor; returns None for anything that is not a valid token
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        date_part, pk_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(pk_part)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    # One page of rows plus the cursors needed to move forwards and backwards
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+# Slice a queryset newest-first on (date_added, id) without OFFSET.
+# `after` moves to older rows, `before` moves back to newer rows.
+def keyset_page(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+
+    if before_key:
+        # Walk towards newer rows in ascending order, then flip for display
+        date_added, pk = before_key
+        rows = list(
+            queryset.filter(Q(date_added__gt=date_added) | Q(date_added=date_added, id__gt=pk))
+            .order_by('date_added', 'id')[:page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        if after_key:
+            date_added, pk = after_key
+            queryset = queryset.filter(Q(date_added__lt=date_added) | Q(date_added=date_added, id__lt=pk))
+        rows = list(queryset.order_by('-date_added', '-id')[:page_size + 1])
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_newer = after_key is not None
+
+    next_cursor = encode_cursor(rows[-1].date_added, rows[-1].pk) if rows and has_older else None
+    prev_cursor = encode_cursor(rows[0].date_added, rows[0].pk) if rows and has_newer else None
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+# Goods for one user with the FK columns joined in and only the rendered columns loaded
+def goods_table_queryset(user):
+    return (
+        Goods.objects.filter(user=user)
+        .select_related('category', 'customer')
+        .only(*GOODS_LIST_FIELDS)
+    )
+
@@ -0,0 +1,214 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragments, ledger, rollups
+from .barcodes import is_real_barcode, lookup_cache
+from .models import Category, Customer, Goods, StockMovement
+
+# Largest number of scans accepted in one batch
+SCAN_BATCH_LIMIT = 1000
+
+# Details a scan may carry for a barcode that is not in stock yet
+NEW_PRODUCT_FIELDS = ('name', 'price', 'description', 'category', 'customer')
+
+HIDDEN_PRODUCT_ERROR = "Belongs to a product whose category or customer was deleted"
+CONFLICT_ERROR = "Could not be saved because of a conflicting product"
+
+
+class ScanResult:
+    # Outcome of one scan, reported back in the order the scans were sent
+    def __init__(self, index, barcode):
+        self.index = index
+        self.barcode = barcode
+        self.status = 'error'
+        self.product_id = None
+        self.quantity = None
+        self.errors = {}
+
+    def as_dict(self):
+        data = {'index': self.index, 'barcode': self.barcode, 'status': self.status}
+        if self.errors:
+            data['errors'] = self.errors
+        else:
+            data['id'] = self.product_id
+            data['quantity'] = self.quantity
+        return data
+
+
+# Validate one scan; returns (barcode, quantity delta, new product details, errors)
+def _parse(scan):
+    if not isinstance(scan, dict):
+        return '', 0, {}, {'__all__': 'Each scan must be an object'}
+    errors = {}
+    barcode = str(scan.get('barcode') or '').strip()
+    if not is_real_barcode(barcode):
+        errors['barcode'] = 'A real barcode is required'
+    elif len(barcode) > 255:
+        errors['barcode'] = 'Barcode is longer than 255 characters'
+    quantity = scan.get('quantity', 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool):
+        errors['quantity'] = 'Must be a whole number'
+    details = {name: scan[name] for name in NEW_PRODUCT_FIELDS if scan.get(name) not in (None, '')}
+    return barcode, quantity, details, errors
+
+
+class ScanBatch:
+    # Applies a batch of (barcode, quantity delta) scans for one user in a single transaction:
+    # known barcodes get one UPDATE ... SET quantity = quantity + n per distinct n, unknown ones
+    # are created with one bulk insert. Bad scans are reported and skipped; the rest still apply.
+    def __init__(self, user):
+        self.user = user
+
+    def apply(self, scans):
+        results, parsed = [], []
+        for index, scan in enumerate(scans):
+            barcode, quantity, details, errors = _parse(scan)
+            result = ScanResult(index, barcode)
+            result.errors = errors
+            results.append(result)
+            if not errors:
+                parsed.append((result, quantity, details))
+
+        try:
+            self._apply(parsed)
+        except IntegrityError:
+            # Another writer created one of our new barcodes in the meantime; those barcodes now
+            # exist, so running the batch again turns them into increments
+            try:
+                self._apply(parsed)
+            except IntegrityError:
+                # Not a concurrent insert after all: apply barcode by barcode so only the scans of
+                # the conflicting ones fail
+                self._apply_each(parsed)
+        return results
+
+    def _apply_each(self, parsed):
+        by_barcode = defaultdict(list)
+        for item in parsed:
+            by_barcode[item[0].barcode].append(item)
+        for group in by_barcode.values():
+            try:
+                self._apply(group)
+            except IntegrityError:
+                for result, _, _ in group:
+                    result.status = 'error'
+                    result.errors = {'barcode': CONFLICT_ERROR}
+
+    def _apply(self, parsed):
+        deltas = defaultdict(int)
+        for result, quantity, _ in parsed:
+            result.errors = {}
+            deltas[result.barcode] += quantity
+
+        with transaction.atomic(), rollups.batched() as changes:
+            # Products hidden by a deleted category or customer keep their barcodes until purged:
+            # scans of them are refused rather than creating a duplicate or moving hidden stock
+            existing, hidden = {}, set()
+            for barcode, category_deleted, customer_deleted, *row in (
+                Goods.all_objects.filter(user=self.user, barcode__in=list(deltas))
+                .values_list(
+                    'barcode', 'category__deleted_at', 'customer__deleted_at', 'id', *Goods.ROLLUP_FIELDS,
+                )
+            ):
+                if category_deleted or customer_deleted:
+                    hidden.add(barcode)
+                else:
+                    existing[barcode] = row
+            for result, _, _ in parsed:
+                if result.barcode in hidden:
+                    result.errors = {'barcode': HIDDEN_PRODUCT_ERROR}
+
+            # Increments are grouped by size: a dock scanning one unit at a time issues one UPDATE
+            by_delta = defaultdict(list)
+            for barcode, (pk, *state) in existing.items():
+                if deltas[barcode]:
+                    by_delta[deltas[barcode]].append(pk)
+                    changes.adjust(state, deltas[barcode])
+            now = timezone.now()
+            for delta, ids in by_delta.items():
+                Goods.objects.filter(pk__in=ids).update(
+                    quantity=F('quantity') + delta, version=F('version') + 1, updated_at=now,
+                )
+            ledger.record_many((pk, deltas[barcode]) for barcode, (pk, *_) in existing.items())
+
+            created = self._create(
+                [
+                    (result, details) for result, _, details in parsed
+                    if result.barcode not in existing and result.barcode not in hidden
+                ],
+                deltas,
+            )
+            for obj in created.values():
+                changes.add(obj.rollup_state())
+            ledger.record_many(((obj.pk, obj.quantity) for obj in created.values()), StockMovement.RECEIPT)
+
+            quantities = dict(
+                Goods.objects.filter(pk__in=[row[0] for row in existing.values()])
+                .values_list('id', 'quantity')
+            )
+            for result, _, _ in parsed:
+                if result.errors:
+                    continue
+                if result.barcode in existing:
+                    result.status = 'updated'
+                    result.product_id = existing[result.barcode][0]
+                    result.quantity = quantities[result.product_id]
+                else:
+                    product = created[result.barcode]
+                    result.status = 'created'
+                    result.product_id = product.pk
+                    result.quantity = product.quantity
+
+        # Queryset updates and bulk inserts skip model signals
+        lookup_cache.invalidate_user(self.user.pk)
+        fragments.invalidate_user(self.user.pk)
+
+    # Build and bulk-insert products for unknown barcodes; the first scan of a barcode supplies its
+    # details. Returns {barcode: product}; scans of a barcode that cannot be created get its errors.
+    def _create(self, pending, deltas):
+        if not pending:
+            return {}
+        categories = set(Category.objects.filter(user=self.user).values_list('id', flat=True))
+        customers = set(Customer.objects.filter(user=self.user).values_list('id', flat=True))
+
+        products, failed = {}, {}
+        for result, details in pending:
+            barcode = result.barcode
+            if barcode in products:
+                continue
+            if barcode in failed:
+                result.errors = failed[barcode]
+                continue
+            errors = {}
+            name = str(details.get('name') or '').strip()
+            if not name:
+                errors['name'] = 'Required for a barcode that is not in stock yet'
+            try:
+                price = Decimal(str(details.get('price', '0'))).quantize(Decimal('0.01'))
+                if abs(price) >= Decimal('1e8'):
+                    raise InvalidOperation
+            except InvalidOperation:
+                errors['price'] = 'Must be a number'
+            for field, known in (('category', categories), ('customer', customers)):
+                value = details.get(field)
+                if value is not None and value not in known:
+                    errors[field] = f"Unknown {field} id {value!r}"
+            if errors:
+                result.errors = failed[barcode] = errors
+                continue
+            products[barcode] = Goods(
+                user=self.user,
+                barcode=barcode,
+                name=name[:255],
+                quantity=deltas[barcode],
+                price=price,
+                description=str(details.get('description') or ''),
+                category_id=details.get('category'),
+                customer_id=details.get('customer'),
+            )
+        Goods.objects.bulk_create(products.values())
+        return products
@@ -0,0 +1,211 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CategoryRollup, CustomerRollup, Goods, UserRollup
+
+# Which rollup each part of a product's rollup_state() feeds: (model, key field, index in the state)
+SCOPES = (
+    (UserRollup, 'user_id', 0),
+    (CategoryRollup, 'category_id', 1),
+    (CustomerRollup, 'customer_id', 2),
+)
+
+
+class Delta:
+    # Pending change to one rollup row
+    __slots__ = ('skus', 'units', 'value')
+
+    def __init__(self):
+        self.skus = 0
+        self.units = 0
+        self.value = Decimal('0')
+
+    def add(self, sign, quantity, price):
+        self.skus += sign
+        self.units += sign * quantity
+        self.value += sign * quantity * Decimal(str(price))
+
+    def __bool__(self):
+        return bool(self.skus or self.units or self.value)
+
+
+class RollupChanges:
+    # Collects per-row additions and removals, then writes one UPDATE per touched rollup row
+    def __init__(self):
+        self.deltas = {scope: defaultdict(Delta) for scope in SCOPES}
+
+    # state is a Goods.rollup_state() tuple: (user_id, category_id, customer_id, quantity, price)
+    def add(self, state, sign=1):
+        quantity, price = state[3] or 0, state[4] or 0
+        for scope in SCOPES:
+            key = state[scope[2]]
+            if key is not None:
+                self.deltas[scope][key].add(sign, quantity, price)
+
+    def remove(self, state):
+        self.add(state, sign=-1)
+
+    # Stock of an existing product changed by quantity units; its price and owners stay the same
+    def adjust(self, state, quantity):
+        for scope in SCOPES:
+            key = state[scope[2]]
+            if key is not None:
+                delta = self.deltas[scope][key]
+                delta.units += quantity
+                delta.value += quantity * Decimal(str(state[4] or 0))
+
+    # Take away totals (skus, units, value) summed over several products sharing one state's owners
+    def remove_totals(self, state, skus, units, value):
+        for scope in SCOPES:
+            key = state[scope[2]]
+            if key is not None:
+                delta = self.deltas[scope][key]
+                delta.skus -= skus
+                delta.units -= units
+                delta.value -= value
+
+    def apply(self):
+        now = timezone.now()
+        for (model, key_field, _), deltas in self.deltas.items():
+            for key, delta in deltas.items():
+                if delta:
+                    _apply_delta(model, key_field, key, delta, now)
+
+
+def _apply_delta(model, key_field, key, delta, now):
+    changes = {
+        'sku_count': F('sku_count') + delta.skus,
+        'unit_count': F('unit_count') + delta.units,
+        'total_value': F('total_value') + delta.value,
+        'updated_at': now,
+    }
+    if model.objects.filter(**{key_field: key}).update(**changes):
+        return
+    # Missing rollup rows are only created when stock is added; a removal with no row means the
+    # owner (a category or customer) is being deleted along with its rollup
+    if delta.skus < 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**{
+                key_field: key,
+                'sku_count': delta.skus,
+                'unit_count': delta.units,
+                'total_value': delta.value,
+            })
+    except IntegrityError:
+        # Created concurrently by another writer; fall back to the delta update
+        model.objects.filter(**{key_field: key}).update(**changes)
+
+
+_batch = threading.local()
+
+
+# Gather the rollup changes of many saves/deletes and write them once, when the block exits
+@contextmanager
+def batched():
+    if getattr(_batch, 'changes', None) is not None:
+        # Already inside a batch; the outer one applies everything
+        yield _batch.changes
+        return
+    _batch.changes = RollupChanges()
+    try:
+        yield _batch.changes
+        _batch.changes.apply()
+    finally:
+        _batch.changes = None
+
+
+# The batch collecting changes right now, or a fresh set applied by the caller
+def _current_changes():
+    changes = getattr(_batch, 'changes', None)
+    return (changes, False) if changes is not None else (RollupChanges(), True)
+
+
+# Old rollup_state() of a product about to be saved, or None when it is new
+def loaded_state(instance):
+    if instance._state.adding:
+        return None
+    state = getattr(instance, '_rollup_loaded', None)
+    if state is None:
+        state = (
+            Goods.objects.filter(pk=instance.pk)
+            .values_list(*Goods.ROLLUP_FIELDS)
+            .first()
+        )
+    return state
+
+
+# Apply the difference between a product's previous and current state
+def goods_saved(instance, previous):
+    current = instance.rollup_state()
+    if previous == current:
+        return
+    changes, apply_now = _current_changes()
+    if previous is not None:
+        changes.remove(previous)
+    changes.add(current)
+    if apply_now:
+        changes.apply()
+    instance._rollup_loaded = current
+
+
+def goods_deleted(instance):
+    changes, apply_now = _current_changes()
+    changes.remove(getattr(instance, '_rollup_loaded', None) or instance.rollup_state())
+    if apply_now:
+        changes.apply()
+
+
+# Take every product in the goods queryset out of the rollups with one grouped query, without
+# loading the products (for owners soft-deleted together with all their products)
+def goods_removed(goods):
+    owners = Goods.ROLLUP_FIELDS[:3]
+    changes, apply_now = _current_changes()
+    for row in goods.values(*owners).order_by().annotate(**_totals()):
+        changes.remove_totals(tuple(row[name] for name in owners), row['sku_count'], row['unit_count'], row['total_value'])
+    if apply_now:
+        changes.apply()
+
+
+# Aggregates matching the rollup columns
+def _totals():
+    value = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=2))
+    return {
+        'sku_count': Count('id'),
+        'unit_count': Coalesce(Sum('quantity'), 0),
+        'total_value': Coalesce(Sum(value), Decimal('0'), output_field=DecimalField(max_digits=20, decimal_places=2)),
+    }
+
+
+# Recompute every rollup from the goods table (optionally for one user) and return rows written
+@transaction.atomic
+def rebuild(user=None):
+    goods = Goods.objects.all()
+    if user is not None:
+        goods = goods.filter(user=user)
+    totals = _totals()
+
+    written = 0
+    for model, key_field, _ in SCOPES:
+        owner = key_field[:-len('_id')]
+        stale = model.objects.all()
+        if user is not None:
+            stale = stale.filter(**({'user': user} if owner == 'user' else {f'{owner}__user': user}))
+        stale.delete()
+
+        rows = (
+            goods.exclude(**{f'{key_field}__isnull': True})
+            .values(key_field)
+            .order_by()
+            .annotate(**totals)
+        )
+        written += len(model.objects.bulk_create(model(**row) for row in rows))
+    return written
@@ -0,0 +1,120 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# FTS5 table created by migration 0015 (SQLite only)
+FTS_TABLE = 'supply_chain_app_goods_fts'
+
+# Ids of goods written since the index was last synced; filled by triggers (migration 0017)
+PENDING_TABLE = 'supply_chain_app_goods_fts_pending'
+
+# Maximum number of ranked hits returned by the search page
+SEARCH_LIMIT = 100
+
+# bm25 column weights: name, description, category, user_id (unindexed)
+BM25_WEIGHTS = '10.0, 1.0, 4.0, 0.0'
+
+_fts_present = None
+
+
+# True when the goods full-text index exists on the current database
+def fts_enabled():
+    global _fts_present
+    if connection.vendor != 'sqlite':
+        return False
+    if _fts_present is None:
+        _fts_present = FTS_TABLE in connection.introspection.table_names()
+    return _fts_present
+
+
+# Apply queued goods changes to the index in one batch; cheap no-op when nothing is queued
+def sync_pending():
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM {PENDING_TABLE} LIMIT 1")
+        if cursor.fetchone() is None:
+            return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT goods_id FROM {PENDING_TABLE})")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category, user_id) "
+            "SELECT g.id, g.name, g.description, COALESCE(c.name, ''), g.user_id "
+            f"FROM {PENDING_TABLE} p "
+            "JOIN supply_chain_app_goods g ON g.id = p.goods_id "
+            "LEFT JOIN supply_chain_app_category c ON c.id = g.category_id"
+        )
+        cursor.execute(f"DELETE FROM {PENDING_TABLE}")
+
+
+# Turn free text into an FTS5 MATCH expression: every word must match as a prefix
+def build_match_query(query):
+    terms = re.findall(r'\w+', query or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+# Plain icontains filter used on backends without FTS5
+def _fallback_filter(query):
+    return (
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(category__name__icontains=query)
+    )
+
+
+# Narrow a goods queryset to rows matching the search text, keeping its ordering
+def filter_goods(queryset, user, query):
+    if not fts_enabled():
+        return queryset.filter(_fallback_filter(query))
+
+    match = build_match_query(query)
+    if not match:
+        return queryset.none()
+    sync_pending()
+    return queryset.filter(id__in=RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND user_id = %s",
+        (match, user.pk),
+    ))
+
+
+# Best matching goods for a user, most relevant first (bm25)
+def ranked_goods(queryset, user, query, limit=SEARCH_LIMIT):
+    if not fts_enabled():
+        return list(queryset.filter(_fallback_filter(query)).order_by('-date_added')[:limit])
+
+    match = build_match_query(query)
+    if not match:
+        return []
+    sync_pending()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND user_id = %s "
+            f"ORDER BY bm25({FTS_TABLE}, {BM25_WEIGHTS}) LIMIT %s",
+            (match, user.pk, limit),
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    # Fetch the rows in one query, then restore the rank order
+    goods = queryset.in_bulk(ids)
+    return [goods[pk] for pk in ids if pk in goods]
+
+
+# Drop and repopulate the whole index from the goods table; returns the number of rows indexed
+def rebuild_index():
+    if not fts_enabled():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"DELETE FROM {PENDING_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category, user_id) "
+            "SELECT g.id, g.name, g.description, COALESCE(c.name, ''), g.user_id "
+            "FROM supply_chain_app_goods g "
+            "LEFT JOIN supply_chain_app_category c ON c.id = g.category_id"
+        )
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
@@ -0,0 +1,58 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import choices, fragments, ledger, rollups
+from .barcodes import lookup_cache
+from .models import Category, Customer, Goods
+
+
+# Any product or category change can alter what a barcode scan shows, so drop that user's cached lookups
+@receiver(post_save, sender=Goods)
+@receiver(post_delete, sender=Goods)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_barcode_cache(sender, instance, **kwargs):
+    lookup_cache.invalidate_user(instance.user_id)
+
+
+# Category and customer dropdowns are cached per user; a new version makes them reload
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_choices(sender, instance, **kwargs):
+    choices.invalidate_user(instance.user_id)
+
+
+# The goods and customer tables show category and customer names, so any of the three changing
+# makes the user's cached list pages stale
+@receiver(post_save, sender=Goods)
+@receiver(post_delete, sender=Goods)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_list_pages(sender, instance, **kwargs):
+    fragments.invalidate_user(instance.user_id)
+
+
+# Keep the inventory rollups in step with every product save and delete
+@receiver(pre_save, sender=Goods)
+def remember_goods_state(sender, instance, **kwargs):
+    instance._rollup_previous = rollups.loaded_state(instance)
+
+
+@receiver(post_save, sender=Goods)
+def update_rollups_on_save(sender, instance, **kwargs):
+    rollups.goods_saved(instance, instance._rollup_previous)
+
+
+# Record stock changes made through save() in the stock movement ledger
+@receiver(post_save, sender=Goods)
+def record_stock_movement(sender, instance, **kwargs):
+    ledger.goods_saved(instance, instance._rollup_previous)
+
+
+@receiver(post_delete, sender=Goods)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.goods_deleted(instance)
@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragments, ledger, rollups
+from .barcodes import lookup_cache
+from .models import Goods
+
+
+class StockError(Exception):
+    pass
+
+
+class InsufficientStock(StockError):
+    # The adjustment would take the quantity below zero
+    pass
+
+
+class StaleVersion(StockError):
+    # The product changed after the copy being saved was read
+    pass
+
+
+# Add delta (negative to remove) to a product's stock in one UPDATE ... SET quantity = quantity + delta,
+# so concurrent adjustments from several stations never overwrite each other. With
+# allow_negative=False a removal larger than the stock on hand raises InsufficientStock and changes
+# nothing. The change is recorded in the ledger as `kind` (by default a receipt or issue, by sign).
+# Returns the new (quantity, version); raises Goods.DoesNotExist for someone else's product.
+def adjust(user, product_id, delta, allow_negative=True, kind=None):
+    with transaction.atomic(), rollups.batched() as changes:
+        rows = Goods.objects.filter(pk=product_id, user=user)
+        if delta < 0 and not allow_negative:
+            rows = rows.filter(quantity__gte=-delta)
+        if not rows.update(quantity=F('quantity') + delta, version=F('version') + 1, updated_at=timezone.now()):
+            if Goods.objects.filter(pk=product_id, user=user).exists():
+                raise InsufficientStock(f"Not enough stock to remove {-delta}")
+            raise Goods.DoesNotExist(f"No product {product_id}")
+
+        # The row is write-locked by the UPDATE until commit, so this reads our own result
+        quantity, version, *state = (
+            Goods.objects.filter(pk=product_id)
+            .values_list('quantity', 'version', *Goods.ROLLUP_FIELDS)
+            .get()
+        )
+        # Queryset updates skip model signals
+        changes.adjust(state, delta)
+        ledger.record(product_id, delta, kind)
+    lookup_cache.invalidate_user(user.pk)
+    fragments.invalidate_user(user.pk)
+    return quantity, version
+
+
+# Save a full edit of product only if nobody wrote it since version expected_version was read
+# (the version the editor's form was rendered from); raises StaleVersion otherwise
+def save_if_current(product, expected_version):
+    with transaction.atomic():
+        # A no-op UPDATE both checks the version and write-locks the row until the save commits
+        claimed = Goods.objects.filter(pk=product.pk, version=expected_version).update(version=expected_version)
+        # The copy being saved must also be that version, or the rollups would apply a stale difference
+        if not claimed or product.version != expected_version:
+            raise StaleVersion("The product was changed by someone else")
+        product.save()
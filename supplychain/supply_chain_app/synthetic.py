@@ -0,0 +1,95 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import choices, fragments, ledger, rollups, search
+from .barcodes import lookup_cache
+from .models import Category, Customer, Goods, StockMovement
+
+# Goods written per bulk_create/transaction
+DEFAULT_BATCH_SIZE = 10_000
+
+WORDS = (
+    'steel', 'copper', 'oak', 'plastic', 'cordless', 'heavy', 'compact', 'industrial', 'blue',
+    'red', 'spare', 'premium', 'bolt', 'drill', 'saw', 'pump', 'valve', 'cable', 'pallet', 'crate',
+    'filter', 'bearing', 'hose', 'panel', 'bracket', 'sensor', 'gasket', 'switch', 'clamp', 'motor',
+)
+
+
+# Barcode for the index-th product of a user: GS1 in-store prefix 2, unique per user
+def synthetic_barcode(index):
+    return f'2{index:012d}'
+
+
+class SyntheticData:
+    # Writes users with generated categories, customers and goods through bulk_create, batch by
+    # batch, keeping rollups, the search index and the caches in step as the signals would.
+    # The same seed produces the same data.
+    def __init__(self, prefix='fixture', password='fixture', seed=0, batch_size=DEFAULT_BATCH_SIZE):
+        self.prefix = prefix
+        self.password = password
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+
+    def generate(self, users, categories, customers, goods, progress=None):
+        password = make_password(self.password)  # hashing is slow; every user shares one hash
+        created = User.objects.bulk_create(
+            User(username=f'{self.prefix}-{index}', password=password) for index in range(users)
+        )
+        created = list(User.objects.filter(username__in=[user.username for user in created]).order_by('id'))
+        for user in created:
+            self.populate(user, categories, customers, goods, progress)
+        return created
+
+    def populate(self, user, categories, customers, goods, progress=None):
+        category_ids = [
+            obj.pk for obj in Category.objects.bulk_create(
+                Category(user=user, name=f'{self.random.choice(WORDS).title()} {index}')
+                for index in range(categories)
+            )
+        ]
+        customer_ids = [
+            obj.pk for obj in Customer.objects.bulk_create(
+                Customer(
+                    user=user, name=f'Customer {index}', email=f'customer{index}@example.com',
+                    phone=f'555-{index:07d}', address=f'{index} Warehouse Road',
+                )
+                for index in range(customers)
+            )
+        ]
+
+        for offset in range(0, goods, self.batch_size):
+            batch = [
+                self.product(user, index, category_ids, customer_ids)
+                for index in range(offset, min(offset + self.batch_size, goods))
+            ]
+            with transaction.atomic():
+                Goods.objects.bulk_create(batch)
+                # Bulk inserts skip model signals, so fold the batch into the rollups here
+                changes = rollups.RollupChanges()
+                for product in batch:
+                    changes.add(product.rollup_state())
+                changes.apply()
+                ledger.record_many(((product.pk, product.quantity) for product in batch), StockMovement.RECEIPT)
+                search.sync_pending()
+            if progress:
+                progress(user, offset + len(batch))
+        lookup_cache.invalidate_user(user.pk)
+        choices.invalidate_user(user.pk)
+        fragments.invalidate_user(user.pk)
+
+    def product(self, user, index, category_ids, customer_ids):
+        choose = self.random.choice
+        return Goods(
+            user=user,
+            name=f'{choose(WORDS).title()} {choose(WORDS)} {index}',
+            description=' '.join(self.random.choices(WORDS, k=8)),
+            quantity=self.random.randrange(0, 500),
+            price=Decimal(self.random.randrange(50, 100_000)) / 100,
+            category_id=choose(category_ids) if category_ids else None,
+            customer_id=choose(customer_ids) if customer_ids else None,
+            barcode=synthetic_barcode(index),
+        )
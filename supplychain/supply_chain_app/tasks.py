@@ -0,0 +1,61 @@
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from . import deletion, forecast, jobs, ledger, rollups
+from .importer import GoodsImporter, iter_rows
+
+# Rejected rows kept in an import job's result
+IMPORT_ERRORS_KEPT = 100
+
+
+# Save an uploaded file where the workers can read it; returns its path
+def store_upload(upload):
+    directory = Path(settings.JOB_FILES_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{uuid.uuid4().hex}{Path(upload.name).suffix.lower()}'
+    with open(path, 'wb') as handle:
+        for chunk in upload.chunks():
+            handle.write(chunk)
+    return str(path)
+
+
+# Import a file saved by store_upload() for the job's user, then remove it. Not retried: the
+# batches written before a failure stay committed and would be imported twice.
+@jobs.task('import_goods', max_attempts=1)
+def import_goods(job, path, filename):
+    try:
+        with open(path, 'rb') as fileobj:
+            result = GoodsImporter(job.user).run(
+                iter_rows(fileobj, filename),
+                progress=lambda rows: jobs.report(job, rows, message=f"{rows} rows read"),
+            )
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return {'created': result.created, 'failed': result.failed, 'errors': result.errors[:IMPORT_ERRORS_KEPT]}
+
+
+# Recompute the inventory rollups, for the job's user or (without one) everybody
+@jobs.task('rebuild_rollups')
+def rebuild_rollups(job):
+    return {'rows': rollups.rebuild(job.user)}
+
+
+# Remove soft-deleted categories and customers with their products; queued by deletion.soft_delete()
+@jobs.task('purge_deleted')
+def purge_deleted(job):
+    owners, products = deletion.purge(pause=0.05)
+    return {'owners': owners, 'products': products}
+
+
+# Count the latest issues into the daily consumption, then replace the reorder suggestions
+@jobs.task('forecast_reorders')
+def forecast_reorders(job):
+    movements = ledger.record_consumption()
+    products, suggestions = forecast.run()
+    return {'movements': movements, 'products': products, 'suggestions': suggestions}
@@ -1,3 +1,1708 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Category, CategoryRollup, Customer, CustomerRollup, DailyConsumption, Goods, Job, ReorderSuggestion, StockAlert,
+    StockMovement, StockSnapshot, UserRollup,
+)
+from . import (
+    alerts, barcodes, choices, decoding, deletion, forecast, fragments, jobs, ledger, metrics, rollups, search,
+    stock,
+)
+from .forms import CategoryForm, CustomerForm, GoodsForm
+from .importer import GoodsImporter
+from .management.commands import runasgi
+from .receiving import CONFLICT_ERROR, HIDDEN_PRODUCT_ERROR, ScanBatch
+from .pagination import PAGE_SIZE, decode_cursor, encode_cursor, goods_table_queryset, keyset_page
+
+
+# Create `count` goods for a user, each linked to its own category and customer
+def make_goods(user, count, start=0):
+    for i in range(start, start + count):
+        category = Category.objects.create(name=f'Category {i}', user=user)
+        customer = Customer.objects.create(name=f'Customer {i}', user=user)
+        Goods.objects.create(
+            user=user, name=f'Item {i}', quantity=i, price=1,
+            category=category, customer=customer,
+        )
+
+
+class GoodsPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+
+    def count_queries(self, url_name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_cursor_round_trip(self):
+        good = Goods.objects.create(user=self.user, name='Widget', quantity=1)
+        self.assertEqual(decode_cursor(encode_cursor(good.date_added, good.pk)), (good.date_added, good.pk))
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+
+    def test_query_count_is_constant(self):
+        for url_name in ('goods_list', 'dashboard'):
+            make_goods(self.user, 3)
+            small = self.count_queries(url_name)
+            make_goods(self.user, 40, start=100)
+            self.assertEqual(self.count_queries(url_name), small, url_name)
+            Goods.objects.all().delete()
+
+    def test_pages_cover_every_row_once(self):
+        make_goods(self.user, 7)
+        queryset = goods_table_queryset(self.user)
+        seen = []
+        page = keyset_page(queryset, page_size=3)
+        seen.extend(item.pk for item in page)
+        while page.has_next:
+            page = keyset_page(queryset, after=page.next_cursor, page_size=3)
+            seen.extend(item.pk for item in page)
+        expected = list(Goods.objects.order_by('-date_added', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+        # Walking back from the last page returns the page before it
+        previous = keyset_page(queryset, before=page.prev_cursor, page_size=3)
+        self.assertEqual([item.pk for item in previous], expected[3:6])
+        self.assertTrue(previous.has_next)
+        self.assertTrue(previous.has_previous)
+
+
+class GoodsSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Hand Tools', user=self.user)
+        self.hammer = Goods.objects.create(user=self.user, name='Claw Hammer', quantity=3, category=self.tools)
+        self.nails = Goods.objects.create(
+            user=self.user, name='Box of nails', quantity=9, description='Fits any hammer',
+        )
+        other = User.objects.create_user(username='other', password='secret')
+        Goods.objects.create(user=other, name='Hammer drill', quantity=1)
+
+    def search(self, query):
+        response = self.client.get(reverse('search_goods'), {'q': query})
+        return [item.name for item in response.context['results']]
+
+    def test_prefix_match_ranked_by_relevance(self):
+        self.assertTrue(search.fts_enabled())
+        # A name hit outranks a description hit, and other users' goods never show up
+        self.assertEqual(self.search('hamm'), ['Claw Hammer', 'Box of nails'])
+
+    def test_index_follows_writes(self):
+        self.tools.name = 'Carpentry'
+        self.tools.save()
+        self.assertEqual(self.search('carp'), ['Claw Hammer'])
+        self.hammer.delete()
+        self.assertEqual(self.search('carp'), [])
+
+    def test_dashboard_filter(self):
+        response = self.client.get(reverse('dashboard'), {'q': 'nail'})
+        self.assertEqual([item.name for item in response.context['goods']], ['Box of nails'])
+
+    def test_rebuild_command(self):
+        search.sync_pending()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self.search('hammer'), [])
+        call_command('rebuild_search_index', stdout=mock.Mock())
+        self.assertEqual(self.search('hammer'), ['Claw Hammer', 'Box of nails'])
+
+    def test_fallback_without_fts(self):
+        with mock.patch.object(search, 'fts_enabled', return_value=False):
+            self.assertEqual(self.search('tools'), ['Claw Hammer'])
+
+
+class BarcodeLookupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.good = Goods.objects.create(user=self.user, name='Scanner', quantity=2, barcode='4006381333931')
+        barcodes.lookup_cache.clear()
+
+    def test_repeat_scan_is_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(barcodes.lookup(self.user, '4006381333931'), self.good)
+        with self.assertNumQueries(0):
+            self.assertEqual(barcodes.lookup(self.user, '4006381333931'), self.good)
+            self.assertIsNone(barcodes.lookup(self.user, '000000'))
+
+    def test_save_and_delete_invalidate(self):
+        self.assertIsNone(barcodes.lookup(self.user, '123'))
+        product = Goods.objects.create(user=self.user, name='New', quantity=1, barcode='123')
+        self.assertEqual(barcodes.lookup(self.user, '123'), product)
+        product.delete()
+        self.assertIsNone(barcodes.lookup(self.user, '123'))
+
+    def test_real_barcodes_are_unique_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Goods.objects.create(user=self.user, name='Copy', quantity=1, barcode='4006381333931')
+        # Placeholder codes may repeat, and other users may reuse a code
+        Goods.objects.create(user=self.user, name='A', quantity=1)
+        Goods.objects.create(user=self.user, name='B', quantity=1)
+        other = User.objects.create_user(username='other')
+        Goods.objects.create(user=other, name='Theirs', quantity=1, barcode='4006381333931')
+
+    def test_retrieve_view(self):
+        response = self.client.post(reverse('barcode_retrieve'), {'barcode': '4006381333931'})
+        self.assertEqual(response.context['product'], self.good)
+
+
+IMPORT_CSV = b"""Name,Quantity,Price,Description,Category,Customer,Barcode
+Drill,4,99.50,Cordless,Tools,Acme,111
+Saw,2,,,Tools,,
+,1,1,,,,
+Hammer,many,1,,,,
+Chisel,1,1,,,,111
+"""
+
+
+class GoodsImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+
+    def test_upload_view(self):
+        upload = SimpleUploadedFile('goods.csv', IMPORT_CSV, content_type='text/csv')
+        with tempfile.TemporaryDirectory() as tmp, override_settings(JOB_FILES_DIR=tmp):
+            response = self.client.post(reverse('import_goods'), {'file': upload})
+            # The upload is queued for a worker; the page polls the job until it is done
+            self.assertContains(self.client.get(response.url), 'Waiting for a worker')
+            self.assertEqual(jobs.work(burst=True), 1)
+            self.assertEqual(os.listdir(tmp), [])
+        result = self.client.get(response.url).context['result']
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([row for row, _ in result['errors']], [4, 5, 6])
+
+        drill = Goods.objects.get(name='Drill')
+        self.assertEqual(drill.category, self.tools)
+        self.assertEqual(drill.customer.name, 'Acme')
+        self.assertEqual(str(drill.price), '99.50')
+        self.assertEqual(Category.objects.filter(user=self.user).count(), 1)
+        # Imported rows are searchable straight away
+        self.assertEqual(search.ranked_goods(Goods.objects.all(), self.user, 'cordless'), [drill])
+
+    def test_names_resolve_without_per_row_queries(self):
+        def run(count):
+            rows = ({'name': f'Item {i}', 'quantity': '1', 'category': 'Tools'} for i in range(count))
+            with CaptureQueriesContext(connection) as ctx:
+                result = GoodsImporter(self.user, batch_size=count).run(rows)
+            self.assertEqual(result.created, count)
+            return len(ctx.captured_queries)
+
+        # A single batch costs the same number of queries whatever its size, apart from one INSERT
+        # per rows_per_insert rows (the first import also creates the rollup rows)
+        run(1)
+        per_insert = GoodsImporter(self.user).rows_per_insert
+        self.assertEqual(run(10), run(per_insert))
+        self.assertEqual(run(10) + 1, run(2 * per_insert))
+
+    def test_only_imported_rows_create_categories_and_customers(self):
+        rows = [
+            {'name': 'Rake', 'quantity': 'lots', 'category': 'Garden', 'customer': 'Acme'},
+            {'name': 'Hoe', 'quantity': '1', 'category': 'Farm', 'customer': 'Nobody'},
+            {'name': 'Spade', 'quantity': '1', 'category': 'Tools'},
+        ]
+        result = GoodsImporter(self.user, create_missing=False).run(rows[1:])
+        self.assertEqual((result.created, result.failed), (1, 1))
+        result = GoodsImporter(self.user).run(rows[:1] + [{'name': 'Shears', 'quantity': '2', 'category': 'Shed'}])
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(sorted(Category.objects.filter(user=self.user).values_list('name', flat=True)), ['Shed', 'Tools'])
+        self.assertFalse(Customer.objects.filter(user=self.user).exists())
+        self.assertEqual(Goods.objects.get(name='Shears').category.name, 'Shed')
+
+        # Owners are created in the transaction of the batch that uses them, so they go if it fails
+        with mock.patch.object(GoodsImporter, 'insert', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            GoodsImporter(self.user).run([{'name': 'Mower', 'quantity': '1', 'category': 'Lawn', 'customer': 'Acme'}])
+        self.assertFalse(Category.objects.filter(name='Lawn').exists())
+        self.assertFalse(Customer.objects.filter(user=self.user).exists())
+
+    def test_opening_stock_is_recorded_for_the_inserted_rows_only(self):
+        # Another product written at the very moment the batch is stamped gets no movement
+        now = timezone.now()
+        bystander = Goods.objects.create(user=self.user, name='Bystander', quantity=5)
+        Goods.objects.filter(pk=bystander.pk).update(date_added=now)
+        for returning in (True, False):
+            features = type(connection.features)
+            with mock.patch.object(features, 'can_return_rows_from_bulk_insert', mock.PropertyMock(return_value=returning)), \
+                    mock.patch.object(timezone, 'now', return_value=now):
+                rows = [{'name': f'{returning} {i}', 'quantity': str(i)} for i in range(1, 4)]
+                GoodsImporter(self.user, batch_size=2).run(rows)
+            movements = StockMovement.objects.filter(goods__name__startswith=str(returning))
+            self.assertEqual(sorted(movements.values_list('goods__name', 'quantity')), [
+                (f'{returning} 1', 1), (f'{returning} 2', 2), (f'{returning} 3', 3),
+            ])
+        self.assertEqual(StockMovement.objects.filter(goods=bystander).count(), 1)
+
+    def test_command_writes_error_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'goods.csv')
+            report = os.path.join(tmp, 'errors.csv')
+            with open(source, 'wb') as handle:
+                handle.write(IMPORT_CSV)
+            out = io.StringIO()
+            call_command('import_goods', source, user='tester', batch_size=1, errors=report, stdout=out)
+            self.assertIn('Imported 2 goods', out.getvalue())
+            with open(report) as handle:
+                self.assertEqual(len(handle.readlines()), 4)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        make_goods(self.user, 3)
+        Goods.objects.filter(name='Item 2').update(price='2.50', quantity=4)
+
+    def test_csv_export_streams_sql_total_value(self):
+        response = self.client.get(reverse('export_data', args=['goods', 'csv']))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('id,name,barcode,quantity,price,total_value'))
+        self.assertIn('Item 2,000000,4,2.50,10.00,Category 2,Customer 2', lines[3])
+
+    def test_gzip_ndjson_export(self):
+        response = self.client.get(reverse('export_data', args=['customers', 'ndjson']), {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual([record['name'] for record in records], ['Customer 0', 'Customer 1', 'Customer 2'])
+
+    def test_unknown_export_is_404(self):
+        self.assertEqual(self.client.get(reverse('export_data', args=['users', 'csv'])).status_code, 404)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, 'goods.ndjson')
+            call_command('export_data', 'goods', user='tester', format='ndjson', output=target)
+            with open(target) as handle:
+                self.assertEqual(len(handle.readlines()), 3)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.acme = Customer.objects.create(name='Acme', user=self.user)
+
+    def totals(self, model, **lookup):
+        row = model.objects.get(**lookup)
+        return row.sku_count, row.unit_count, row.total_value
+
+    def test_incremental_updates(self):
+        drill = Goods.objects.create(user=self.user, name='Drill', quantity=2, price='10.00', category=self.tools)
+        Goods.objects.create(user=self.user, name='Saw', quantity=1, price='5.50', customer=self.acme)
+        self.assertEqual(self.totals(UserRollup, user=self.user), (2, 3, Decimal('25.50')))
+
+        # Moving a product between categories and changing its stock shifts only the difference
+        drill = Goods.objects.get(pk=drill.pk)
+        drill.quantity = 5
+        drill.category = None
+        drill.customer = self.acme
+        drill.save()
+        self.assertEqual(self.totals(UserRollup, user=self.user), (2, 6, Decimal('55.50')))
+        self.assertEqual(self.totals(CategoryRollup, category=self.tools), (0, 0, Decimal('0')))
+        self.assertEqual(self.totals(CustomerRollup, customer=self.acme), (2, 6, Decimal('55.50')))
+
+        drill.delete()
+        self.assertEqual(self.totals(UserRollup, user=self.user), (1, 1, Decimal('5.50')))
+
+    def test_rebuild_matches_incremental(self):
+        make_goods(self.user, 5)
+        GoodsImporter(self.user).run([{'name': 'Bulk', 'quantity': '7', 'price': '2', 'category': 'Tools'}])
+        expected = {
+            model: sorted(model.objects.values_list('sku_count', 'unit_count', 'total_value'))
+            for model in (UserRollup, CategoryRollup, CustomerRollup)
+        }
+        self.assertEqual(expected[UserRollup], [(6, 17, Decimal('24'))])
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        for model, rows in expected.items():
+            self.assertEqual(sorted(model.objects.values_list('sku_count', 'unit_count', 'total_value')), rows)
+
+    def test_dashboard_reads_rollup(self):
+        Goods.objects.create(user=self.user, name='Drill', quantity=2, price='10.00')
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['portfolio'].total_value, Decimal('20'))
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.acme = Customer.objects.create(name='Acme', user=self.user)
+        self.drill = Goods.objects.create(user=self.user, name='Drill', quantity=2, price='10.00', category=self.tools)
+        self.saw = Goods.objects.create(
+            user=self.user, name='Saw', quantity=1, price='5.00', category=self.tools, customer=self.acme,
+        )
+        self.pump = Goods.objects.create(user=self.user, name='Pump', quantity=3, price='1.00', customer=self.acme)
+
+    def totals(self, model, **lookup):
+        row = model.objects.get(**lookup)
+        return row.sku_count, row.unit_count, row.total_value
+
+    def delete_category(self, category):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('delete_category', args=[category.pk]))
+        self.assertRedirects(response, reverse('category_list'), fetch_redirect_response=False)
+        return len(queries)
+
+    def test_delete_hides_owner_and_products_at_once(self):
+        self.client.get(reverse('goods_list'))
+        self.delete_category(self.tools)
+        self.assertFalse(Category.objects.filter(pk=self.tools.pk).exists())
+        self.assertEqual(list(Goods.objects.values_list('name', flat=True)), ['Pump'])
+        self.assertEqual(Goods.all_objects.count(), 3)
+        page = self.client.get(reverse('goods_list')).content.decode()
+        self.assertNotIn('Drill', page)
+        self.assertIn('Pump', page)
+        self.assertEqual(self.client.post(reverse('delete_category', args=[self.tools.pk])).status_code, 404)
+
+    def test_delete_category_needs_the_owner_and_a_post(self):
+        url = reverse('delete_category', args=[self.tools.pk])
+        self.client.get(url)
+        self.assertTrue(Category.objects.filter(pk=self.tools.pk).exists())
+        User.objects.create_user(username='other', password='secret')
+        self.client.login(username='other', password='secret')
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.client.logout()
+        self.assertRedirects(self.client.post(url), f"{reverse('login')}?next={url}", fetch_redirect_response=False)
+        self.assertTrue(Category.objects.filter(pk=self.tools.pk).exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_delete_does_not_grow_with_products(self):
+        # The first delete also queues the purge job the later ones find queued
+        self.delete_category(self.tools)
+        sizes = {}
+        for count in (1, 30):
+            category = Category.objects.create(name=f'{count} items', user=self.user)
+            for i in range(count):
+                Goods.objects.create(user=self.user, name=f'Item {i}', quantity=1, category=category)
+            sizes[count] = self.delete_category(category)
+        self.assertEqual(sizes[30], sizes[1])
+
+    def test_rollups_drop_hidden_products_once(self):
+        Goods.objects.create(user=self.user, name='Bolt', quantity=10, price='0.50')
+        self.delete_category(self.tools)
+        self.assertEqual(self.totals(UserRollup, user=self.user), (2, 13, Decimal('8')))
+        self.assertEqual(self.totals(CustomerRollup, customer=self.acme), (1, 3, Decimal('3')))
+        # The saw was already hidden with its category, so deleting its customer only takes the pump
+        self.client.post(reverse('delete_customer', args=[self.acme.pk]))
+        self.assertEqual(self.totals(UserRollup, user=self.user), (1, 10, Decimal('5')))
+        self.assertFalse(Customer.objects.exists())
+
+        deletion.purge()
+        self.assertEqual(self.totals(UserRollup, user=self.user), (1, 10, Decimal('5')))
+        rollups.rebuild()
+        self.assertEqual(self.totals(UserRollup, user=self.user), (1, 10, Decimal('5')))
+
+    def test_purge_removes_rows_in_batches(self):
+        for i in range(5):
+            Goods.objects.create(user=self.user, name=f'Item {i}', quantity=1, category=self.tools)
+        self.delete_category(self.tools)
+        self.assertEqual(StockMovement.objects.filter(goods__category=self.tools).count(), 7)
+
+        out = io.StringIO()
+        call_command('purge_deleted', batch_size=2, pause=0, stdout=out)
+        self.assertIn('Purged 1 deleted categories/customers and 7 products', out.getvalue())
+        self.assertFalse(Category.all_objects.filter(pk=self.tools.pk).exists())
+        self.assertFalse(CategoryRollup.objects.filter(category=self.tools.pk).exists())
+        self.assertEqual(list(Goods.all_objects.values_list('name', flat=True)), ['Pump'])
+        self.assertEqual(StockMovement.objects.count(), 1)
+        self.assertEqual(deletion.purge(), (0, 0))
+
+    def test_api_deletes_are_soft(self):
+        auth = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'tester:secret').decode()}
+        response = self.client.delete(reverse('api_item', args=['customers', self.acme.pk]), **auth)
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(Customer.all_objects.filter(pk=self.acme.pk).exists())
+        response = self.client.post(
+            reverse('api_batch', args=['categories']), {'delete': [self.tools.pk]},
+            content_type='application/json', **auth,
+        )
+        self.assertEqual(response.json()['deleted'], 1)
+        self.assertFalse(Goods.objects.exists())
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.calls = []
+
+    def flaky(self, job, fail_times=0):
+        self.calls.append(job.attempts)
+        jobs.report(job, 1, 2, 'halfway')
+        if job.attempts <= fail_times:
+            raise RuntimeError('boom')
+        return {'attempt': job.attempts}
+
+    def test_claims_by_priority_and_never_twice(self):
+        low = jobs.enqueue('rebuild_rollups')
+        high = jobs.enqueue('rebuild_rollups', priority=5)
+        later = jobs.enqueue('rebuild_rollups')
+        Job.objects.filter(pk=later.pk).update(run_after=timezone.now() + timedelta(hours=1))
+        self.assertEqual(jobs.claim('a').pk, high.pk)
+        self.assertEqual(jobs.claim('b').pk, low.pk)
+        self.assertIsNone(jobs.claim('c'))
+        self.assertEqual(Job.objects.get(pk=low.pk).worker, 'b')
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_task')
+
+    def test_failures_are_retried_with_backoff_then_fail(self):
+        with mock.patch.dict(jobs.TASKS, {'flaky': (self.flaky, 2)}):
+            job = jobs.enqueue('flaky', {'fail_times': 1})
+            self.assertEqual(jobs.work(burst=True), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.state, job.progress, job.message), (Job.QUEUED, 1, 'boom'))
+            self.assertIn('RuntimeError', job.error)
+            self.assertGreater(job.run_after, timezone.now())
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            jobs.work(burst=True)
+            job.refresh_from_db()
+            self.assertEqual((job.state, job.result), (Job.DONE, {'attempt': 2}))
+
+            doomed = jobs.enqueue('flaky', {'fail_times': 5})
+            jobs.run(jobs.claim('w'))
+            Job.objects.filter(pk=doomed.pk).update(run_after=timezone.now())
+            jobs.run(jobs.claim('w'))
+            self.assertEqual(Job.objects.get(pk=doomed.pk).state, Job.FAILED)
+        self.assertEqual(self.calls, [1, 2, 1, 2])
+
+    def test_housekeeping_takes_back_lost_jobs(self):
+        job = jobs.enqueue('rebuild_rollups')
+        jobs.claim('dead-worker')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - jobs.JOB_LEASE * 2)
+        self.assertEqual(jobs.housekeeping(), (1, 0))
+        self.assertEqual(Job.objects.get(pk=job.pk).state, Job.QUEUED)
+        Job.objects.filter(pk=job.pk).update(state=Job.DONE, finished_at=timezone.now() - jobs.JOB_RETENTION * 2)
+        self.assertEqual(jobs.housekeeping(), (0, 1))
+
+    def test_status_view_and_deletes_queue_one_purge(self):
+        tools = Category.objects.create(name='Tools', user=self.user)
+        spares = Category.objects.create(name='Spares', user=self.user)
+        Goods.objects.create(user=self.user, name='Drill', quantity=1, category=tools)
+        self.client.post(reverse('delete_category', args=[tools.pk]))
+        self.client.post(reverse('delete_category', args=[spares.pk]))
+        self.assertEqual(Job.objects.filter(kind='purge_deleted', state=Job.QUEUED).count(), 1)
+
+        out = io.StringIO()
+        call_command('run_workers', processes=1, burst=True, stdout=out)
+        self.assertIn('ran 1 jobs', out.getvalue())
+        self.assertFalse(Goods.all_objects.exists())
+        self.assertEqual(Job.objects.get().result, {'owners': 2, 'products': 1})
+
+        mine = jobs.enqueue('rebuild_rollups', user=self.user)
+        status = self.client.get(reverse('job_status', args=[mine.pk]))
+        self.assertEqual(status.json()['state'], 'queued')
+        self.assertIn('no-cache', status['Cache-Control'])
+        other = User.objects.create_user(username='other', password='secret')
+        theirs = jobs.enqueue('rebuild_rollups', user=other)
+        self.assertEqual(self.client.get(reverse('job_status', args=[theirs.pk])).status_code, 404)
+
+
+class StockAlertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.drill = Goods.objects.create(
+            user=self.user, name='Drill', quantity=5, price='10.00', reorder_point=10, reorder_qty=50,
+        )
+
+    # Run the engine over everything written so far (it normally leaves the last seconds alone)
+    def evaluate(self, **kwargs):
+        return alerts.evaluate(until=timezone.now() + timedelta(seconds=1), **kwargs)
+
+    def test_alerts_open_and_resolve_as_stock_crosses_the_reorder_point(self):
+        with self.assertLogs('supply_chain_app.stock_alerts', 'WARNING') as logs:
+            self.assertEqual(self.evaluate().opened, 1)
+        self.assertIn('reorder point 10', logs.output[0])
+        alert = StockAlert.objects.get()
+        self.assertEqual((alert.goods, alert.quantity, alert.resolved_at), (self.drill, 5, None))
+
+        # Still low after another sale: the open alert stands
+        stock.adjust(self.user, self.drill.pk, -1)
+        run = self.evaluate()
+        self.assertEqual((run.checked, run.opened, run.resolved), (1, 0, 0))
+
+        stock.adjust(self.user, self.drill.pk, 20)
+        self.assertEqual(self.evaluate().resolved, 1)
+        stock.adjust(self.user, self.drill.pk, -20)
+        with self.assertLogs('supply_chain_app.stock_alerts'):
+            self.assertEqual(self.evaluate().opened, 1)
+        self.assertEqual(StockAlert.objects.filter(resolved_at__isnull=True).count(), 1)
+        self.assertEqual(StockAlert.objects.count(), 2)
+
+    def test_only_products_written_since_the_last_run_are_read(self):
+        for i in range(30):
+            Goods.objects.create(user=self.user, name=f'Item {i}', quantity=i, price=1, reorder_point=5)
+        with self.assertLogs('supply_chain_app.stock_alerts') as logs:
+            run = self.evaluate(batch_size=7)
+        self.assertEqual((run.checked, run.opened, len(logs.output)), (31, 7, 7))
+        self.assertEqual(self.evaluate().checked, 0)
+
+        stock.adjust(self.user, self.drill.pk, 100)
+        run = self.evaluate()
+        self.assertEqual((run.checked, run.resolved), (1, 1))
+
+        # Writes younger than ALERT_SETTLE wait for the next run
+        stock.adjust(self.user, self.drill.pk, -100)
+        self.assertEqual(alerts.evaluate().checked, 0)
+
+    def test_low_stock_panel_reads_the_partial_index(self):
+        Goods.objects.create(user=self.user, name='Saw', quantity=50, price=1, reorder_point=10)
+        Goods.objects.create(user=self.user, name='Tape', quantity=0, price=1)  # not watched
+        self.assertIn('goods_low_stock_idx', alerts.low_stock(self.user).explain())
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual([item.name for item in response.context['low_stock']], ['Drill'])
+        self.assertContains(response, 'Low Stock')
+
+    def test_reorder_points_are_imported_and_checked_by_the_command(self):
+        rows = [
+            {'name': 'Saw', 'quantity': '2', 'reorder_point': '4', 'reorder_qty': '12'},
+            {'name': 'Tape', 'quantity': '1', 'reorder_point': '-1'},
+        ]
+        result = GoodsImporter(self.user).run(rows)
+        self.assertEqual((result.created, result.errors), (1, [(3, "invalid reorder_point '-1'")]))
+        self.assertEqual(Goods.objects.get(name='Saw').reorder_qty, 12)
+
+        out = io.StringIO()
+        with mock.patch.object(alerts, 'ALERT_SETTLE', timedelta(0)), self.assertLogs('supply_chain_app.stock_alerts'):
+            call_command('check_stock_alerts', stdout=out)
+        self.assertIn('Checked 2 changed products: 2 alerts opened', out.getvalue())
+
+
+@skipIf(forecast.np is None, "numpy is not installed")
+class DemandForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.drill = Goods.objects.create(user=self.user, name='Drill', quantity=40, price='10.00')
+
+    def test_issues_are_counted_per_day_incrementally(self):
+        stock.adjust(self.user, self.drill.pk, -3)
+        stock.adjust(self.user, self.drill.pk, -2)
+        stock.adjust(self.user, self.drill.pk, 10)  # receipts are not consumption
+        later = timezone.now() + timedelta(seconds=1)
+        self.assertEqual(ledger.record_consumption(until=later), 2)
+        self.assertEqual(ledger.record_consumption(until=later), 0)
+
+        stock.adjust(self.user, self.drill.pk, -4)
+        self.assertEqual(ledger.record_consumption(until=timezone.now() + timedelta(seconds=1)), 1)
+        self.assertEqual(
+            list(DailyConsumption.objects.values_list('goods', 'day', 'quantity')),
+            [(self.drill.pk, timezone.localdate(), 9)],
+        )
+
+    def test_compaction_counts_issues_before_deleting_them(self):
+        stock.adjust(self.user, self.drill.pk, -5)
+        ledger.compact(timezone.now() + timedelta(seconds=1))
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(DailyConsumption.objects.get().quantity, 5)
+
+    def test_forecast_covers_lead_time_and_review_period(self):
+        np = forecast.np
+        days = forecast.HISTORY_DAYS
+        demand = np.zeros((4, days))
+        demand[0] = demand[1] = demand[3] = 10
+        demand[2, -4:] = [2, 6, 2, 6]  # added four days ago, so the empty days before do not count
+        level, safety_stock, reorder_point, order = forecast.forecast(
+            demand, first_day=np.array([0, 0, days - 4, 0]), on_hand=np.array([50., 500., 0., 50.]),
+            minimum_order=np.array([0., 0., 0., 200.]), lead_time=7, review=7,
+        )
+        self.assertTrue(np.allclose(level[[0, 1, 3]], 10))
+        self.assertEqual((safety_stock[0], reorder_point[0], order[0]), (0, 70, 90))
+        self.assertEqual(order[1], 0)  # well stocked
+        self.assertAlmostEqual(level[2], 4, delta=0.5)
+        self.assertGreater(safety_stock[2], 0)
+        self.assertEqual(order[3], 200)  # the product's reorder quantity is the smallest order
+
+    def test_run_replaces_suggestions_shown_on_the_dashboard(self):
+        Goods.objects.filter(pk=self.drill.pk).update(date_added=timezone.now() - timedelta(days=90))
+        saw = Goods.objects.create(user=self.user, name='Saw', quantity=1000, price=1)
+        today = timezone.localdate()
+        DailyConsumption.objects.bulk_create(
+            DailyConsumption(goods=product, day=today - timedelta(days=offset), quantity=8)
+            for offset in range(1, 30) for product in (self.drill, saw)
+        )
+        self.assertEqual(forecast.run(), (2, 1))
+        self.assertEqual(forecast.run(), (2, 1))
+        suggestion = ReorderSuggestion.objects.get()
+        self.assertEqual((suggestion.goods, suggestion.user), (self.drill, self.user))
+        self.assertGreater(suggestion.quantity, 0)
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual([item.goods.name for item in response.context['suggestions']], ['Drill'])
+        self.assertContains(response, 'Reorder Suggestions')
+
+    def test_job(self):
+        stock.adjust(self.user, self.drill.pk, -5)
+        job = jobs.enqueue('forecast_reorders')
+        with mock.patch.object(ledger, 'SNAPSHOT_SETTLE', timedelta(0)):
+            self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.DONE, job.error)
+        self.assertEqual(job.result, {'movements': 1, 'products': 1, 'suggestions': 0})
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'tester:secret').decode()}
+
+    def call(self, method, name, payload=None, **kwargs):
+        url = reverse(name, kwargs=kwargs)
+        if payload is None:
+            return getattr(self.client, method)(url, **self.auth)
+        return getattr(self.client, method)(url, json.dumps(payload), content_type='application/json', **self.auth)
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get(reverse('api_collection', args=['goods'])).status_code, 401)
+
+    def test_list_keyset_pages_with_sparse_fields(self):
+        make_goods(self.user, 5)
+        url = reverse('api_collection', args=['goods'])
+        with self.assertNumQueries(2):  # auth user lookup + one page (category name joined in)
+            first = self.client.get(url, {'limit': 3, 'fields': 'name,category_name'}, **self.auth).json()
+        self.assertEqual(first['results'][0], {'id': first['results'][0]['id'], 'name': 'Item 0', 'category_name': 'Category 0'})
+        second = self.client.get(url, {'limit': 3, 'after': first['next']}, **self.auth).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 5)
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(url, {'fields': 'secret'}, **self.auth).status_code, 400)
+
+    def test_batch_is_all_or_nothing(self):
+        existing = Goods.objects.create(user=self.user, name='Old', quantity=1)
+        doomed = Goods.objects.create(user=self.user, name='Doomed', quantity=1)
+        payload = {
+            'create': [{'name': f'New {i}', 'quantity': i, 'price': '1.00', 'category': self.tools.pk} for i in range(200)],
+            'update': [{'id': existing.pk, 'quantity': 40}],
+            'delete': [doomed.pk],
+        }
+        response = self.call('post', 'api_batch', payload, resource='goods')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()['created']), 200)
+        self.assertEqual(response.json()['deleted'], 1)
+        self.assertEqual(Goods.objects.get(pk=existing.pk).quantity, 40)
+        self.assertEqual(UserRollup.objects.get(user=self.user).sku_count, 201)
+
+        # One bad record (another user's category) rejects the lot
+        other = Category.objects.create(name='Theirs', user=User.objects.create_user(username='other'))
+        payload = {'create': [
+            {'name': 'Fine', 'quantity': 1, 'price': '1'},
+            {'name': 'Bad', 'quantity': 1, 'price': '1', 'category': other.pk},
+        ]}
+        response = self.call('post', 'api_batch', payload, resource='goods')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['create'][0]['index'], 1)
+        self.assertFalse(Goods.objects.filter(name='Fine').exists())
+
+    def test_batch_update_ids_must_be_integers(self):
+        product = Goods.objects.create(user=self.user, name='Saw', quantity=1)
+        payload = {'update': [{'id': [product.pk]}, {'id': {}}, {'id': True}, {'id': product.pk + 1000}]}
+        response = self.call('post', 'api_batch', payload, resource='goods')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['errors'] for error in response.json()['errors']['update']], [
+            {'id': 'Must be an integer'}, {'id': 'Must be an integer'}, {'id': 'Must be an integer'}, {'id': 'Not found'},
+        ])
+
+    def test_item_crud(self):
+        response = self.call('post', 'api_collection', {'name': 'Acme', 'email': 'acme@gmail.com'}, resource='customers')
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()['id']
+        response = self.call('patch', 'api_item', {'phone': '09123456789'}, resource='customers', pk=pk)
+        self.assertEqual(response.json()['phone'], '09123456789')
+        self.assertEqual(response.json()['name'], 'Acme')
+        self.assertEqual(self.call('delete', 'api_item', resource='customers', pk=pk).status_code, 204)
+        self.assertEqual(self.call('get', 'api_item', resource='customers', pk=pk).status_code, 404)
+
+
+class ScanBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.auth = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'tester:secret').decode()}
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+
+    def post(self, scans):
+        return self.client.post(
+            reverse('api_scans'), json.dumps({'scans': scans}), content_type='application/json', **self.auth,
+        )
+
+    def test_increments_existing_and_creates_new(self):
+        hammer = Goods.objects.create(user=self.user, name='Hammer', quantity=5, price=2, barcode='111', category=self.tools)
+        saw = Goods.objects.create(user=self.user, name='Saw', quantity=1, price=10, barcode='222')
+        barcodes.lookup(self.user, '111')  # cached before the batch
+
+        response = self.post(
+            [{'barcode': '111'}, {'barcode': '222', 'quantity': 3}, {'barcode': '111', 'quantity': 1}]
+            + [{'barcode': f'9{i:03}', 'quantity': 2, 'name': f'New {i}', 'price': '1.50', 'category': self.tools.pk} for i in range(50)]
+            + [{'barcode': '333'}, {'barcode': '000000', 'quantity': 1}]
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['applied'], body['failed']), (53, 2))
+        results = body['results']
+        self.assertEqual(results[0], {'index': 0, 'barcode': '111', 'status': 'updated', 'id': hammer.pk, 'quantity': 7})
+        self.assertEqual(results[1]['quantity'], 4)
+        self.assertEqual(results[3]['status'], 'created')
+        self.assertEqual(results[53]['errors'], {'name': 'Required for a barcode that is not in stock yet'})
+        self.assertIn('barcode', results[54]['errors'])
+
+        self.assertEqual(Goods.objects.get(pk=hammer.pk).quantity, 7)
+        self.assertEqual(Goods.objects.get(pk=saw.pk).quantity, 4)
+        self.assertEqual(Goods.objects.filter(user=self.user).count(), 52)
+        self.assertEqual(barcodes.lookup(self.user, '111').quantity, 7)
+        # Rollups follow increments and bulk-created products alike
+        rollup = UserRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.sku_count, rollup.unit_count), (52, 7 + 4 + 100))
+        self.assertEqual(rollup.total_value, Decimal('14') + Decimal('40') + Decimal('150'))
+        self.assertEqual(rollups.rebuild(self.user), 2)
+        self.assertEqual(UserRollup.objects.get(user=self.user).total_value, Decimal('204'))
+
+    def test_query_count_does_not_grow_with_scans(self):
+        for i in range(200):
+            Goods.objects.create(user=self.user, name=f'Item {i}', quantity=0, barcode=f'{i + 1000}')
+        scans = [{'barcode': f'{i + 1000}'} for i in range(200)]
+        with CaptureQueriesContext(connection) as few:
+            self.post(scans[:5])
+        with CaptureQueriesContext(connection) as many:
+            self.post(scans)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Goods.objects.filter(user=self.user, quantity=1).count(), 195)
+
+    def test_scans_of_hidden_products_are_refused(self):
+        hidden = Goods.objects.create(user=self.user, name='Hammer', quantity=5, price=2, barcode='111', category=self.tools)
+        Goods.objects.create(user=self.user, name='Saw', quantity=1, price=10, barcode='222')
+        self.client.force_login(self.user)
+        self.client.post(reverse('delete_category', args=[self.tools.pk]))
+
+        response = self.post([{'barcode': '111', 'quantity': 1, 'name': 'Y'}, {'barcode': '222'}])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[0]['errors'], {'barcode': HIDDEN_PRODUCT_ERROR})
+        self.assertEqual((results[1]['status'], results[1]['quantity']), ('updated', 2))
+        self.assertEqual(Goods.all_objects.get(pk=hidden.pk).quantity, 5)
+        self.assertEqual(Goods.all_objects.filter(barcode='111').count(), 1)
+
+    def test_lasting_conflicts_only_fail_their_own_scans(self):
+        create = ScanBatch._create
+
+        def conflicting(batch, pending, deltas):
+            if any(result.barcode == '999' for result, _ in pending):
+                raise IntegrityError('conflict')
+            return create(batch, pending, deltas)
+
+        with mock.patch.object(ScanBatch, '_create', conflicting):
+            response = self.post([{'barcode': '999', 'name': 'X'}, {'barcode': '888', 'name': 'Y'}])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[0]['errors'], {'barcode': CONFLICT_ERROR})
+        self.assertEqual(results[1]['status'], 'created')
+        self.assertEqual(list(Goods.objects.values_list('barcode', flat=True)), ['888'])
+
+
+# Grayscale image (numpy array) of a barcode given as bar/space module widths
+def barcode_image(widths, scale=3, noise=0):
+    line = [255] * (12 * scale)
+    for index, width in enumerate(widths):
+        line += [0 if index % 2 == 0 else 255] * (width * scale)
+    line += [255] * (12 * scale)
+    image = decoding.np.tile(decoding.np.array(line, dtype=float), (60, 1))
+    image[:, 1:-1] = (image[:, :-2] + image[:, 1:-1] + image[:, 2:]) / 3  # soften edges like a lens
+    image += decoding.np.random.default_rng(0).normal(0, noise, image.shape)
+    return decoding.np.clip(image, 0, 255).astype('uint8')
+
+
+def ean13_widths(code):
+    digits = [int(c) for c in code]
+    widths = [1, 1, 1]
+    for parity, digit in zip(decoding.EAN_PARITY[digits[0]], digits[1:7]):
+        pattern = decoding.EAN_WIDTHS[digit]
+        widths += pattern if parity == 'L' else pattern[::-1]
+    widths += [1] * 5
+    for digit in digits[7:]:
+        widths += decoding.EAN_WIDTHS[digit]
+    return widths + [1, 1, 1]
+
+
+def code128_widths(text):
+    values = [104] + [ord(c) - 32 for c in text]  # code set B
+    values.append((values[0] + sum(i * v for i, v in enumerate(values[1:], start=1))) % 103)
+    return [int(w) for value in values for w in decoding.CODE128_WIDTHS[value]] + [int(w) for w in decoding.CODE128_STOP]
+
+
+def pgm(image):
+    return b'P5\n%d %d\n255\n' % (image.shape[1], image.shape[0]) + image.tobytes()
+
+
+@skipIf(decoding.np is None, "numpy is not installed")
+class BarcodeDecodingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+
+    def test_decodes_each_symbology_in_any_orientation(self):
+        cases = (
+            (ean13_widths('4006381333931'), {'code': '4006381333931', 'format': 'ean13'}),
+            (ean13_widths('0036000291452'), {'code': '036000291452', 'format': 'upc_a'}),
+            (code128_widths('SKU-42/b'), {'code': 'SKU-42/b', 'format': 'code128'}),
+        )
+        for widths, expected in cases:
+            image = barcode_image(widths, scale=2, noise=25)
+            for oriented in (image, image[::-1, ::-1], image.T):
+                self.assertEqual(decoding.decode_array(oriented), [expected])
+        # Noise alone never reads as a barcode
+        noise = decoding.np.random.default_rng(1).integers(0, 256, (120, 400)).astype('uint8')
+        self.assertEqual(decoding.decode_array(noise), [])
+
+    def test_decode_endpoint_looks_up_products(self):
+        product = Goods.objects.create(user=self.user, name='Drill', quantity=3, barcode='0036000291452')
+        upload = [
+            SimpleUploadedFile('upc.pgm', pgm(barcode_image(ean13_widths('0036000291452')))),
+            SimpleUploadedFile('junk.jpg', b'not an image'),
+        ]
+        with mock.patch.object(decoding, 'DECODE_WORKERS', 1):
+            response = self.client.post(reverse('api_barcode_decode'), {'image': upload})
+        self.assertEqual(response.status_code, 200)
+        first, second = response.json()['results']
+        self.assertEqual(first['barcodes'], [{'code': '036000291452', 'format': 'upc_a'}])
+        self.assertEqual(first['product']['id'], product.pk)
+        self.assertEqual((second['barcodes'], second['product']), ([], None))
+        self.assertIn('errors', second)
+
+    def test_decode_batch_uses_worker_pool(self):
+        images = [pgm(barcode_image(code128_widths(f'BOX-{i}'))) for i in range(3)]
+        with mock.patch.object(decoding, 'DECODE_WORKERS', 2), \
+                mock.patch.object(decoding, 'get_pool') as get_pool:
+            get_pool.return_value.map.side_effect = map
+            results = decoding.decode_images(images)
+        get_pool.return_value.map.assert_called_once()
+        self.assertEqual([found[0]['code'] for found, _ in results], ['BOX-0', 'BOX-1', 'BOX-2'])
+
+    def test_retrieve_view_accepts_photo(self):
+        Goods.objects.create(user=self.user, name='Hammer', quantity=2, barcode='4006381333931')
+        photo = SimpleUploadedFile('photo.pgm', pgm(barcode_image(ean13_widths('4006381333931'))))
+        response = self.client.post(reverse('barcode_retrieve'), {'image': photo})
+        self.assertEqual(response.context['product'].name, 'Hammer')
+
+    def test_oversized_images_are_refused_before_decoding(self):
+        image = pgm(barcode_image(ean13_widths('4006381333931')))
+        with mock.patch.object(decoding, 'MAX_IMAGE_PIXELS', 1000), mock.patch.object(decoding, 'DECODE_WORKERS', 1):
+            with self.assertRaisesMessage(ValueError, decoding.TOO_LARGE_MESSAGE):
+                decoding.load_image(image)
+            # The header alone is enough: a huge frame is refused without its pixels
+            with self.assertRaisesMessage(ValueError, decoding.TOO_LARGE_MESSAGE):
+                decoding.load_image(b'P5\n100000 100000\n255\n')
+            response = self.client.post(reverse('api_barcode_decode'), {'image': SimpleUploadedFile('big.pgm', image)})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['errors'], f'big.pgm: {decoding.TOO_LARGE_MESSAGE}')
+
+    def test_retrieve_view_refuses_large_photos_unread(self):
+        photo = SimpleUploadedFile('photo.pgm', pgm(barcode_image(ean13_widths('4006381333931'))))
+        with mock.patch.object(decoding, 'DECODE_MAX_IMAGE_SIZE', 100), \
+                mock.patch.object(decoding, 'decode_images') as decode_images:
+            response = self.client.post(reverse('barcode_retrieve'), {'image': photo})
+        decode_images.assert_not_called()
+        self.assertIsNone(response.context['product'])
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)], ['Photos may be at most 0 MB.'])
+
+    @skipIf(importlib.util.find_spec('PIL') is None, "Pillow is not installed")
+    def test_decompression_bombs_are_refused(self):
+        from PIL import Image
+        photo = io.BytesIO()
+        Image.new('L', (400, 300)).save(photo, 'PNG')
+        # Pillow raises DecompressionBombError itself above twice its own limit
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            with self.assertRaisesMessage(ValueError, decoding.TOO_LARGE_MESSAGE):
+                decoding.load_image(photo.getvalue())
+        with mock.patch.object(decoding, 'MAX_IMAGE_PIXELS', 1000):
+            with self.assertRaisesMessage(ValueError, decoding.TOO_LARGE_MESSAGE):
+                decoding.load_image(photo.getvalue())
+
+
+class ChoicesCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.acme = Customer.objects.create(name='Acme', user=self.user)
+        self.product = Goods.objects.create(user=self.user, name='Saw', quantity=1)
+
+    def choice_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tables = ('FROM "supply_chain_app_category"', 'FROM "supply_chain_app_customer"')
+        return [q['sql'] for q in queries if any(table in q['sql'] for table in tables)]
+
+    def test_views_share_cached_choices(self):
+        urls = [reverse('dashboard'), reverse('edit_good', args=[self.product.pk]), reverse('barcode_scanner')]
+        self.assertEqual(len(self.choice_queries(urls[0])), 2)
+        for url in urls:
+            self.assertEqual(self.choice_queries(url), [])
+
+        # Saving or deleting a category/customer makes the next request reload the lists
+        Category.objects.create(name='Paint', user=self.user)
+        self.assertEqual(len(self.choice_queries(urls[1])), 2)
+        self.assertEqual([c.name for c in choices.for_user(self.user).categories], ['Tools', 'Paint'])
+        self.acme.delete()
+        self.assertEqual(choices.for_user(self.user).customers, [])
+
+    def test_goods_form_is_scoped_to_user(self):
+        other = User.objects.create_user(username='other')
+        theirs = Category.objects.create(name='Theirs', user=other)
+        form = GoodsForm(user=self.user)
+        self.assertEqual([value for value, _ in form.fields['category'].choices][1:], [self.tools.pk])
+
+        data = {'name': 'Drill', 'quantity': 1, 'price': '1', 'description': '', 'category': theirs.pk}
+        self.assertIn('category', GoodsForm(data, user=self.user).errors)
+        data['category'] = self.tools.pk
+        self.assertTrue(GoodsForm(data, user=self.user).is_valid())
+
+    def test_scanner_accepts_cached_ids(self):
+        choices.for_user(self.user)
+        data = {
+            'barcode': '4006381333931', 'name': 'Drill', 'quantity': '2', 'price': '5',
+            'description': 'Cordless', 'category': self.tools.pk, 'customer': self.acme.pk,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('barcode_scanner'), data)
+        self.assertFalse([q for q in queries if 'FROM "supply_chain_app_category"' in q['sql']])
+        self.assertEqual(Goods.objects.get(barcode='4006381333931').category, self.tools)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.acme = Customer.objects.create(name='Acme', user=self.user)
+        self.saw = Goods.objects.create(user=self.user, name='Saw', quantity=1, category=self.tools)
+        self.drill = Goods.objects.create(user=self.user, name='Drill', quantity=2, customer=self.acme)
+
+    def get(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode(), len(queries)
+
+    def row_key(self, product):
+        product.refresh_from_db()
+        names = (product.category.name if product.category else '', product.customer.name if product.customer else '')
+        return make_template_fragment_key('goods_row', [product.pk, product.updated_at, *names])
+
+    def test_unchanged_pages_come_from_the_cache(self):
+        pages = {
+            'goods_list': fragments.page_key(self.user.pk, 'goods', None, None),
+            'customer_list': fragments.page_key(self.user.pk, 'customers', None, None),
+        }
+        for url_name, key in pages.items():
+            _, queries = self.get(url_name)
+            page, cached_queries = self.get(url_name)
+            # Only the session and user are loaded; the table is not queried again
+            self.assertEqual(cached_queries, queries - 1, url_name)
+            self.assertIn(cache.get(key), page)
+
+    def test_writes_show_up_on_the_next_request(self):
+        self.get('goods_list')
+        stock.adjust(self.user, self.saw.pk, 4)
+        self.assertIn('<td class="px-6 py-4 whitespace-nowrap">5</td>', self.get('goods_list')[0])
+
+        self.tools.name = 'Hand Tools'
+        self.tools.save()
+        self.assertIn('Hand Tools', self.get('goods_list')[0])
+
+        self.get('customer_list')
+        self.acme.name = 'Acme Ltd'
+        self.acme.save()
+        self.assertIn('Acme Ltd', self.get('customer_list')[0])
+        self.assertIn('Acme Ltd', self.get('goods_list')[0])
+
+    def test_only_changed_rows_are_rendered_again(self):
+        self.get('goods_list')
+        saw_key, drill_key = self.row_key(self.saw), self.row_key(self.drill)
+        self.assertIsNotNone(cache.get(drill_key))
+
+        self.saw.name = 'Hacksaw'
+        self.saw.save()
+        cache.set(drill_key, 'cached drill row', fragments.FRAGMENT_TIMEOUT)
+        page = self.get('goods_list')[0]
+        self.assertIn('Hacksaw', page)
+        self.assertIn('cached drill row', page)
+        self.assertNotEqual(self.row_key(self.saw), saw_key)
+
+    def test_cached_rows_delete_through_the_page_form(self):
+        page = self.get('goods_list')[0]
+        self.assertEqual(page.count('csrfmiddlewaretoken'), 1)
+        self.assertIn(f'formaction="{reverse("delete_good", args=[self.saw.pk])}"', page)
+        self.client.post(reverse('delete_good', args=[self.saw.pk]))
+        self.assertNotIn('Saw', self.get('goods_list')[0])
+
+
+class InfiniteScrollTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+
+    # Follow X-Next-Page from the first page's cursor; returns the row batches
+    def scroll(self, list_name, rows_name):
+        page = self.client.get(reverse(list_name)).content.decode()
+        url = reverse(rows_name) + page.split(f'data-next="{reverse(rows_name)}', 1)[1].split('"', 1)[0]
+        batches = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            batches.append(response.content.decode())
+            url = response.get('X-Next-Page')
+        return [page] + batches
+
+    def test_goods_batches_are_rows_only_and_cover_every_product_once(self):
+        make_goods(self.user, PAGE_SIZE * 2 + 5)
+        page, *batches = self.scroll('goods_list', 'goods_rows')
+        self.assertEqual(len(batches), 2)
+        for batch in batches:
+            self.assertNotIn('<html', batch)
+            self.assertNotIn('<table', batch)
+            self.assertTrue(batch.strip().startswith('<tr>'))
+        names = [line for html in [page, *batches] for line in html.split('\n') if '>Item ' in line]
+        self.assertEqual(len(names), PAGE_SIZE * 2 + 5)
+        self.assertEqual(len(set(names)), len(names))
+
+    def test_customer_list_pages_and_scrolls(self):
+        for i in range(PAGE_SIZE + 3):
+            Customer.objects.create(user=self.user, name=f'Customer {i}')
+        page, *batches = self.scroll('customer_list', 'customer_rows')
+        self.assertIn('Older &rarr;', page)
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].count('<tr'), 3)
+        self.assertIn('Customer 0<', batches[0])
+
+    def test_last_page_has_no_loader_and_batches_are_per_user(self):
+        make_goods(self.user, 2)
+        self.assertNotIn('data-infinite-scroll', self.client.get(reverse('goods_list')).content.decode())
+        other = User.objects.create_user(username='other', password='secret')
+        make_goods(other, 1, start=10)
+        response = self.client.get(reverse('goods_rows'))
+        self.assertNotIn('Item 10', response.content.decode())
+        self.assertNotIn('X-Next-Page', response)
+
+    def test_batches_are_cached_and_refreshed_on_writes(self):
+        make_goods(self.user, 3)
+        url = reverse('goods_rows')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries), 2)  # session and user only
+        Goods.objects.filter(user=self.user, name='Item 1').get().delete()
+        self.assertNotIn('Item 1<', self.client.get(url).content.decode())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.saw = Goods.objects.create(user=self.user, name='Saw', quantity=1, category=self.tools)
+
+    def test_unchanged_pages_get_304_without_touching_the_tables(self):
+        for url_name in ('goods_list', 'customer_list', 'category_list'):
+            url = reverse(url_name)
+            self.client.get(url)  # sets the CSRF cookie the page ETag depends on
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with CaptureQueriesContext(connection) as queries:
+                again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 304, url_name)
+            self.assertFalse([q for q in queries if 'supply_chain_app_' in q['sql']], url_name)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+            )
+
+    def test_writes_change_the_etag(self):
+        url = reverse('goods_list')
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        stock.adjust(self.user, self.saw.pk, 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.tools.name = 'Hand Tools'
+        self.tools.save()
+        self.assertEqual(self.client.get(reverse('category_list'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_api_reads_are_conditional(self):
+        urls = [
+            reverse('api_collection', args=['goods']),
+            reverse('api_item', args=['goods', self.saw.pk]),
+            reverse('api_goods_stock', args=[self.saw.pk]),
+        ]
+        for url in urls:
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304, url)
+        self.client.patch(urls[1], json.dumps({'quantity': 7}), content_type='application/json')
+        response = self.client.get(urls[2], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity'], 7)
+
+
+class InstantiationQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        choices.for_user(self.user)  # dropdown choices come from the warm cache
+
+    def test_building_forms_and_models_issues_no_queries(self):
+        with self.assertNumQueries(0):
+            GoodsForm(user=self.user)
+            CategoryForm(prefix='category')
+            CustomerForm()
+            CustomerForm({'name': 'Acme', 'email': 'acme@gmail.com'}).is_valid()
+            Goods(name='Saw', quantity=1)
+            Category(name='Tools')
+            Customer(name='Acme')
+            [Goods(user=self.user, name=f'Item {i}', quantity=i) for i in range(100)]
+
+    def test_dashboard_creates_category_for_current_user(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('dashboard'), {'submit_category': '1', 'category-name': 'Tools'})
+        self.assertEqual(Category.objects.get(name='Tools').user, self.user)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        make_goods(self.user, 3)
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.get(reverse('goods_list'))
+        self.client.get(reverse('goods_list'))
+        self.client.get('/no-such-page/')
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('supplychain_requests_total{view="goods_list",method="GET",status="200"} 2', body)
+        self.assertIn('supplychain_requests_total{view="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('supplychain_request_duration_seconds_count{view="goods_list",method="GET"} 2', body)
+        self.assertIn('supplychain_request_db_queries_count{view="goods_list"} 2', body)
+        self.assertIn('supplychain_response_size_bytes_bucket{view="goods_list",le="+Inf"} 2', body)
+        self.assertIn('supplychain_template_render_seconds_total{view="goods_list"}', body)
+        self.assertIn('# TYPE supplychain_request_duration_seconds histogram', body)
+
+    def test_query_counts_match_what_the_view_ran(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('goods_list'))
+        stats = metrics.registry.queries.values[('goods_list',)]
+        self.assertEqual(stats[-2], 1)
+        self.assertEqual(stats[-1], len(queries))
+
+    def test_metrics_are_limited_to_allowed_addresses_and_staff(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs('supply_chain_app.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('goods_list'))
+        self.assertIn('GET /goods/ (goods_list)', logs.output[0])
+        self.assertIn('supply_chain_app_goods', logs.output[0])
+
+    def test_slow_request_log_is_off_by_default(self):
+        with self.assertNoLogs('supply_chain_app.slow_requests'):
+            self.client.get(reverse('goods_list'))
+
+
+class SyntheticDataTests(TestCase):
+    def rollups(self):
+        return {
+            model: sorted(model.objects.values_list('sku_count', 'unit_count', 'total_value'))
+            for model in (UserRollup, CategoryRollup, CustomerRollup)
+        }
+
+    def test_generates_users_and_keeps_rollups_and_search_in_step(self):
+        call_command(
+            'generate_fixture_data', users=2, categories=3, customers=2, goods=25, batch_size=10,
+            stdout=io.StringIO(),
+        )
+        user = User.objects.get(username='fixture-1')
+        self.assertTrue(user.check_password('fixture'))
+        self.assertEqual(Goods.objects.filter(user=user).count(), 25)
+        self.assertEqual(Category.objects.filter(user=user).count(), 3)
+        self.assertEqual(Goods.objects.filter(user=user).values('barcode').distinct().count(), 25)
+        product = Goods.objects.filter(user=user).first()
+        self.assertIn(product, search.ranked_goods(Goods.objects.all(), user, product.name))
+
+        incremental = self.rollups()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_same_seed_gives_same_data_and_prefixes_are_not_reused(self):
+        call_command('generate_fixture_data', prefix='a', goods=5, stdout=io.StringIO())
+        call_command('generate_fixture_data', prefix='b', goods=5, stdout=io.StringIO())
+        generated = [
+            list(Goods.objects.filter(user__username=f'{prefix}-0').order_by('id').values_list('name', 'price'))
+            for prefix in 'ab'
+        ]
+        self.assertEqual(generated[0], generated[1])
+        with self.assertRaises(CommandError):
+            call_command('generate_fixture_data', prefix='a', goods=5, stdout=io.StringIO())
+
+
+# Most SQL statements each page may run for a logged-in user, whatever the amount of data.
+# Raise a budget only together with the change that needs it.
+QUERY_BUDGETS = {
+    'dashboard': 6,  # including the low-stock and reorder suggestion panels
+    'goods_list': 2,  # session, user; the rendered page comes from the fragment cache
+    'search_goods': 5,
+    'customer_list': 2,
+    'goods_rows': 2,  # a row batch is cached like the page it continues
+    'customer_rows': 2,
+    'category_list': 3,
+    'edit_good': 3,
+    'barcode_scanner': 2,  # dropdowns come from the choices cache
+    'barcode_retrieve': 2,  # repeat scans come from the barcode lookup cache
+}
+
+# The same pages rendered with every cache empty: each table row is rendered afresh, so a query
+# per row would show up here even though the warm pages come from the fragment cache
+COLD_QUERY_BUDGETS = {
+    'dashboard': 8,
+    'goods_list': 3,
+    'search_goods': 5,
+    'customer_list': 3,
+    'goods_rows': 3,
+    'customer_rows': 3,
+    'category_list': 3,
+    'edit_good': 5,
+    'barcode_scanner': 4,
+    'barcode_retrieve': 2,
+}
+
+
+class QueryBudgetTests(TestCase):
+    # Every page is measured with two amounts of data: the count must stay the same (no query per
+    # row, the N+1 pattern) and within the page's budget
+    SIZES = (3, 20)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+
+    def requests(self):
+        product = Goods.objects.filter(user=self.user).latest('id')
+        product.barcode = f'9{product.pk:012d}'
+        product.save()
+        return {
+            'dashboard': ('get', reverse('dashboard'), None),
+            'goods_list': ('get', reverse('goods_list'), None),
+            'search_goods': ('get', reverse('search_goods'), {'q': 'Item'}),
+            'customer_list': ('get', reverse('customer_list'), None),
+            'goods_rows': ('get', reverse('goods_rows'), None),
+            'customer_rows': ('get', reverse('customer_rows'), None),
+            'category_list': ('get', reverse('category_list'), None),
+            'edit_good': ('get', reverse('edit_good', args=[product.pk]), None),
+            'barcode_scanner': ('get', reverse('barcode_scanner'), None),
+            'barcode_retrieve': ('post', reverse('barcode_retrieve'), {'barcode': product.barcode}),
+        }
+
+    # Query count of every page with empty caches (cold=True), so cached fragments cannot hide a
+    # query per row, or once the per-user caches are warm
+    def measure(self, cold=False):
+        counts = {}
+        for name, (method, url, data) in self.requests().items():
+            getattr(self.client, method)(url, data)
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url, data)
+            self.assertEqual(response.status_code, 200, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_rows(self):
+        make_goods(self.user, self.SIZES[0])
+        small = self.measure(), self.measure(cold=True)
+        make_goods(self.user, self.SIZES[1] - self.SIZES[0], start=self.SIZES[0])
+        large = self.measure(), self.measure(cold=True)
+        for state, budgets, small_counts, large_counts in zip(
+            ('warm', 'cold'), (QUERY_BUDGETS, COLD_QUERY_BUDGETS), small, large,
+        ):
+            for name in budgets:
+                with self.subTest(view=name, caches=state):
+                    self.assertEqual(large_counts[name], small_counts[name], f"{name} runs more queries with more rows")
+                    self.assertLessEqual(large_counts[name], budgets[name], f"{name} is over its query budget")
+
+    def test_every_budgeted_view_is_measured(self):
+        make_goods(self.user, 1)
+        self.assertEqual(set(self.requests()), set(QUERY_BUDGETS))
+        self.assertEqual(set(COLD_QUERY_BUDGETS), set(QUERY_BUDGETS))
+
+
+class StockAdjustmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.drill = Goods.objects.create(user=self.user, name='Drill', quantity=5, price='10.00', category=self.tools)
+
+    def test_adjust_applies_delta_and_keeps_rollups(self):
+        self.assertEqual(stock.adjust(self.user, self.drill.pk, 3), (8, 1))
+        self.assertEqual(stock.adjust(self.user, self.drill.pk, -10), (-2, 2))
+        self.assertEqual(CategoryRollup.objects.get(category=self.tools).unit_count, -2)
+        self.assertEqual(UserRollup.objects.get(user=self.user).total_value, Decimal('-20'))
+
+    def test_adjust_can_refuse_negative_stock(self):
+        with self.assertRaises(stock.InsufficientStock):
+            stock.adjust(self.user, self.drill.pk, -6, allow_negative=False)
+        self.assertEqual(stock.adjust(self.user, self.drill.pk, -5, allow_negative=False), (0, 1))
+        other = User.objects.create_user(username='other', password='secret')
+        with self.assertRaises(Goods.DoesNotExist):
+            stock.adjust(other, self.drill.pk, 1)
+
+    def test_endpoint(self):
+        url = reverse('api_goods_stock', args=[self.drill.pk])
+        response = self.client.post(url, {'delta': -2}, content_type='application/json')
+        self.assertEqual(response.json(), {'id': self.drill.pk, 'quantity': 3, 'version': 1})
+        response = self.client.post(url, {'delta': -4, 'allow_negative': False}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.post(url, {'delta': '1'}, content_type='application/json').status_code, 400)
+        missing = reverse('api_goods_stock', args=[self.drill.pk + 100])
+        self.assertEqual(self.client.post(missing, {'delta': 1}, content_type='application/json').status_code, 404)
+
+    def test_stale_edit_is_refused(self):
+        form = {'name': 'Drill', 'quantity': 50, 'price': '10.00', 'description': '', 'version': 0}
+        stock.adjust(self.user, self.drill.pk, 1)  # another station scans while the form is open
+        response = self.client.post(reverse('edit_good', args=[self.drill.pk]), form)
+        self.assertContains(response, 'changed by someone else')
+        self.assertEqual(Goods.objects.get(pk=self.drill.pk).quantity, 6)
+
+        response = self.client.post(reverse('edit_good', args=[self.drill.pk]), {**form, 'version': 1})
+        self.assertEqual(response.status_code, 302)
+        drill = Goods.objects.get(pk=self.drill.pk)
+        self.assertEqual((drill.quantity, drill.version), (50, 2))
+
+    def test_api_edit_checks_version(self):
+        url = reverse('api_item', args=['goods', self.drill.pk])
+        stock.adjust(self.user, self.drill.pk, 1)
+        stale = self.client.patch(url, {'quantity': 1, 'version': 0}, content_type='application/json')
+        self.assertEqual(stale.status_code, 409)
+        current = self.client.patch(url, {'quantity': 1, 'version': 1}, content_type='application/json')
+        self.assertEqual(current.json()['version'], 2)
+
+
+class StockContentionTests(TransactionTestCase):
+    # Threads use their own database connections, so the data has to be committed
+    THREADS = 8
+    ADJUSTMENTS = 25
+
+    def test_concurrent_adjustments_lose_no_updates(self):
+        user = User.objects.create_user(username='tester', password='secret')
+        product = Goods.objects.create(user=user, name='Drill', quantity=0, price='2.00')
+        errors = []
+
+        def station(delta):
+            done = attempts = 0
+            try:
+                while done < self.ADJUSTMENTS and attempts < 100 * self.ADJUSTMENTS:
+                    attempts += 1
+                    try:
+                        stock.adjust(user, product.pk, delta)
+                        done += 1
+                    except OperationalError:
+                        # The shared in-memory test database reports a lock at once where a
+                        # database file would wait for it (busy timeout); try again
+                        time.sleep(0.001)
+                if done < self.ADJUSTMENTS:
+                    errors.append(f'only {done} adjustments went through')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        # Every other station removes, so half the threads add 2 and half remove 1
+        threads = [threading.Thread(target=station, args=(2 if i % 2 else -1,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        product.refresh_from_db()
+        expected = self.THREADS // 2 * self.ADJUSTMENTS * (2 - 1)
+        self.assertEqual(product.quantity, expected)
+        self.assertEqual(product.version, self.THREADS * self.ADJUSTMENTS)
+        self.assertEqual(UserRollup.objects.get(user=user).unit_count, expected)
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    # Read back what a fresh connection reports, in a child process whose settings pick the profile
+    def connection_settings(self, profile):
+        script = (
+            "import json; from django.db import connection; cursor = connection.cursor(); "
+            "print(json.dumps({name: cursor.execute(f'PRAGMA {name}').fetchone()[0] "
+            "for name in ('journal_mode', 'busy_timeout', 'synchronous')} | "
+            "{'transaction_mode': connection.transaction_mode}))"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                'SUPPLYCHAIN_DB_PATH': os.path.join(tmp, 'profile.sqlite3'),
+                'SUPPLYCHAIN_DB_PROFILE': profile,
+            }
+            child = subprocess.run(
+                [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'shell', '-c', script],
+                env=env, check=True, stdout=subprocess.PIPE, text=True,
+            )
+        return json.loads(child.stdout)
+
+    def test_production_profile_applies_its_pragmas(self):
+        self.assertEqual(self.connection_settings('production'), {
+            'journal_mode': 'wal',
+            'busy_timeout': 5000,
+            'synchronous': 1,  # NORMAL
+            'transaction_mode': 'IMMEDIATE',
+        })
+        # The default profile leaves SQLite's own defaults alone
+        default = self.connection_settings('default')
+        self.assertEqual((default['journal_mode'], default['synchronous']), ('delete', 2))
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.client.force_login(self.user)
+        self.now = timezone.now()
+
+    def days_ago(self, days):
+        return self.now - timedelta(days=days)
+
+    # A product whose history is: received 10 ten days ago, issued 3 eight days ago,
+    # snapshot six days ago, received 5 four days ago
+    def product_with_history(self):
+        product = Goods.objects.create(user=self.user, name='Drill', quantity=12)
+        product.movements.all().delete()
+        for days, kind, quantity in ((10, 'receipt', 10), (8, 'issue', -3), (4, 'receipt', 5)):
+            StockMovement.objects.create(goods=product, kind=kind, quantity=quantity, created_at=self.days_ago(days))
+        StockSnapshot.objects.create(goods=product, taken_at=self.days_ago(6), quantity=7)
+        return product
+
+    def test_every_write_path_records_movements(self):
+        drill = Goods.objects.create(user=self.user, name='Drill', quantity=5, barcode='4006381333931')
+        drill.quantity = 8
+        drill.save()
+        stock.adjust(self.user, drill.pk, -2)
+        ScanBatch(self.user).apply([{'barcode': '4006381333931', 'quantity': 4}])
+        GoodsImporter(self.user).run([{'name': 'Saw', 'quantity': '7'}])
+
+        self.assertEqual(
+            list(drill.movements.order_by('id').values_list('kind', 'quantity')),
+            [('receipt', 5), ('adjustment', 3), ('issue', -2), ('receipt', 4)],
+        )
+        for product in Goods.objects.all():
+            self.assertEqual(product.movements.aggregate(total=Sum('quantity'))['total'], product.quantity)
+
+    def test_stock_at_replays_only_movements_after_the_nearest_snapshot(self):
+        product = self.product_with_history()
+        self.assertEqual(ledger.stock_at(product, self.days_ago(11)), 0)
+        self.assertEqual(ledger.stock_at(product, self.days_ago(9)), 10)
+        self.assertEqual(ledger.stock_at(product, self.days_ago(5)), 7)
+        with self.assertNumQueries(1):
+            self.assertEqual(ledger.stock_at(product, self.now), 12)
+        # The snapshot wins over the movements before it
+        StockSnapshot.objects.filter(goods=product).update(quantity=100)
+        self.assertEqual(ledger.stock_at(product, self.now), 105)
+
+    def test_compaction_folds_old_movements_into_snapshots(self):
+        product = self.product_with_history()
+        StockMovement.objects.create(goods=product, kind='issue', quantity=-1, created_at=self.days_ago(5))
+        ledger.compact(self.days_ago(3))
+
+        self.assertFalse(product.movements.exists())
+        self.assertEqual(StockSnapshot.objects.get(goods=product, taken_at=self.days_ago(3)).quantity, 11)
+        self.assertEqual(ledger.stock_at(product, self.now), 11)
+        # Before the cutoff, stock is known at snapshots only
+        self.assertEqual(ledger.stock_at(product, self.days_ago(5.5)), 7)
+        self.assertEqual(ledger.stock_at(product, self.days_ago(7)), 0)
+
+    def test_snapshots_only_cover_products_that_moved(self):
+        product = self.product_with_history()
+        Goods.objects.create(user=self.user, name='Idle', quantity=0)
+        self.assertEqual(ledger.take_snapshots(at=self.days_ago(1)), 1)
+        self.assertEqual(StockSnapshot.objects.get(goods=product, taken_at=self.days_ago(1)).quantity, 12)
+        self.assertEqual(ledger.take_snapshots(at=self.days_ago(1)), 0)
+
+    def test_history_endpoint(self):
+        product = self.product_with_history()
+        url = reverse('api_goods_stock', args=[product.pk])
+        response = self.client.get(url, {'from': self.days_ago(9).isoformat(), 'to': self.now.isoformat()}).json()
+        self.assertEqual((response['opening'], response['closing']), (10, 12))
+        self.assertEqual([(entry['kind'], entry['change'], entry['quantity']) for entry in response['movements']],
+                         [('issue', -3, 7), ('receipt', 5, 12)])
+        response = self.client.get(url, {'at': self.days_ago(9).isoformat()}).json()
+        self.assertEqual(response['quantity'], 10)
+        self.assertEqual(self.client.get(url, {'at': 'yesterday'}).status_code, 400)
+
+
+# Send raw bytes to runasgi serving `app` and return everything it answers until it closes
+def asgi_exchange(app, data):
+    async def exchange():
+        server = await asyncio.start_server(lambda r, w: runasgi.Connection(app, r, w).serve(), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(data)
+            response = await asyncio.wait_for(reader.read(), 10)
+            writer.close()
+        return response
+
+    return asyncio.run(exchange())
+
+
+# A minimal ASGI application answering with the length of the request body
+async def body_length_app(scope, receive, send):
+    body = (await receive())['body']
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b'%d' % len(body)})
+
+
+class AsyncScannerTests(TestCase):
+    def setUp(self):
+        barcodes.lookup_cache.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.tools = Category.objects.create(name='Tools', user=self.user)
+        self.acme = Customer.objects.create(name='Acme', user=self.user)
+        self.drill = Goods.objects.create(
+            user=self.user, name='Drill', quantity=4, price='9.50', category=self.tools, barcode='4006381333931',
+        )
+
+    async def test_lookup_endpoint(self):
+        url = reverse('api_barcode_lookup', args=['4006381333931'])
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+        auth = 'Basic ' + base64.b64encode(b'tester:secret').decode()
+        response = await self.async_client.get(url, headers={'authorization': auth})
+        self.assertEqual(response.json()['id'], self.drill.pk)
+        self.assertEqual(response.json()['category_name'], 'Tools')
+
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual((await self.async_client.get(url)).json()['quantity'], 4)
+        missing = await self.async_client.get(reverse('api_barcode_lookup', args=['5000000000000']))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_scanner_pages(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('barcode_retrieve'), {'barcode': '4006381333931'})
+        self.assertContains(response, 'Drill')
+
+        response = await self.async_client.post(reverse('barcode_scanner'), {
+            'barcode': '0012345678905', 'name': 'Saw', 'quantity': '2', 'price': '5',
+            'description': 'Hand saw', 'category': self.tools.pk, 'customer': self.acme.pk,
+        })
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        saw = await Goods.objects.aget(barcode='0012345678905')
+        self.assertEqual((saw.user_id, saw.category_id, saw.quantity), (self.user.pk, self.tools.pk, 2))
+
+    def test_runasgi_serves_the_site(self):
+        metrics.registry.reset()
+        app = get_asgi_application()
+
+        # Two requests on one keep-alive connection, answered in order
+        data = asgi_exchange(
+            app,
+            b'GET /api/v1/barcodes/4006381333931/ HTTP/1.1\r\nHost: testserver\r\n\r\n'
+            b'GET /login/ HTTP/1.1\r\nHost: testserver\r\nConnection: close\r\n\r\n',
+        )
+        self.assertTrue(data.startswith(b'HTTP/1.1 401 Unauthorized\r\n'))
+        self.assertIn(b'HTTP/1.1 200 OK\r\n', data)
+        self.assertTrue(data.endswith(b'</html>\n'))
+        # The metrics middleware ran on the async path
+        self.assertIn(('api_barcode_lookup', 'GET', '401'), metrics.registry.requests.values)
+
+
+class AsgiServerTests(SimpleTestCase):
+    def test_bodies_must_arrive_in_time_and_within_the_limit(self):
+        with mock.patch.object(runasgi, 'BODY_TIMEOUT', 0.2):
+            # Ten of the hundred bytes announced, then nothing
+            data = asgi_exchange(body_length_app, b'POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n0123456789')
+        self.assertTrue(data.startswith(b'HTTP/1.1 408 Request Timeout\r\n'))
+
+        too_long = b'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (runasgi.MAX_BODY_SIZE + 1)
+        self.assertTrue(asgi_exchange(body_length_app, too_long).startswith(b'HTTP/1.1 413 Payload Too Large\r\n'))
+
+    def test_application_errors_still_get_an_answer(self):
+        async def fails(scope, receive, send):
+            raise RuntimeError('boom')
+
+        async def fails_midway(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'partial', 'more_body': True})
+            raise RuntimeError('boom')
+
+        request = b'GET / HTTP/1.1\r\nHost: testserver\r\n\r\n'
+        with self.assertLogs('supply_chain_app.runasgi', 'ERROR'):
+            data = asgi_exchange(fails, request)
+        self.assertTrue(data.startswith(b'HTTP/1.1 500 Internal Server Error\r\n'))
+        self.assertIn(b'\r\nConnection: close\r\n', data)
+
+        # Too late for a 500: the connection is closed, leaving the chunked body unterminated
+        with self.assertLogs('supply_chain_app.runasgi', 'ERROR'):
+            data = asgi_exchange(fails_midway, request)
+        self.assertTrue(data.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertTrue(data.endswith(b'7\r\npartial\r\n'))
+
+    def test_http10_responses_and_content_length(self):
+        # A streamed response to HTTP/1.0 is sent as is and ended by closing the connection
+        data = asgi_exchange(body_length_app, b'POST / HTTP/1.0\r\nConnection: keep-alive\r\nContent-Length: 3\r\n\r\nabc')
+        head, _, body = data.partition(b'\r\n\r\n')
+        self.assertNotIn(b'transfer-encoding', head.lower())
+        self.assertIn(b'\r\nconnection: close', head.lower())
+        self.assertEqual(body, b'3')
+
+        for lengths in (b'3, 3', b'+3', b'3\r\nContent-Length: 3', b'3\r\nContent-Length: 4'):
+            request = b'POST / HTTP/1.1\r\nContent-Length: %s\r\n\r\nabcd' % lengths
+            self.assertTrue(asgi_exchange(body_length_app, request).startswith(b'HTTP/1.1 400 Bad Request\r\n'), lengths)
@@ -1,5 +1,7 @@
 from django.urls import path
 from . import views
+from . import api
+from . import metrics
 urlpatterns = [
     path('', views.home, name='home'),
     path('login/', views.login, name='login'),
@@ -11,10 +13,24 @@ urlpatterns = [
     path('categories/', views.category_list, name='category_list'),
     path('delete-category/<int:pk>/', views.delete_category, name='delete_category'),
     path('goods/', views.goods_list, name='goods_list'),
+    path('goods/rows/', views.goods_rows, name='goods_rows'),
+    path('goods/import/', views.import_goods, name='import_goods'),
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
+    path('export/<slug:dataset>.<slug:fmt>', views.export_data, name='export_data'),
     path('customers/', views.customer_list, name='customer_list'),
+    path('customers/rows/', views.customer_rows, name='customer_rows'),
     path('customers/edit/<int:pk>/', views.edit_customer, name='edit_customer'),
     path('customers/delete/<int:pk>/', views.delete_customer, name='delete_customer'),
     path('categories/edit/<int:pk>/', views.edit_category, name='edit_category'),
     path('barcode_scanner/', views.barcode_scanner, name='barcode_scanner'),
     path('barcode_retrieve/', views.barcode_retrieve, name='barcode_retrieve'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    # JSON API (goods, categories, customers)
+    path('api/v1/scans/', api.scans, name='api_scans'),
+    path('api/v1/goods/<int:pk>/stock/', api.goods_stock, name='api_goods_stock'),
+    path('api/v1/barcodes/decode/', api.decode_barcodes, name='api_barcode_decode'),
+    path('api/v1/barcodes/<str:barcode>/', api.barcode_lookup, name='api_barcode_lookup'),
+    path('api/v1/<slug:resource>/', api.collection, name='api_collection'),
+    path('api/v1/<slug:resource>/batch/', api.batch, name='api_batch'),
+    path('api/v1/<slug:resource>/<int:pk>/', api.item, name='api_item'),
 ]
\ No newline at end of file
@@ -0,0 +1,30 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Version counters kept in the cache. Keys built from a version become unreachable as soon as it is
+# bumped, which drops everything cached under the old version without having to find it.
+
+
+def get(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so an evicted version never points back at old entries
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump(key):
+    # Bump now so this request sees its own change, and again on commit so entries cached by other
+    # requests while the transaction was open are not kept either
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key))
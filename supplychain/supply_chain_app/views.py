@@ -25,6 +25,81 @@ from django.contrib.auth.models import User
 
 from django.contrib import messages
 
+# Cursor (keyset) pagination helpers for the goods tables
+from .pagination import keyset_page, goods_table_queryset
+
+# Full-text search over goods (SQLite FTS5, icontains elsewhere)
+from . import search
+
+# Indexed, cached barcode lookups for the scanner pages
+from . import barcodes
+
+# Server-side barcode decoding of uploaded photos
+from . import decoding
+
+# Cached per-user category/customer dropdown choices
+from . import choices
+
+# Cached rendering of the goods and customer tables
+from . import fragments
+from django.template.loader import render_to_string
+
+# ETag / Last-Modified support for the list pages
+from . import conditional
+
+# Runs blocking work (barcode decoding) from the async scanner views
+from asgiref.sync import sync_to_async
+
+# Atomic stock adjustments and version-checked product edits
+from . import stock
+
+# Raised when a scanned barcode is already used by another product
+from django.db import IntegrityError
+
+# Goods import (run by the background workers)
+from .importer import COLUMNS as IMPORT_COLUMNS
+
+# Streaming CSV/NDJSON exports
+from . import exporter
+from django.http import Http404, StreamingHttpResponse
+
+# Soft delete of categories and customers
+from . import deletion
+
+# Background jobs and their status
+from . import jobs, tasks
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.cache import never_cache
+
+# Low-stock and reorder suggestion panels
+from . import alerts, forecast
+from .models import ReorderSuggestion
+
+# Row batches for the infinite-scroll tables
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+
+
+# Shown when a product edit is refused because someone else saved the product in the meantime
+STALE_EDIT_MESSAGE = "This product was changed by someone else while you were editing. Open the product again to see the current values."
+
+
+# Save a valid GoodsForm for user. An edit only goes through if the product is still the version the
+# form was rendered from; otherwise the form gets an error and False is returned.
+def save_goods_form(form, user):
+    good = form.save(commit=False)
+    good.user = user
+    if good.pk is None:
+        good.save()
+        return True
+    try:
+        stock.save_if_current(good, form.cleaned_data['version'])
+    except stock.StaleVersion:
+        form.add_error(None, STALE_EDIT_MESSAGE)
+        return False
+    return True
 
 
 # A simple view function to render the home page
@@ -100,16 +175,13 @@ def dashboard(request):
     edit_mode = False
     good_instance = None
 
-    # Get all goods that belong to the currently logged-in user, ordered by newest first
-    goods = Goods.objects.filter(user=request.user).order_by('-date_added')  
+    # Get goods that belong to the currently logged-in user, with category/customer joined in
+    goods = goods_table_queryset(request.user)
 
-    # If there's a search query, filter the goods based on name, description, or category name
+    # If there's a search query, filter the goods on name, description, or category name
+    # through the full-text index (the table stays newest-first so it can be paged)
     if query:
-        goods = goods.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+        goods = search.filter_goods(goods, request.user, query)
 
     # If the URL contains 'edit_good', prepare to edit that specific good
     if 'edit_good' in request.GET:
@@ -118,18 +190,17 @@ def dashboard(request):
         # Fetch the good to edit; return 404 if it doesn't exist or doesn't belong to the user
         good_instance = get_object_or_404(Goods, id=good_id, user=request.user)
         # Pre-fill the form with the instance's data
-        goods_form = GoodsForm(request.POST or None, instance=good_instance)
+        goods_form = GoodsForm(request.POST or None, instance=good_instance, user=request.user)
     else:
         # Empty form for adding new goods
-        goods_form = GoodsForm(request.POST or None)
+        goods_form = GoodsForm(request.POST or None, user=request.user)
 
     # Initialize the category and customer forms
     category_form = CategoryForm(request.POST or None, prefix='category')  # Prefix avoids field name clashes
     customer_form = CustomerForm(request.POST or None)
 
-    # Get categories and customers that belong to the current user
-    categories = Category.objects.filter(user=request.user)
-    customers = Customer.objects.filter(user=request.user)
+    # Get categories and customers that belong to the current user (cached between requests)
+    user_choices = choices.for_user(request.user)
 
     # Handle POST requests (form submissions)
     if request.method == 'POST':
@@ -137,19 +208,19 @@ def dashboard(request):
         if 'submit_good' in request.POST:
             # Use the existing instance if editing
             if good_instance:
-                goods_form = GoodsForm(request.POST, instance=good_instance)
+                goods_form = GoodsForm(request.POST, instance=good_instance, user=request.user)
             else:
-                goods_form = GoodsForm(request.POST)
+                goods_form = GoodsForm(request.POST, user=request.user)
 
-            if goods_form.is_valid():
-                good = goods_form.save(commit=False)
-                good.user = request.user  # Associate the good with the current user
-                goods_form.save()
+            # Save the good for the current user (edits are checked against concurrent changes)
+            if goods_form.is_valid() and save_goods_form(goods_form, request.user):
                 return redirect('dashboard')  # Redirect to clear the form and refresh data
 
         # If the user submitted the category form
         elif 'submit_category' in request.POST and category_form.is_valid():
-            category_form.save()
+            category = category_form.save(commit=False)
+            category.user = request.user  # Associate the category with the current user
+            category.save()
             return redirect('dashboard')
 
         # If the user submitted the customer form
@@ -159,14 +230,44 @@ def dashboard(request):
             customer_form.save()
             return redirect('dashboard')
 
+    # Only load one page of goods, newest first, positioned by the after/before cursors
+    page = keyset_page(goods, after=request.GET.get('after'), before=request.GET.get('before'))
+
+    # Portfolio totals come from the maintained rollup row rather than aggregating every product
+    portfolio = UserRollup.objects.filter(user=request.user).first()
+
+    # Products at or below their reorder point, read from the low-stock partial index; one row past
+    # the panel size tells the template there are more
+    low_stock = list(
+        alerts.low_stock(request.user)
+        .only('id', 'name', 'quantity', 'reorder_point', 'reorder_qty')[:alerts.LOW_STOCK_PANEL_SIZE + 1]
+    )
+
+    # The largest orders proposed by the last demand forecast, leaving out products hidden since
+    suggestions = list(
+        ReorderSuggestion.objects.filter(
+            user=request.user,
+            goods__category__deleted_at__isnull=True, goods__customer__deleted_at__isnull=True,
+        )
+        .select_related('goods')
+        .only('daily_demand', 'reorder_point', 'quantity', 'computed_at', 'goods__name', 'goods__quantity')
+        .order_by('-quantity')[:forecast.SUGGESTION_PANEL_SIZE + 1]
+    )
+
     # Prepare context data to be sent to the dashboard template
     context = {
         'form': goods_form,
         'category_form': category_form,
         'customer_form': customer_form,
-        'goods': goods,
-        'categories': categories,
-        'customers': customers,
+        'goods': page,
+        'page': page,
+        'portfolio': portfolio,
+        'low_stock': low_stock,
+        'low_stock_panel_size': alerts.LOW_STOCK_PANEL_SIZE,
+        'suggestions': suggestions,
+        'suggestion_panel_size': forecast.SUGGESTION_PANEL_SIZE,
+        'categories': user_choices.categories,
+        'customers': user_choices.customers,
         'query': query,
         'edit_mode': edit_mode,
     }
@@ -178,10 +279,9 @@ def dashboard(request):
 
 # Restrict access to logged-in users; redirect to 'login' page if not authenticated
 @login_required(login_url='login')
+# Answer GETs with 304 while the user's data is unchanged
+@conditional.page
 def customer_list(request):
-    # Get all customers that belong to the current logged-in user, ordered by newest first
-    customers = Customer.objects.filter(user=request.user).order_by('-date_added')
-
     # Initialize the customer form (bind POST data if available)
     form = CustomerForm(request.POST or None)
 
@@ -195,9 +295,21 @@ def customer_list(request):
             form.save()  # Save the customer to the database
             return redirect('customer_list')  # Refresh the page after submission
 
-    # Render the customer list page with the list of customers and the form
+    after, before = request.GET.get('after'), request.GET.get('before')
+
+    def render_table():
+        # One page of the customers that belong to the current logged-in user, newest first
+        page = keyset_page(Customer.objects.filter(user=request.user), after=after, before=before)
+        return render_to_string('customer_table.html', {
+            'customers': page, 'page': page, 'fragment_timeout': fragments.FRAGMENT_TIMEOUT,
+        })
+
+    # The rendered table is cached until the user's customers change
+    table = fragments.cached_page(fragments.page_key(request.user.pk, 'customers', after, before), render_table)
+
+    # Render the customer list page with the (possibly cached) table and the form
     return render(request, 'customer_list.html', {
-        'customers': customers,
+        'table': table,
         'form': form,
     })
 
@@ -236,7 +348,7 @@ def delete_customer(request, pk):
 
     # Only allow deletion via POST request to prevent accidental deletes
     if request.method == 'POST':
-        customer.delete()  # Delete the customer record
+        deletion.delete(customer)  # Soft-delete; the customer's products are purged in the background
         return redirect('customer_list')  # Redirect to customer list after deletion
 
     # If not a POST request, redirect to customer list (no deletion happens)
@@ -253,22 +365,21 @@ def edit_good(request, pk):
     good = get_object_or_404(Goods, pk=pk, user=request.user)
     
     # Create the form with POST data if available, and bind it to the existing Good instance
-    form = GoodsForm(request.POST or None, instance=good)
+    form = GoodsForm(request.POST or None, instance=good, user=request.user)
 
     # If the form is submitted and valid, save the updated Good
-    if request.method == 'POST' and form.is_valid():
-        form.save()
+    # (unless someone else changed the product since the form was shown)
+    if request.method == 'POST' and form.is_valid() and save_goods_form(form, request.user):
         return redirect('dashboard')  # Redirect to the dashboard after saving
 
-    # Fetch categories and customers associated with the logged-in user
-    categories = Category.objects.filter(user=request.user)
-    customers = Customer.objects.filter(user=request.user)
+    # Fetch categories and customers associated with the logged-in user (cached between requests)
+    user_choices = choices.for_user(request.user)
 
     # Pass the form and related data to the template
     context = {
         'form': form,
-        'categories': categories,
-        'customers': customers,
+        'categories': user_choices.categories,
+        'customers': user_choices.customers,
     }
 
     # Render the edit form page
@@ -277,17 +388,63 @@ def edit_good(request, pk):
 
 # Restrict access to logged-in users; redirect to 'login' if not authenticated
 @login_required(login_url='login')
+# Answer GETs with 304 while the user's data is unchanged
+@conditional.page
 def goods_list(request):
-    # Retrieve all Goods that belong to the currently logged-in user
-    # and order them by the most recently added first
-    goods = Goods.objects.filter(user=request.user).order_by('-date_added')
+    after, before = request.GET.get('after'), request.GET.get('before')
+
+    def render_table():
+        # Retrieve one page of Goods that belong to the currently logged-in user,
+        # newest first, with category and customer fetched in the same query
+        page = keyset_page(goods_table_queryset(request.user), after=after, before=before)
+        return render_to_string('goods_table.html', {
+            'goods': page, 'page': page, 'fragment_timeout': fragments.FRAGMENT_TIMEOUT,
+        })
+
+    # The rendered table is cached until the user's goods, categories or customers change
+    table = fragments.cached_page(fragments.page_key(request.user.pk, 'goods', after, before), render_table)
+
+    # Render the goods list template around the (possibly cached) table
+    return render(request, 'goods_list.html', {'table': table})
+
+
+
+# Only the table rows of the batch after the `after` cursor, for the infinite-scroll script on the
+# list pages. The URL of the following batch is sent in X-Next-Page (absent after the last one).
+def rows_response(request, name, queryset, template, context_name):
+    after = request.GET.get('after')
+
+    def render_rows():
+        page = keyset_page(queryset, after=after)
+        html = render_to_string(template, {context_name: page, 'fragment_timeout': fragments.FRAGMENT_TIMEOUT})
+        return html, page.next_cursor
 
-    # Render the goods list template and pass the retrieved goods to the context
-    return render(request, 'goods_list.html', {'goods': goods})
+    # Cached like the full pages, so scrolling back through a list already seen costs no queries
+    html, next_cursor = fragments.cached_page(fragments.page_key(request.user.pk, name, after), render_rows)
+    response = HttpResponse(html)
+    if next_cursor:
+        response['X-Next-Page'] = f"{request.path}?{urlencode({'after': next_cursor})}"
+    return response
+
+
+# Restrict access to logged-in users; rows carry no CSRF token, so the API validators apply
+@login_required(login_url='login')
+@conditional.api
+def goods_rows(request):
+    return rows_response(request, 'goods_rows', goods_table_queryset(request.user), 'goods_rows.html', 'goods')
+
+
+@login_required(login_url='login')
+@conditional.api
+def customer_rows(request):
+    return rows_response(
+        request, 'customer_rows', Customer.objects.filter(user=request.user), 'customer_rows.html', 'customers',
+    )
 
 
 
 # Handles the search functionality for goods
+@login_required(login_url='login')
 def search_goods(request):
     # Get the search query from the GET request; default to an empty string if not provided
     query = request.GET.get('q', '')
@@ -295,15 +452,10 @@ def search_goods(request):
     # Initialize an empty list for results
     results = []
 
-    # If a search query is provided, filter the Goods based on the query
+    # If a search query is provided, look it up in the full-text index over the
+    # name, description and category name; best matches (bm25) come first
     if query:
-        results = Goods.objects.filter(
-            # Search in the name, description, or category name fields
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query),
-            user=request.user  # Ensure the goods belong to the logged-in user
-        )
+        results = search.ranked_goods(goods_table_queryset(request.user), request.user, query)
 
     # Render the search results page and pass the results and query to the template
     return render(request, 'search_output.html', {
@@ -329,6 +481,8 @@ def delete_good(request, pk):
 
 # Restrict access to logged-in users; redirect to 'login' if not authenticated
 @login_required(login_url='login')
+# Answer GETs with 304 while the user's data is unchanged
+@conditional.page
 def category_list(request):
     # If the request method is POST, handle the creation of a new category
     if request.method == 'POST':
@@ -374,23 +528,29 @@ def edit_category(request, pk):
 
 
 
+# Restrict access to logged-in users; redirect to 'login' if not authenticated
+@login_required(login_url='login')
 def delete_category(request, pk):
-    # Retrieve the category by primary key (pk)
-    category = get_object_or_404(Category, pk=pk)
+    # Retrieve the category by primary key and ensure it belongs to the current user
+    category = get_object_or_404(Category, pk=pk, user=request.user)
 
-    # Delete the selected category
-    category.delete()
+    # Only allow deletion via POST request to prevent accidental deletes
+    if request.method == 'POST':
+        deletion.delete(category)  # Soft-delete; the category's products are purged in the background
 
-    # Redirect to the category list page after deletion
+    # Redirect to the category list page either way
     return redirect('category_list')
 
 
 
+# Async view: under ASGI, scanners waiting on the database do not hold a worker thread each
 @login_required(login_url='login')
-def barcode_scanner(request):
-    # Filter categories and customers to only include those belonging to the logged-in user
-    categories = Category.objects.filter(user=request.user)
-    customers = Customer.objects.filter(user=request.user)
+async def barcode_scanner(request):
+    # Load the user with the async ORM; templates then read request.user without a query
+    request.user = await request.auser()
+
+    # Categories and customers belonging to the logged-in user (cached between requests)
+    user_choices = await choices.afor_user(request.user)
 
     if request.method == 'POST':
         # Get the POST data from the form submission
@@ -407,24 +567,33 @@ def barcode_scanner(request):
             messages.error(request, "All fields must be filled out.")
             return redirect('barcode_scanner')
 
+        # Ensure the category and customer belong to the logged-in user; ids in the cached
+        # choices need no query, anything else (e.g. created in another process) is checked
         try:
-            # Ensure the category and customer belong to the logged-in user
-            category = Category.objects.get(id=category_id, user=request.user)  
-            customer = Customer.objects.get(id=customer_id, user=request.user)  
-        except Category.DoesNotExist or Customer.DoesNotExist:
+            category_id, customer_id = int(category_id), int(customer_id)
+        except ValueError:
+            category_id = customer_id = None
+        valid = (
+            category_id is not None
+            and (category_id in user_choices.category_ids
+                 or await Category.objects.filter(id=category_id, user=request.user).aexists())
+            and (customer_id in user_choices.customer_ids
+                 or await Customer.objects.filter(id=customer_id, user=request.user).aexists())
+        )
+        if not valid:
             messages.error(request, "Invalid category or customer selection.")
             return redirect('barcode_scanner')
 
         try:
             # Create a new product and associate it with the logged-in user
-            product = Goods.objects.create(
+            await Goods.objects.acreate(
                 barcode=barcode,
                 name=name,
                 quantity=int(quantity),
                 price=float(price),
                 description=description,
-                category=category,
-                customer=customer,
+                category_id=category_id,
+                customer_id=customer_id,
                 user=request.user
             )
             messages.success(request, "Product added successfully!")
@@ -433,28 +602,127 @@ def barcode_scanner(request):
             # Handle invalid quantity or price input
             messages.error(request, "Invalid quantity or price entered.")
             return redirect('barcode_scanner')
+        except IntegrityError:
+            # Each real barcode belongs to a single product per user
+            messages.error(request, "A product with this barcode already exists.")
+            return redirect('barcode_scanner')
 
     # Render the barcode scanner page, passing categories and customers to the template
-    return render(request, 'barcode_scanner.html', {'categories': categories, 'customers': customers})
+    return render(request, 'barcode_scanner.html', {
+        'categories': user_choices.categories,
+        'customers': user_choices.customers,
+    })
 
 
 
-def barcode_retrieve(request):
+# Async view, like barcode_scanner
+@login_required(login_url='login')
+async def barcode_retrieve(request):
+    # Load the user with the async ORM; templates then read request.user without a query
+    request.user = await request.auser()
+
     product = None  # Initialize the product to None
     barcode = None  # Initialize barcode variable
 
     if request.method == 'POST':
         barcode = request.POST.get('barcode')
-        print(f"Received barcode: {barcode}")  # Debugging print statement
 
-        if barcode:
+        image = request.FILES.get('image')
+        if image and not barcode and image.size > decoding.DECODE_MAX_IMAGE_SIZE:
+            messages.error(request, f"Photos may be at most {decoding.DECODE_MAX_IMAGE_SIZE // (1024 * 1024)} MB.")
+        elif image and not barcode:
+            # A photo instead of a typed/scanned code: decode it here and look up what it shows
             try:
-                # Retrieve the product by barcode and ensure it belongs to the logged-in user
-                product = Goods.objects.get(barcode=barcode, user=request.user)
-            except Goods.DoesNotExist:
-                # If product is not found, set product to None and show an error message
-                product = None
+                # Decoding is CPU-bound, so it runs on a thread instead of the event loop
+                found, error = (await sync_to_async(decoding.decode_images, thread_sensitive=False)([image.read()]))[0]
+            except ValueError as exc:
+                found, error = [], str(exc)
+            if found:
+                barcode = found[0]['code']
+                product = await barcodes.alookup_decoded(request.user, found)
+                if product is None:
+                    messages.error(request, "Product not found.")
+            else:
+                messages.error(request, error or "No barcode found in the photo.")
+        elif barcode:
+            # Retrieve the product by barcode for the logged-in user (repeat scans come from cache)
+            product = await barcodes.alookup(request.user, barcode)
+            if product is None:
+                # If product is not found, show an error message
                 messages.error(request, "Product not found.")
 
     # Render the barcode retrieval page, passing the product and barcode to the template
     return render(request, 'barcode_retrieve.html', {'product': product, 'barcode': barcode})
+
+
+
+# Rejected rows listed on the import page; the rest are only counted
+IMPORT_ERRORS_SHOWN = 100
+
+
+# Imports run as background jobs: the upload is saved and queued, and the page polls the job
+@login_required(login_url='login')
+def import_goods(request):
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, "Choose a CSV or XLSX file to import.")
+            return redirect('import_goods')
+
+        # Rows are streamed from the saved file and inserted in batches by a worker
+        job = jobs.enqueue(
+            'import_goods', {'path': tasks.store_upload(upload), 'filename': upload.name},
+            user=request.user, priority=1,
+        )
+        return redirect(f"{reverse('import_goods')}?job={job.pk}")
+
+    # The job named in ?job=, while it runs and once it has finished
+    job = None
+    if request.GET.get('job', '').isdigit():
+        job = get_object_or_404(Job, pk=request.GET['job'], user=request.user, kind='import_goods')
+    result = job.result if job and job.state == Job.DONE else None
+
+    return render(request, 'import_goods.html', {
+        'job': job,
+        'result': result,
+        'errors': result['errors'][:IMPORT_ERRORS_SHOWN] if result else [],
+        'columns': IMPORT_COLUMNS,
+    })
+
+
+# Progress of one of the user's background jobs, polled by the pages that started it
+@login_required(login_url='login')
+@never_cache
+def job_status(request, pk):
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'state': job.state,
+        'progress': job.progress,
+        'total': job.total,
+        'message': job.message,
+        'attempts': job.attempts,
+        'result': job.result,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    })
+
+
+
+# Stream a goods or customers export (CSV or NDJSON, optionally gzipped) without building it in memory
+@login_required(login_url='login')
+def export_data(request, dataset, fmt):
+    if dataset not in exporter.DATASETS or fmt not in exporter.FORMATS:
+        raise Http404("Unknown export")
+
+    # ?gzip=1 compresses the stream on the fly
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    header, rows = exporter.DATASETS[dataset]
+
+    response = StreamingHttpResponse(
+        exporter.stream(header, rows(request.user), fmt=fmt, compress=compress),
+        content_type='application/gzip' if compress else exporter.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exporter.filename(dataset, fmt, compress)}"'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so request timings include every other middleware
+    'supply_chain_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,10 +83,51 @@ WSGI_APPLICATION = 'supplychain.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SUPPLYCHAIN_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Production SQLite profile, selected with SUPPLYCHAIN_DB_PROFILE=production.
+# WAL lets the dashboard read while scanners write, busy_timeout makes writers queue instead of
+# failing with "database is locked", and IMMEDIATE transactions take the write lock up front so
+# two writers can never deadlock upgrading a read lock (which the busy timeout cannot resolve).
+# Connections are kept for CONN_MAX_AGE seconds and health-checked before reuse.
+SQLITE_PRODUCTION_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # durable across application crashes; WAL keeps it consistent
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',  # 256 MB
+    'PRAGMA cache_size=-65536',  # 64 MB
+    'PRAGMA temp_store=MEMORY',
+]
+
+DB_PROFILE = os.environ.get('SUPPLYCHAIN_DB_PROFILE', 'default')
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'OPTIONS': {
+            'init_command': '; '.join(SQLITE_PRODUCTION_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+
+# Request metrics (served on /metrics). Requests slower than METRICS_SLOW_REQUEST_SECONDS are
+# logged with their SQL to the 'supply_chain_app.slow_requests' logger; unset disables the log.
+METRICS_SLOW_REQUEST_SECONDS = (
+    float(os.environ['SUPPLYCHAIN_SLOW_REQUEST_SECONDS']) if os.environ.get('SUPPLYCHAIN_SLOW_REQUEST_SECONDS') else None
+)
+# Addresses allowed to scrape /metrics without logging in as staff
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+
+# Where uploaded files wait for the background workers (run_workers) to process them. Workers on
+# other machines need it on shared storage.
+JOB_FILES_DIR = os.environ.get('SUPPLYCHAIN_JOB_FILES_DIR', BASE_DIR / 'job_files')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators